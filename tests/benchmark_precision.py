@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Compare the CPU precision modes (model.cpu_precision) on a fixed proofreading set
+
+Each mode is loaded in its own process, so the peak memory of one does not
+hide another's. For every mode the report shows load time, peak resident
+memory, generation speed and how close the corrections are to the reference
+corrections and to the float32 output (difflib similarity, 1.0 = identical).
+
+    python tests/benchmark_precision.py -c config.yaml
+    python tests/benchmark_precision.py -c config.yaml -p float32 int8
+"""
+
+import argparse
+import difflib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+
+ROOT = Path(__file__).resolve().parent.parent
+PRECISIONS = ('float32', 'bfloat16', 'int8')
+
+# (text with errors, reference correction)
+PROOFREAD_SET = [
+    ("The results shows that the proposed method outperform the baseline in all dataset.",
+     "The results show that the proposed method outperforms the baseline on all datasets."),
+    ("We was able to reproduce there findings using a smaller amount of samples.",
+     "We were able to reproduce their findings using a smaller number of samples."),
+    ("Each of the participant were asked to complete the survey before the interview.",
+     "Each of the participants was asked to complete the survey before the interview."),
+    ("The data was collected during three month and analysed with a mixed model.",
+     "The data were collected over three months and analysed with a mixed model."),
+    ("This approach have several advantage, however it require more memory.",
+     "This approach has several advantages; however, it requires more memory."),
+    ("In the next section we discusses the limitation of our study.",
+     "In the next section, we discuss the limitations of our study."),
+]
+
+INSTRUCTION = "Correct the grammar of the following sentence. Reply with the corrected sentence only.\n\n"
+
+
+def similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a.strip(), b.strip()).ratio()
+
+
+def run_mode(config_path: str, precision: str, max_new_tokens: int) -> dict:
+    """Load the model with one precision and proofread the set (runs in a child process)"""
+    import torch
+    from writing_assistant.model_loader import QWenModelLoader
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    config['model']['device'] = 'cpu'
+    config['model']['cpu_precision'] = precision
+    config['model'].pop('prefix_cache_dir', None)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+        yaml.safe_dump(config, f)
+    try:
+        model_loader = QWenModelLoader(f.name)
+        started = time.perf_counter()
+        model_loader.load_model(on_progress=lambda stage: None)
+        load_time = time.perf_counter() - started
+    finally:
+        os.unlink(f.name)
+
+    outputs = []
+    new_tokens = 0
+    generation_time = 0.0
+    for text, _ in PROOFREAD_SET:
+        torch.manual_seed(0)
+        messages = [
+            {"role": "system", "content": model_loader.get_system_prompt()},
+            {"role": "user", "content": INSTRUCTION + text},
+        ]
+        outputs.append(model_loader.generate_response(messages, max_length=max_new_tokens, temperature=0.01))
+        new_tokens += model_loader.last_generation_stats['new_tokens']
+        generation_time += model_loader.last_generation_stats['total_time']
+
+    return {
+        'precision': precision,
+        'load_time': load_time,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'tokens_per_second': new_tokens / generation_time if generation_time > 0 else 0.0,
+        'outputs': outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', default=str(ROOT / 'config.yaml'), help='Configuration file')
+    parser.add_argument('-p', '--precisions', nargs='+', choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument('--max-new-tokens', type=int, default=64)
+    parser.add_argument('--worker', choices=PRECISIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_mode(args.config, args.worker, args.max_new_tokens)))
+        return
+
+    results = []
+    for precision in args.precisions:
+        print(f"Running {precision}...", file=sys.stderr)
+        proc = subprocess.run(
+            [sys.executable, __file__, '-c', args.config, '--worker', precision,
+             '--max-new-tokens', str(args.max_new_tokens)],
+            cwd=ROOT, capture_output=True, text=True,
+            env=dict(os.environ, PYTHONPATH=str(ROOT))
+        )
+        if proc.returncode != 0:
+            print(f"✗ {precision} failed:\n{proc.stderr}", file=sys.stderr)
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    baseline = next((r for r in results if r['precision'] == 'float32'), None)
+
+    print("| precision | load (s) | peak RSS (MB) | tokens/s | vs reference | vs float32 |")
+    print("|-----------|----------|---------------|----------|--------------|------------|")
+    for r in results:
+        vs_reference = sum(similarity(out, ref) for out, (_, ref) in zip(r['outputs'], PROOFREAD_SET)) / len(PROOFREAD_SET)
+        if baseline is not None:
+            vs_float32 = f"{sum(map(similarity, r['outputs'], baseline['outputs'])) / len(PROOFREAD_SET):.3f}"
+        else:
+            vs_float32 = "-"
+        print(f"| {r['precision']} | {r['load_time']:.1f} | {r['peak_rss_mb']:.0f} | "
+              f"{r['tokens_per_second']:.1f} | {vs_reference:.3f} | {vs_float32} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Compare tokens/s with and without prompt-lookup decoding on proofreading prompts
+
+Each paragraph is proofread twice with the nuno-writing-style proofread
+prompt, once with plain decoding and once with prompt lookup (the
+model.prompt_lookup settings), with the same seed.
+
+    python tests/benchmark_prompt_lookup.py -c config.yaml
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import torch
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmark_precision import PROOFREAD_SET  # noqa: E402
+from writing_assistant.model_loader import QWenModelLoader  # noqa: E402
+
+# Paragraphs of a few sentences, as pasted in !proofread mode
+PARAGRAPHS = [
+    ' '.join(text for text, _ in PROOFREAD_SET[i:i + 3])
+    for i in range(0, len(PROOFREAD_SET), 3)
+] + [' '.join(text for text, _ in PROOFREAD_SET)]
+
+
+def run(model_loader: QWenModelLoader, system_prompt: str, prompt_lookup: bool, max_new_tokens: int) -> dict:
+    new_tokens = 0
+    elapsed = 0.0
+    accepted = drafted = 0
+    for paragraph in PARAGRAPHS:
+        torch.manual_seed(0)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": paragraph},
+        ]
+        model_loader.generate_response(messages, max_length=max_new_tokens, prompt_lookup=prompt_lookup)
+        stats = model_loader.last_generation_stats
+        new_tokens += stats['new_tokens']
+        elapsed += stats['total_time']
+        accepted += stats.get('accepted_tokens', 0)
+        drafted += stats.get('draft_tokens', 0)
+    return {
+        'tokens_per_second': new_tokens / elapsed if elapsed > 0 else 0.0,
+        'acceptance_rate': accepted / drafted if drafted else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', default=str(ROOT / 'config.yaml'), help='Configuration file')
+    parser.add_argument('--max-new-tokens', type=int, default=256)
+    args = parser.parse_args()
+
+    with open(ROOT / 'prompts' / 'nuno-writing-style.yaml', 'r') as f:
+        proofread_prompt = yaml.safe_load(f)['proofread']
+
+    model_loader = QWenModelLoader(args.config)
+    model_loader.load_model()
+    # Plain decoding means no draft model either
+    model_loader.draft_model = None
+    system_prompt = model_loader.get_system_prompt(proofread_prompt)
+
+    # Warm up so the first measured run does not pay for one-time setup
+    run(model_loader, system_prompt, False, 8)
+
+    before = run(model_loader, system_prompt, False, args.max_new_tokens)
+    after = run(model_loader, system_prompt, True, args.max_new_tokens)
+
+    print("| decoding | tokens/s | acceptance |")
+    print("|----------|----------|------------|")
+    print(f"| plain | {before['tokens_per_second']:.1f} | - |")
+    print(f"| prompt lookup | {after['tokens_per_second']:.1f} | {after['acceptance_rate'] or 0:.0%} |")
+    if before['tokens_per_second'] > 0:
+        print(f"\nSpeedup: {after['tokens_per_second'] / before['tokens_per_second']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
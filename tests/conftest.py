@@ -0,0 +1,91 @@
+"""Shared test helpers
+
+The tests also run as scripts (from the repository root, e.g.
+python -m tests.test_server), so the helpers here are plain functions
+imported by the test modules rather than pytest fixtures.
+"""
+
+import os
+import string
+from pathlib import Path
+from typing import Any, Dict
+
+import torch
+import yaml
+from transformers import BatchEncoding, Qwen2Config, Qwen2ForCausalLM
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def write_config(tmp_dir: str, **sections: Dict[str, Any]) -> str:
+    """Write a copy of config.yaml that logs to a temporary directory and return its path
+
+    Each keyword names a config section whose settings are updated, e.g.
+    write_config(tmp_dir, model={'max_length': 8}).
+    """
+    with open(ROOT / 'config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    config['session']['log_directory'] = os.path.join(tmp_dir, 'users')
+    for section, settings in sections.items():
+        config.setdefault(section, {}).update(settings)
+    config_path = os.path.join(tmp_dir, 'config.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+# One character per token id of tiny_model()'s 64-token vocabulary
+LETTERS = string.ascii_lowercase + string.ascii_uppercase + string.digits + ' \n'
+
+
+class LetterTokenizer:
+    """One character per token id, so decoded replies tokenize back to the same ids
+
+    Enough of a tokenizer for generation, streaming, stop strings and
+    conversation cache reuse. Characters outside LETTERS become spaces.
+    """
+
+    eos_token_id = None
+    pad_token_id = LETTERS.index('\n')
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        text = ''.join(f"{m['role']}\n{m['content']}\n" for m in messages)
+        return text + 'assistant\n' if add_generation_prompt else text
+
+    def __call__(self, text, add_special_tokens=True, return_tensors=None):
+        if isinstance(text, list):
+            ids = [self(t)['input_ids'] for t in text]
+            return BatchEncoding({'input_ids': ids, 'attention_mask': [[1] * len(i) for i in ids]},
+                                 tensor_type=return_tensors)
+        return {'input_ids': [LETTERS.find(c) if c in LETTERS else LETTERS.index(' ') for c in text] or [0]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return ''.join(LETTERS[int(i)] for i in ids)
+
+
+def tiny_model(seed: int = 0, layers: int = 2):
+    """A randomly initialized Qwen2 model small enough to generate with in a test, never emitting EOS"""
+    torch.manual_seed(seed)
+    model = Qwen2ForCausalLM(Qwen2Config(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=layers,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256
+    )).eval()
+    model.generation_config.eos_token_id = None
+    return model
+
+
+def tiny_loader(seed: int = 0, **model_settings):
+    """A QWenModelLoader from config.yaml around tiny_model(seed) with near-greedy sampling
+
+    model_settings update the loader's model config.
+    """
+    from writing_assistant.model_loader import QWenModelLoader
+
+    loader = QWenModelLoader(str(ROOT / 'config.yaml'))
+    loader.model_config.update({'temperature': 1e-5, 'top_p': 1.0, 'max_length': 64, 'stop_strings': []})
+    loader.model_config.update(model_settings)
+    loader.model = tiny_model(seed)
+    loader.tokenizer = LetterTokenizer()
+    loader.device = 'cpu'
+    return loader
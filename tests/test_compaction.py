@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Test rolling summarization of long session histories"""
+
+import json
+import tempfile
+
+from tests.conftest import write_config
+from writing_assistant.compaction import SESSION_MEMORY_PREFIX, SessionCompactor
+from writing_assistant.session_manager import MESSAGE_OVERHEAD_TOKENS, SessionManager
+
+
+COMPACTION = {'enabled': True, 'trigger_tokens': 100, 'keep_recent': 3, 'max_summary_tokens': 64}
+
+
+class StubSummarizer:
+    """Stands in for QWenModelLoader: the summary names the messages it was given"""
+
+    def __init__(self):
+        self.transcripts = []
+        self.last_generation_stats = {'new_tokens': 3}
+
+    def generate_response(self, messages, max_length=None):
+        self.transcripts.append(messages[-1]['content'])
+        return f"summary of {messages[-1]['content'].count(':')} messages"
+
+
+def _log_entries(manager: SessionManager):
+    manager.log_writer.flush()
+    with open(manager.log_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_compact_history_replaces_exact_range():
+    """Exactly the summarized messages are replaced, and only while they still open the history"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir, session={'compaction': COMPACTION}))
+        manager.start_session('tester')
+        manager.set_token_budget(lambda text: len(text.split()), "system prompt")
+        for i in range(6):
+            manager.add_message('user' if i % 2 == 0 else 'assistant', f"message {i}")
+        history = manager.get_conversation_history()
+
+        # Copies are not the messages in the history; a range that is not a prefix is refused
+        assert not manager.compact_history([dict(m) for m in history[:2]], "summary")
+        assert not manager.compact_history(history[1:3], "summary")
+        assert not manager.compact_history([], "summary")
+        assert manager.get_conversation_history() == history
+
+        assert manager.compact_history(history[:4], "summary", {'new_tokens': 1})
+        assert manager.get_conversation_history() == [{'role': 'system', 'content': "summary"}] + history[4:]
+        assert manager.get_history_tokens() == manager.system_prompt_tokens + \
+            sum(len(m['content'].split()) + MESSAGE_OVERHEAD_TOKENS for m in manager.get_conversation_history())
+
+        # The history changed while a summary was being written: it is not applied
+        stale = manager.get_conversation_history()[:2]
+        manager.clear_history()
+        manager.add_message('user', "fresh start")
+        assert not manager.compact_history(stale, "late summary")
+        assert [m['content'] for m in manager.get_conversation_history()] == ["fresh start"]
+
+        compactions = [e for e in _log_entries(manager) if e['type'] == 'compaction']
+        assert len(compactions) == 1 and compactions[0]['summarized_messages'] == 4
+        assert compactions[0]['generation'] == {'new_tokens': 1}
+        # The replaced messages stay in the log
+        assert len([e for e in _log_entries(manager) if e['type'] == 'message']) == 7
+        manager.end_session()
+        manager.wait_for_finalize()
+        print("✓ compact_history replaces exactly the summarized range")
+
+
+def test_compactor_keeps_recent_turns():
+    """The compactor summarizes all but the recent whole turns, folding in the previous summary"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir, session={'compaction': COMPACTION}))
+        manager.start_session('tester')
+        manager.set_token_budget(lambda text: len(text.split()), "system prompt")
+        summarizer = StubSummarizer()
+        compactor = SessionCompactor(summarizer, manager)
+
+        for i in range(8):
+            manager.add_message('user' if i % 2 == 0 else 'assistant', ' '.join([f"m{i}"] * 10))
+        assert compactor.needs_compaction()
+        assert compactor.maybe_start()
+        compactor.wait()
+        assert compactor.error is None
+
+        # keep_recent 3 would start the kept part with a reply, so a whole turn more is summarized
+        history = manager.get_conversation_history()
+        assert history[0] == {'role': 'system', 'content': SESSION_MEMORY_PREFIX + "summary of 6 messages"}
+        assert [m['content'].split()[0] for m in history[1:]] == ['m6', 'm7']
+        assert not compactor.needs_compaction()
+
+        for i in range(8, 14):
+            manager.add_message('user' if i % 2 == 0 else 'assistant', ' '.join([f"m{i}"] * 10))
+        assert compactor.maybe_start()
+        compactor.wait()
+        history = manager.get_conversation_history()
+        assert summarizer.transcripts[-1].startswith("SYSTEM:\n" + SESSION_MEMORY_PREFIX)
+        assert [m['content'].split()[0] for m in history[1:]] == ['m12', 'm13']
+        manager.end_session()
+        manager.wait_for_finalize()
+        print("✓ Compactor keeps the recent turns and folds earlier summaries in")
+
+
+if __name__ == '__main__':
+    test_compact_history_replaces_exact_range()
+    test_compactor_keeps_recent_turns()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Test that the model daemon socket is private to the user running it, and the daemon's per-session cache"""
+
+import os
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import yaml
+
+from tests.conftest import write_config
+from writing_assistant import daemon
+from writing_assistant.daemon import ModelDaemon, connect_daemon, default_socket_path, stop_daemon
+from writing_assistant.kv_cache import ConversationCache
+
+
+class CachingLoader:
+    """Stands in for QWenModelLoader: priming and cached generations extend the connection's cache"""
+
+    def __init__(self, model_name: str):
+        self.model_config = {'name': model_name}
+        self.device = 'cpu'
+        self.last_generation_stats = {}
+        self.caches = []
+
+    def prime_cache(self, cache, system_prompt, mode=None, submode=None):
+        cache.token_ids = [1, 2, 3]
+        return False
+
+    def generate_response_stream(self, messages, max_length=None, temperature=None, top_p=None, cache=None,
+                                 prompt_lookup=False, stop_strings=None, cancel_event=None):
+        self.caches.append(cache)
+        if cache is not None:
+            cache.token_ids = cache.token_ids + [4]
+        yield "reply"
+
+
+def _start_daemon(model_loader, socket_path: str) -> threading.Thread:
+    server = ModelDaemon(model_loader, socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    return thread
+
+
+def test_default_socket_path_is_private():
+    """The default socket lives in $XDG_RUNTIME_DIR or a 0700 per-user directory"""
+    runtime_dir = os.environ.pop('XDG_RUNTIME_DIR', None)
+    saved_tempdir = tempfile.tempdir
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tempfile.tempdir = tmp_dir
+            path = Path(default_socket_path())
+            assert path.parent == Path(tmp_dir) / f"writing-assistant-{os.getuid()}"
+            assert stat.S_IMODE(path.parent.stat().st_mode) == 0o700
+
+            # A directory that others can write to (e.g. planted before us) is refused
+            os.chmod(path.parent, 0o777)
+            try:
+                default_socket_path()
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("accepted a world-writable socket directory")
+
+            os.environ['XDG_RUNTIME_DIR'] = tmp_dir
+            assert default_socket_path() == os.path.join(tmp_dir, 'writing-assistant.sock')
+    finally:
+        tempfile.tempdir = saved_tempdir
+        os.environ.pop('XDG_RUNTIME_DIR', None)
+        if runtime_dir is not None:
+            os.environ['XDG_RUNTIME_DIR'] = runtime_dir
+    print("✓ Default socket path is private")
+
+
+def test_daemon_socket_owner_checked():
+    """The socket is created 0600 and clients attach only to a daemon of their own user"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, 'daemon.sock')
+        config_path = write_config(tmp_dir, daemon={'enabled': True, 'socket_path': socket_path})
+        with open(config_path, 'r') as f:
+            model_name = yaml.safe_load(f)['model']['name']
+
+        model_loader = SimpleNamespace(model_config={'name': model_name}, device='cpu')
+        thread = _start_daemon(model_loader, socket_path)
+
+        try:
+            assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+            client = connect_daemon(config_path)
+            assert client is not None and client.daemon_pid == os.getpid()
+            client.unload_model()
+
+            # Seen from another user, the same daemon is not trusted
+            real_getuid = daemon.os.getuid
+            daemon.os.getuid = lambda: real_getuid() + 1
+            try:
+                assert connect_daemon(config_path) is None
+            finally:
+                daemon.os.getuid = real_getuid
+        finally:
+            assert stop_daemon(config_path)
+            thread.join(timeout=10)
+    print("✓ Socket is 0600 and its owner is checked")
+
+
+def test_uncached_generation_keeps_session_cache():
+    """A generation without a cache (a summary, the edits fallback) runs without touching the session's cache"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, 'daemon.sock')
+        config_path = write_config(tmp_dir, daemon={'enabled': True, 'socket_path': socket_path})
+        with open(config_path, 'r') as f:
+            model_loader = CachingLoader(yaml.safe_load(f)['model']['name'])
+        thread = _start_daemon(model_loader, socket_path)
+
+        try:
+            client = connect_daemon(config_path)
+            client.prime_cache(ConversationCache(), "system prompt")
+            assert client.generate_response([{'role': 'user', 'content': "turn"}], cache=ConversationCache()) == "reply"
+            assert client.generate_response([{'role': 'user', 'content': "summarize"}]) == "reply"
+            assert client.generate_response([{'role': 'user', 'content': "next turn"}], cache=ConversationCache())
+
+            session_cache, scratch, next_turn = model_loader.caches
+            assert scratch is None and next_turn is session_cache
+            # Primed, then extended by the two cached turns only
+            assert session_cache.token_ids == [1, 2, 3, 4, 4]
+            client.unload_model()
+        finally:
+            assert stop_daemon(config_path)
+            thread.join(timeout=10)
+    print("✓ Uncached generations keep the session's daemon cache")
+
+
+if __name__ == '__main__':
+    test_default_socket_path_is_private()
+    test_daemon_socket_owner_checked()
+    test_uncached_generation_keeps_session_cache()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Test parsing and applying proofreading edit scripts"""
+
+from writing_assistant.edit_script import EditScriptError, apply_edits, parse_edits, word_diff
+
+
+TEXT = "The data was analyzed using machine learning algorithm. The data was then plotted."
+
+SCRIPT = """Here are the edits:
+1. "data was analyzed" -> "data were analysed" (agreement)
+2. "algorithm." -> "algorithms." (plural)
+3. "The data was then" -> "The data were then" (agreement)
+"""
+
+
+def test_edits_apply_in_order():
+    """Edits are found in reading order and applied to the text"""
+    edits = parse_edits(SCRIPT)
+    assert [edit.reason for edit in edits] == ['agreement', 'plural', 'agreement']
+    revised = apply_edits(TEXT, edits)
+    assert revised == "The data were analysed using machine learning algorithms. The data were then plotted."
+    print("✓ Edit script applied")
+
+
+def test_no_changes():
+    """NO CHANGES is an empty edit script"""
+    assert parse_edits("NO CHANGES") == []
+    assert apply_edits(TEXT, []) == TEXT
+    print("✓ NO CHANGES parsed")
+
+
+def test_invalid_scripts_are_rejected():
+    """Unparsable, missing, ambiguous and overlapping edits raise EditScriptError"""
+    bad_scripts = [
+        "Here is the revised text: The data were analysed.",
+        '1. "data was" -> "data were"\nThis line is not an edit\n2. "algorithm" -> "algorithms"\nDone.',
+        '1. "neural network" -> "neural networks"',
+        '1. "data was analyzed" -> "x"\n2. "was analyzed using" -> "y"',
+    ]
+    for script in bad_scripts:
+        try:
+            apply_edits(TEXT, parse_edits(script))
+        except EditScriptError:
+            continue
+        raise AssertionError(f"Accepted invalid script: {script!r}")
+
+    # "The data was" occurs twice; searched from the start it is ambiguous only out of order
+    try:
+        apply_edits(TEXT, parse_edits('1. "then" -> "later"\n2. "data was" -> "data were"'))
+    except EditScriptError:
+        pass
+    else:
+        raise AssertionError("Accepted an ambiguous edit")
+    print("✓ Invalid scripts rejected")
+
+
+def test_word_diff_reproduces_both_texts():
+    """The diff segments rebuild the original and the revised text"""
+    revised = apply_edits(TEXT, parse_edits(SCRIPT))
+    segments = word_diff(TEXT, revised)
+    assert ''.join(text for tag, text in segments if tag != 'insert') == TEXT
+    assert ''.join(text for tag, text in segments if tag != 'delete') == revised
+    print("✓ Word diff consistent")
+
+
+if __name__ == '__main__':
+    test_edits_apply_in_order()
+    test_no_changes()
+    test_invalid_scripts_are_rejected()
+    test_word_diff_reproduces_both_texts()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Test the asyncio engine on a tiny randomly initialized model"""
+
+import asyncio
+import tempfile
+import time
+from contextlib import aclosing
+
+import torch
+import yaml
+from transformers import Qwen2Config, Qwen2ForCausalLM
+
+from tests.conftest import ROOT, write_config
+from writing_assistant.engine import AsyncEngine
+from writing_assistant.scheduler import ContinuousBatchScheduler, GenerationRequest
+from writing_assistant.session_manager import SessionManager
+
+
+REPLY_TOKENS = 48
+GREEDY = {'max_length': REPLY_TOKENS, 'temperature': 0, 'top_p': 1.0}
+
+
+class StubTokenizer:
+    eos_token_id = None
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return '\n'.join(m['content'] for m in messages)
+
+    def __call__(self, text):
+        return {'input_ids': [ord(c) % 64 for c in text[-64:]] or [1]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return ''.join(chr(ord('a') + i % 26) for i in ids)
+
+
+class TinyModelLoader:
+    """Enough of QWenModelLoader for AsyncEngine, with a two-layer model that never emits EOS"""
+
+    def __init__(self, config_path: str):
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+        self.model_config = self.config['model']
+        self.tokenizer = StubTokenizer()
+        torch.manual_seed(0)
+        self.model = Qwen2ForCausalLM(Qwen2Config(
+            vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256
+        )).eval()
+        self.model.generation_config.eos_token_id = None
+        # Slow every forward pass down a little so concurrent turns overlap in the batch
+        self.model.register_forward_pre_hook(lambda module, args: time.sleep(0.002))
+
+    def get_system_prompt(self, custom_instructions=None):
+        return custom_instructions or "You are a writing assistant."
+
+
+def _session(config_path: str, username: str) -> SessionManager:
+    session = SessionManager(config_path)
+    session.start_session(username, mode='academic')
+    return session
+
+
+def test_concurrent_chats_are_batched():
+    """Turns of different sessions share the batch, and each reply lands in its own session"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir, model=GREEDY)
+        sessions = [_session(config_path, f"user{n}") for n in range(4)]
+
+        async def run():
+            async with AsyncEngine(TinyModelLoader(config_path), prompts_dir=str(ROOT / 'prompts')) as engine:
+                replies = await asyncio.gather(*[
+                    engine.chat(session, f"Proofread sentence {n}.") for n, session in enumerate(sessions)
+                ])
+                return replies, dict(engine.scheduler.stats)
+
+        replies, stats = asyncio.run(run())
+        assert stats['requests'] == 4 and stats['peak_batch'] > 1, stats
+        for n, (session, reply) in enumerate(zip(sessions, replies)):
+            history = session.get_conversation_history()
+            assert [m['role'] for m in history] == ['user', 'assistant'], history
+            assert history[0]['content'] == f"Proofread sentence {n}."
+            assert history[1]['content'] == reply and len(reply) == REPLY_TOKENS, reply
+        for session in sessions:
+            session.end_session()
+            session.wait_for_finalize()
+        print(f"✓ 4 concurrent chats, peak batch {stats['peak_batch']}")
+
+
+def test_per_user_limit():
+    """A user never has more turns in the scheduler than max_pending_per_user; others still run"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir, model=GREEDY)
+        busy = [_session(config_path, 'busy') for _ in range(3)]
+        other = _session(config_path, 'other')
+        in_flight = {'busy': 0, 'other': 0}
+
+        async def run():
+            loader = TinyModelLoader(config_path)
+            async with AsyncEngine(loader, prompts_dir=str(ROOT / 'prompts'), max_pending_per_user=1) as engine:
+                scheduler = engine.scheduler
+
+                def count(module, args):
+                    # Runs on the scheduler thread before every forward pass
+                    for username in in_flight:
+                        in_flight[username] = max(in_flight[username], sum(
+                            1 for r in scheduler._active + list(scheduler._waiting) if r.username == username))
+                loader.model.register_forward_pre_hook(count)
+
+                await asyncio.gather(*[engine.chat(session, "Hello there.") for session in busy + [other]])
+                return dict(scheduler.stats)
+
+        stats = asyncio.run(run())
+        assert in_flight == {'busy': 1, 'other': 1}, in_flight
+        assert stats['requests'] == 4 and stats['peak_batch'] == 2, stats
+        for session in busy + [other]:
+            assert len(session.get_conversation_history()) == 2
+            session.end_session()
+            session.wait_for_finalize()
+        print("✓ Per-user limit holds while other users run")
+
+
+def test_users_take_turns():
+    """Waiting requests are admitted round robin across users, oldest first per user"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scheduler = ContinuousBatchScheduler(TinyModelLoader(write_config(tmp_dir, model=GREEDY)))
+        order = [('a', 1), ('a', 2), ('a', 3), ('b', 1), (None, 1), ('c', 1), ('b', 2), (None, 2)]
+        for username, n in order:
+            request = GenerationRequest([1], 1, 0, 1.0, username=username)
+            request.label = f"{username}{n}"
+            scheduler._waiting.append(request)
+
+        admitted = [scheduler._next_waiting().label for _ in order]
+        assert admitted == ['a1', 'b1', 'None1', 'c1', 'a2', 'b2', 'None2', 'a3'], admitted
+        print(f"✓ Admission order {admitted}")
+
+
+def test_early_close_keeps_partial_reply():
+    """Leaving a stream inside aclosing() cancels the request and keeps the reply so far"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir, model=GREEDY)
+        session = _session(config_path, 'tester')
+
+        async def run():
+            async with AsyncEngine(TinyModelLoader(config_path), prompts_dir=str(ROOT / 'prompts')) as engine:
+                pieces = []
+                async with aclosing(engine.stream(session, "Write a long story.")) as texts:
+                    async for text in texts:
+                        pieces.append(text)
+                        if len(pieces) == 3:
+                            break
+                # The cancelled request leaves the batch
+                for _ in range(200):
+                    if engine.scheduler.pending() == 0:
+                        break
+                    await asyncio.sleep(0.01)
+                return ''.join(pieces), engine.scheduler.pending(), engine.scheduler.stats['new_tokens']
+
+        partial, pending, new_tokens = asyncio.run(run())
+        assert pending == 0 and new_tokens < REPLY_TOKENS, (pending, new_tokens)
+        history = session.get_conversation_history()
+        assert [m['role'] for m in history] == ['user', 'assistant'], history
+        assert history[1]['content'] == partial.strip() and len(partial) == 3, (history, partial)
+        session.end_session()
+        session.wait_for_finalize()
+        print(f"✓ Stream closed after {len(partial)} pieces, partial reply kept")
+
+
+if __name__ == '__main__':
+    test_concurrent_chats_are_batched()
+    test_per_user_limit()
+    test_users_take_turns()
+    test_early_close_keeps_partial_reply()
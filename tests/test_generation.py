@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Test QWenModelLoader generation on a tiny randomly initialized model"""
+
+import threading
+import time
+
+import torch
+from transformers import DynamicCache
+
+from tests.conftest import tiny_loader, tiny_model
+from writing_assistant.kv_cache import ConversationCache, cache_to_tensors
+from writing_assistant.speculation import DraftFallback
+
+
+MESSAGES = [{'role': 'system', 'content': "system prompt"}, {'role': 'user', 'content': "proofread this text"}]
+
+
+def _stop_after(loader, steps: int, action) -> None:
+    """Run action once the model has done steps forward passes (the prefill counts as one)"""
+    calls = []
+
+    def hook(module, args):
+        calls.append(1)
+        if len(calls) == steps:
+            action()
+
+    loader.model.register_forward_pre_hook(hook)
+
+
+def _assert_cache_matches_prefill(loader, cache: ConversationCache) -> None:
+    """The cached states are those of a fresh prefill over the cached tokens"""
+    assert cache.past_key_values.get_seq_length() == len(cache.token_ids)
+    with torch.no_grad():
+        fresh = loader.model(input_ids=torch.tensor([cache.token_ids]), past_key_values=DynamicCache(),
+                             use_cache=True).past_key_values
+    for (k, v), (fk, fv) in zip(cache_to_tensors(cache.past_key_values), cache_to_tensors(fresh)):
+        assert torch.allclose(k, fk, atol=1e-5) and torch.allclose(v, fv, atol=1e-5)
+
+
+def test_stream_matches_generate():
+    """Streamed chunks join to the text generate_response returns, and leave the same cache"""
+    # This model's replies contain spaces, where the streamer emits a chunk
+    loader = tiny_loader(seed=1, max_length=40)
+    history = MESSAGES + [{'role': 'assistant', 'content': "An earlier reply"}, {'role': 'user', 'content': "again"}]
+    for messages in (MESSAGES, history):
+        cache, stream_cache = ConversationCache(), ConversationCache()
+        reply = loader.generate_response(messages, cache=cache)
+        stats = loader.last_generation_stats
+        chunks = list(loader.generate_response_stream(messages, cache=stream_cache))
+        assert ''.join(chunks).strip() == reply and reply, (chunks, reply)
+        assert loader.last_generation_stats['new_tokens'] == stats['new_tokens'] == 40
+        assert stream_cache.token_ids == cache.token_ids
+    assert len(chunks) > 1
+    print(f"✓ Streamed chunks join to the generated reply ({len(chunks)} chunks)")
+
+
+def test_batch_matches_single_generation():
+    """Left-padded batches give each prompt the reply it gets on its own, in input order"""
+    loader = tiny_loader(seed=1, max_length=24)
+    texts = ["a much longer paragraph that needs far more padding than the rest", "short", "mid sized text",
+             "x", "another paragraph of some length"]
+    conversations = [[MESSAGES[0], {'role': 'user', 'content': text}] for text in texts]
+
+    singles = [loader.generate_response(conversation) for conversation in conversations]
+    batched = loader.generate_batch(conversations, batch_size=3)
+    assert batched == singles, (batched, singles)
+    stats = loader.last_generation_stats
+    assert stats['batches'] == 2 and stats['padding_tokens'] > 0 and stats['new_tokens'] == 24 * len(texts)
+    print(f"✓ Batched replies equal single replies ({stats['padding_tokens']} padding tokens)")
+
+
+def test_rejected_draft_model_is_dropped():
+    """A draft model whose tokens are rarely accepted is dropped after draft_patience low replies in a row"""
+    # A reply above the threshold starts the count again; replies without drafts do not count
+    fallback = DraftFallback(0.3, patience=2)
+    assert [fallback.record(rate) for rate in (0.1, 0.5, 0.1, None, 0.2)] == [False, False, False, False, True]
+
+    # A different random model drafts tokens the main model would not pick
+    loader = tiny_loader(max_length=24)
+    loader.draft_fallback = DraftFallback(0.9, patience=2)
+    loader.draft_model = tiny_model(seed=5, layers=1)
+    loader.generate_response(MESSAGES)
+    stats = loader.last_generation_stats
+    assert stats['decoding'] == 'draft_model' and stats['acceptance_rate'] < 0.9, stats
+    assert loader.draft_model is not None and 'draft_dropped' not in stats
+
+    loader.generate_response(MESSAGES)
+    assert loader.last_generation_stats['draft_dropped'] and loader.draft_model is None
+    # Later replies decode without the draft
+    loader.generate_response(MESSAGES)
+    assert 'decoding' not in loader.last_generation_stats
+    print(f"✓ Rejected draft model dropped ({stats['acceptance_rate']:.0%} accepted)")
+
+
+def test_cancel_mid_generation():
+    """Setting the cancel event stops after the current step; the partial reply and the cache agree"""
+    loader = tiny_loader(max_length=200)
+    cancel = threading.Event()
+    _stop_after(loader, 10, cancel.set)
+    cache = ConversationCache()
+
+    chunks = list(loader.generate_response_stream(MESSAGES, cache=cache, cancel_event=cancel))
+    partial = ''.join(chunks)
+    stats = loader.last_generation_stats
+    assert stats['stop_reason'] == 'cancelled', stats
+    # The prefill and 9 decoding steps ran, then the step that saw the event was the last
+    assert stats['new_tokens'] == 10 and len(partial) == 10, (stats, partial)
+
+    # The cache covers the prompt and the partial reply, except its last token
+    prompt = loader.tokenizer(loader.tokenizer.apply_chat_template(MESSAGES))['input_ids']
+    reply = loader.tokenizer(partial)['input_ids']
+    assert cache.token_ids == prompt + reply[:-1]
+    _assert_cache_matches_prefill(loader, cache)
+
+    # The next turn, with the partial reply in the history, reuses the cache
+    cancel.clear()
+    history = MESSAGES + [{'role': 'assistant', 'content': partial}, {'role': 'user', 'content': "go on"}]
+    loader.generate_response(history, max_length=5, cache=cache)
+    assert cache.reused_tokens == len(prompt) + len(reply) - 1
+    _assert_cache_matches_prefill(loader, cache)
+    print(f"✓ Cancelled after {stats['new_tokens']} tokens with a consistent cache")
+
+
+def test_turn_timeout():
+    """model.turn_timeout ends a slow reply early with the partial text"""
+    loader = tiny_loader(max_length=200, turn_timeout=0.2)
+    loader.model.register_forward_pre_hook(lambda module, args: time.sleep(0.02))
+    cache = ConversationCache()
+
+    started = time.perf_counter()
+    reply = loader.generate_response(MESSAGES, cache=cache)
+    elapsed = time.perf_counter() - started
+    stats = loader.last_generation_stats
+    assert stats['stop_reason'] == 'timeout', stats
+    # One character per token; generate_response strips surrounding whitespace
+    assert 0 < stats['new_tokens'] < 200 and 0 < len(reply) <= stats['new_tokens'], (stats, reply)
+    assert elapsed < 2.0, elapsed
+    _assert_cache_matches_prefill(loader, cache)
+    print(f"✓ Timed out after {stats['new_tokens']} tokens in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    test_stream_matches_generate()
+    test_batch_matches_single_generation()
+    test_rejected_draft_model_is_dropped()
+    test_cancel_mid_generation()
+    test_turn_timeout()
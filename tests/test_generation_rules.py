@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Test per-mode generation budgets from the prompt YAMLs and the stopping criteria"""
+
+import tempfile
+from pathlib import Path
+
+import torch
+import yaml
+
+from tests.conftest import ROOT, LetterTokenizer, tiny_loader
+from writing_assistant.generation_rules import GenerationRules, count_sections
+from writing_assistant.proofreader import DocumentProofreader
+from writing_assistant.stopping import StopAtBudget, StopOnRepetition, StopOnStrings
+
+
+PROMPTS = ROOT / 'prompts'
+
+
+def _mode(name: str) -> dict:
+    with open(PROMPTS / f'{name}.yaml', 'r') as f:
+        return yaml.safe_load(f)
+
+
+def test_count_sections():
+    """Section counts come from "N sections", a list of sections, or the default"""
+    assert count_sections("Please outline a paper with 5 sections on proteomics") == 5
+    assert count_sections("Sections:\n- Introduction\n- Methods\n- Results\n- Discussion") == 4
+    assert count_sections("Help me outline a paper on proteomics", default=6) == 6
+    print("✓ Sections counted")
+
+
+def test_proofread_budget_follows_input_length():
+    """Proofread budgets grow with the input and stay under the caps"""
+    nuno = _mode('nuno-writing-style')
+    rules = GenerationRules(nuno, 'proofread', max_length=4096)
+    short = rules.max_new_tokens("text", lambda: 100)
+    long = rules.max_new_tokens("text", lambda: 1000)
+    assert short < long <= 4096
+    assert GenerationRules(nuno, 'proofread', max_length=512).max_new_tokens("text", lambda: 1000) == 512
+
+    # Edit scripts need far fewer tokens than a full rewrite
+    assert GenerationRules(nuno, 'edits', max_length=4096).max_new_tokens("text", lambda: 1000) < long
+    print(f"✓ Proofread budget: {short} tokens for 100 input tokens, {long} for 1000")
+
+
+def test_outline_budget_follows_sections():
+    """Outline budgets grow with the number of requested sections, without counting tokens"""
+    rules = GenerationRules(_mode('nuno-writing-style'), 'outline', max_length=4096)
+
+    def no_count():
+        raise AssertionError("input tokens counted for an outline")
+
+    assert rules.max_new_tokens("an outline with 3 sections", no_count) < rules.max_new_tokens(
+        "an outline with 8 sections", no_count)
+    print("✓ Outline budget follows sections")
+
+
+def test_defaults_without_rules():
+    """Without a mode or generation rules, the budget is model.max_length"""
+    assert GenerationRules(None, None, max_length=4096).max_new_tokens("text", lambda: 10) == 4096
+    assert GenerationRules({'custom_instructions': 'x'}, None, max_length=4096).stop_strings == []
+    assert GenerationRules(_mode('nuno-writing-style'), 'edits', max_length=4096).stop_strings
+    print("✓ Defaults without rules")
+
+
+def test_stop_criteria_per_row():
+    """Repetition and stop strings stop only the rows that contain them"""
+    prompt = [1, 2, 3]
+    rows = torch.tensor([
+        prompt + [4, 5] * 30,                    # "efef..." repeated: a runaway reply
+        prompt + list(range(4, 26)) * 2 + [0] * 16,  # varied text that contains "xyz"
+    ])
+    repetition = StopOnRepetition(len(prompt), max_ngram=8, min_repeats=3, min_tokens=48)
+    assert repetition(rows, None).tolist() == [True, False]
+    assert repetition.triggered and repetition.stopped_at == [rows.shape[1], None]
+
+    # A short repeat or a run under min_tokens is legal
+    short = torch.tensor([prompt + [7] * 10 + [8, 9] * 5])
+    assert StopOnRepetition(len(prompt), max_ngram=8, min_repeats=3, min_tokens=48)(short, None).tolist() == [False]
+
+    strings = StopOnStrings(LetterTokenizer(), ['xyz'], len(prompt))
+    assert strings(rows, None).tolist() == [False, True]
+    assert strings.matches == [None, 'xyz'] and strings.matched == 'xyz'
+
+    # Once stopped a row stays stopped, at the length where it matched
+    longer = torch.cat([rows, torch.zeros((2, 1), dtype=torch.long)], dim=1)
+    assert strings(longer, None).tolist() == [False, True] and strings.stopped_at == [None, rows.shape[1]]
+
+    budget = StopAtBudget(len(prompt), [2, 5])
+    assert budget(torch.tensor([prompt + [0, 0]] * 2), None).tolist() == [True, False]
+    print("✓ Stopping criteria decide per row")
+
+
+def test_generate_batch_budgets_and_stop_strings():
+    """generate_batch gives each conversation its own budget and cuts rows at stop strings"""
+    loader = tiny_loader()
+    conversations = [[{'role': 'user', 'content': text}] for text in ['short', 'a longer paragraph', 'mid size']]
+
+    responses = loader.generate_batch(conversations, batch_size=3, max_new_tokens=[3, 10, 6])
+    assert [len(r) for r in responses] == [3, 10, 6], responses
+    assert loader.last_generation_stats['stop_reasons'] == {'max_new_tokens': 3}
+    assert loader.last_generation_stats['new_tokens'] == 19
+
+    # Budgets are capped by max_length
+    assert len(loader.generate_batch(conversations[:1], max_length=4, max_new_tokens=[100])[0]) == 4
+
+    # Stop at a string the second reply produces; the other rows are not affected
+    reply = responses[1]
+    stop = reply[4:6]
+    stopped = loader.generate_batch(conversations, batch_size=3, max_new_tokens=[3, 10, 6], stop_strings=[stop])
+    assert stopped[1] == reply[:reply.index(stop)], (stopped, reply, stop)
+    assert loader.last_generation_stats['stop_reasons'].get('stop_string', 0) >= 1
+    for before, after in zip(responses, stopped):
+        assert stop in before or after == before
+    print(f"✓ Per-row budgets and stop strings in generate_batch ({stopped})")
+
+
+def test_document_proofreading_uses_proofread_rules():
+    """Each paragraph of a document gets the proofread budget for its length and the mode's stop strings"""
+    class RecordingLoader:
+        model_config = {'batch_size': 8, 'stop_strings': ['<END>']}
+        last_generation_stats = {}
+
+        def __init__(self):
+            self.calls = []
+
+        def count_tokens(self, text):
+            return len(text.split())
+
+        def generate_batch(self, conversations, batch_size=None, max_new_tokens=None, stop_strings=None):
+            self.calls.append((max_new_tokens, stop_strings))
+            return [c[-1]['content'] for c in conversations]
+
+    nuno = _mode('nuno-writing-style')
+    rules = GenerationRules(nuno, 'proofread', max_length=4096)
+    loader = RecordingLoader()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / 'paper.md'
+        source.write_text("# Title\n\nShort one.\n\n" + "word " * 400 + "\n", encoding='utf-8')
+        DocumentProofreader(loader, "system", rules=rules).proofread_file(str(source), str(Path(tmp_dir) / 'out.md'))
+
+    [(budgets, stop_strings)] = loader.calls
+    assert budgets == [rules.max_new_tokens('', lambda: 2), rules.max_new_tokens('', lambda: 400)], budgets
+    assert budgets[0] < budgets[1] < 4096
+    assert stop_strings == ['<END>'] + rules.stop_strings
+    print(f"✓ Document paragraphs budgeted {budgets}")
+
+
+if __name__ == '__main__':
+    test_count_sections()
+    test_proofread_budget_follows_input_length()
+    test_outline_budget_follows_sections()
+    test_defaults_without_rules()
+    test_stop_criteria_per_row()
+    test_generate_batch_budgets_and_stop_strings()
+    test_document_proofreading_uses_proofread_rules()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Test token-budget trimming of the session history"""
+
+import tempfile
+
+from tests.conftest import write_config
+from writing_assistant.session_manager import MESSAGE_OVERHEAD_TOKENS, SessionManager
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def test_trim_keeps_budget_and_whole_turns():
+    """History stays within the budget left by the system prompt and always opens with a user message"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir, session={'max_context_tokens': 300, 'reserve_tokens': 50,
+                                                                 'max_history': 50}))
+        manager.start_session('tester')
+        system_prompt = ' '.join(['system'] * 40)
+        manager.set_token_budget(count_words, system_prompt)
+        assert manager.get_history_tokens() == 40 + MESSAGE_OVERHEAD_TOKENS
+
+        sent = []
+        for i in range(20):
+            # Replies are longer than questions, so trimming often cuts between the two
+            role = 'user' if i % 2 == 0 else 'assistant'
+            content = ' '.join([f"{role}{i}"] * (10 if role == 'user' else 25))
+            manager.add_message(role, content)
+            sent.append({'role': role, 'content': content})
+
+            history = manager.get_conversation_history()
+            assert history == sent[len(sent) - len(history):], f"not a suffix after message {i}"
+            assert history[-1] == sent[-1]
+            assert history[0]['role'] == 'user', f"history opens with {history[0]['role']} after message {i}"
+            assert manager.get_history_tokens() <= 300 - 50, manager.get_history_tokens()
+        # Nothing more than needed was dropped: the previous whole exchange would not fit
+        exchange = 10 + 25 + 2 * MESSAGE_OVERHEAD_TOKENS
+        assert len(history) == 2 * ((250 - manager.system_prompt_tokens) // exchange), len(history)
+
+        # A longer system prompt leaves less room; the history is trimmed again
+        manager.set_token_budget(count_words, ' '.join(['system'] * 120))
+        history = manager.get_conversation_history()
+        assert len(history) == 2 * ((250 - manager.system_prompt_tokens) // exchange), len(history)
+        assert history == sent[-len(history):] and history[0]['role'] == 'user'
+        assert manager.get_history_tokens() <= 250
+
+        # A message larger than the whole budget is still kept on its own
+        manager.add_message('user', ' '.join(['long'] * 1000))
+        assert [m['content'][:4] for m in manager.get_conversation_history()] == ['long']
+        manager.end_session()
+        manager.wait_for_finalize()
+        print("✓ History trimmed to the token budget in whole turns")
+
+
+def test_max_history_without_token_counter():
+    """Without a token counter only max_history applies"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir, session={'max_history': 5}))
+        manager.start_session('tester')
+        for i in range(12):
+            manager.add_message('user' if i % 2 == 0 else 'assistant', ' '.join(['word'] * 10000) + str(i))
+        history = manager.get_conversation_history()
+        # The oldest kept message would be a reply, so it goes too
+        assert [m['content'].rsplit('d', 1)[1] for m in history] == ['8', '9', '10', '11'], len(history)
+        manager.end_session()
+        manager.wait_for_finalize()
+        print("✓ max_history applies without a token counter")
+
+
+if __name__ == '__main__':
+    test_trim_keeps_budget_and_whole_turns()
+    test_max_history_without_token_counter()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Test reuse of the conversation key/value cache across turns on a tiny model"""
+
+import torch
+from transformers import DynamicCache, Qwen2Config, Qwen2ForCausalLM
+
+from writing_assistant.kv_cache import ConversationCache, common_prefix_length
+
+
+def _tiny_model():
+    torch.manual_seed(0)
+    return Qwen2ForCausalLM(Qwen2Config(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256
+    )).eval()
+
+
+def _prefill(model, token_ids, past_key_values=None, start=0):
+    """Run token_ids[start:] over past_key_values and return (last logits, cache)"""
+    with torch.no_grad():
+        outputs = model(input_ids=torch.tensor([token_ids[start:]]),
+                        past_key_values=past_key_values or DynamicCache(), use_cache=True)
+    return outputs.logits[0, -1], outputs.past_key_values
+
+
+def test_prepare_reuses_and_crops():
+    """A matching prefix is reused, a diverging one is cropped, and the logits stay exact"""
+    model = _tiny_model()
+    cache = ConversationCache()
+    assert cache.prepare([1, 2, 3]) is None and cache.reused_tokens == 0
+
+    # Turn 1: the cache covers the prompt and reply, except the last sampled token
+    turn1 = [5, 6, 7, 8, 9, 10, 11, 12]
+    _, past = _prefill(model, turn1[:-1])
+    cache.update(past, turn1)
+    assert cache.token_ids == turn1[:-1] and len(cache) == 7
+
+    # Turn 2 starts with turn 1: only the new tokens are prefilled
+    turn2 = turn1 + [13, 14, 15]
+    past = cache.prepare(turn2)
+    assert past is not None and cache.reused_tokens == 7 and past.get_seq_length() == 7
+    logits, past = _prefill(model, turn2, past, start=cache.reused_tokens)
+    expected, _ = _prefill(model, turn2)
+    assert torch.allclose(logits, expected, atol=1e-5)
+    cache.update(past, turn2 + [16])
+    assert len(cache) == len(turn2)
+
+    # The history changed after token 4 (e.g. trimmed): crop back to the shared prefix
+    turn3 = turn2[:4] + [40, 41, 42]
+    past = cache.prepare(turn3)
+    assert cache.reused_tokens == 4 and past.get_seq_length() == 4 and cache.token_ids == turn2[:4]
+    logits, past = _prefill(model, turn3, past, start=4)
+    expected, _ = _prefill(model, turn3)
+    assert torch.allclose(logits, expected, atol=1e-5)
+    cache.update(past, turn3 + [43])
+
+    # A prompt equal to the cached tokens still leaves one token to feed
+    past = cache.prepare(turn3)
+    assert cache.reused_tokens == 6 and past.get_seq_length() == 6
+
+    # Nothing shared (e.g. a new system prompt): the cache is reset
+    assert cache.prepare([60, 61, 62]) is None
+    assert cache.past_key_values is None and len(cache) == 0 and cache.reused_tokens == 0
+    print("✓ Cache reused, cropped and reset as the history changes")
+
+
+def test_common_prefix_length():
+    """Leading tokens shared by two prompts"""
+    assert common_prefix_length([1, 2, 3], [1, 2, 3, 4]) == 3
+    assert common_prefix_length([1, 2, 3], [1, 9, 3]) == 1
+    assert common_prefix_length([], [1]) == 0
+    assert common_prefix_length([4], [5]) == 0
+    print("✓ Common prefix length")
+
+
+if __name__ == '__main__':
+    test_prepare_reuses_and_crops()
+    test_common_prefix_length()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test the buffered background writer of session logs"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from writing_assistant.log_writer import FSYNC_POLICIES, LogWriter
+
+
+ENTRIES = 1000
+
+
+def test_close_writes_queued_entries():
+    """Everything queued before close() is on disk, in order, under every fsync policy"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fsync in FSYNC_POLICIES:
+            writer = LogWriter(fsync, fsync_interval=0.01)
+            paths = [Path(tmp_dir) / f"{fsync}_{n}.jsonl" for n in range(3)]
+            sizes = {path: 0 for path in paths}
+            for i in range(ENTRIES):
+                path = paths[i % len(paths)]
+                sizes[path] += writer.write(path, {'type': 'message', 'seq': i, 'content': f"Entry {i} — café ✓ 日本語"})
+            writer.close()
+
+            for n, path in enumerate(paths):
+                assert path.stat().st_size == sizes[path], (fsync, path.name)
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = [json.loads(line) for line in f]
+                assert [e['seq'] for e in entries] == list(range(n, ENTRIES, len(paths))), (fsync, path.name)
+                assert entries[0]['content'] == f"Entry {n} — café ✓ 日本語"
+
+            try:
+                writer.write(paths[0], {'type': 'message'})
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("wrote to a closed writer")
+        print(f"✓ close() writes all {ENTRIES} queued entries ({', '.join(FSYNC_POLICIES)})")
+
+
+def test_flush_reports_write_errors():
+    """A failed append is raised by the next flush, and later writes still go through"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = LogWriter()
+        try:
+            writer.write(Path(tmp_dir) / 'missing' / 'session.jsonl', {'type': 'message'})
+            try:
+                writer.flush()
+            except OSError:
+                pass
+            else:
+                raise AssertionError("write error not reported")
+
+            path = Path(tmp_dir) / 'session.jsonl'
+            writer.write(path, {'type': 'message'})
+            writer.flush(path, sync=True)
+            assert os.path.getsize(path) > 0
+        finally:
+            writer.close()
+        print("✓ Write errors raised by flush()")
+
+
+if __name__ == '__main__':
+    test_close_writes_queued_entries()
+    test_flush_reports_write_errors()
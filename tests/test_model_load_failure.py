@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Test that a failed background model load ends the interactive session"""
+
+import tempfile
+
+from tests.conftest import write_config
+from writing_assistant import cli
+from writing_assistant.cli import WritingAssistant
+from writing_assistant.session_manager import SessionManager
+
+
+class FailingLoader:
+    """Stands in for BackgroundModelLoader after the load has failed"""
+
+    ready = True
+    stage = "Failed"
+    elapsed = 1.0
+
+    def __init__(self):
+        self.calls = 0
+
+    def wait(self, timeout=None):
+        self.calls += 1
+        if self.calls > 3:
+            # The old behaviour retried forever: stop the loop instead of hanging the test
+            raise KeyboardInterrupt
+        raise RuntimeError("Repo id must be in the form 'repo_name' or 'namespace/repo_name'")
+
+
+def test_failed_load_ends_session():
+    """The load error is reported once and the session ends without reading input"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assistant = WritingAssistant(write_config(tmp_dir))
+        assistant.session_manager = SessionManager(assistant.config_path)
+        assistant.session_manager.start_session('tester')
+        assistant.system_prompt = assistant._build_system_prompt()
+        loader = FailingLoader()
+        assistant.background_loader = loader
+        assistant.running = True
+
+        prompts = []
+        ask = cli.Prompt.ask
+        cli.Prompt.ask = lambda *args, **kwargs: prompts.append(args) or '/quit'
+        try:
+            assistant.run_interactive_session()
+        finally:
+            cli.Prompt.ask = ask
+        assistant.session_manager.wait_for_finalize()
+
+        assert loader.calls == 1, f"load error raised {loader.calls} times"
+        assert not prompts, "prompted for input after the load failed"
+        assert not assistant.running and assistant.background_loader is None
+        assert assistant.session_manager.session_id is None, "session not ended"
+        print("✓ Failed model load ends the session")
+
+
+if __name__ == '__main__':
+    test_failed_load_ends_session()
@@ -18,7 +18,7 @@ def test_nuno_yaml_structure():
         config = yaml.safe_load(f)
 
     # Check required fields
-    required_fields = ['custom_instructions', 'outline', 'proofread']
+    required_fields = ['custom_instructions', 'outline', 'proofread', 'edits']
     missing_fields = [field for field in required_fields if field not in config]
 
     if missing_fields:
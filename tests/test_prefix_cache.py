@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Test the on-disk store of system prompt key/value states"""
+
+import tempfile
+from pathlib import Path
+
+import torch
+
+from writing_assistant.kv_cache import cache_from_tensors, cache_to_tensors
+from writing_assistant.prefix_cache import PrefixCacheStore
+
+
+def _states(length: int, seed: int):
+    """Two layers of random (key, value) states for a prefix of length tokens"""
+    generator = torch.Generator().manual_seed(seed)
+    return cache_from_tensors([
+        (torch.randn(1, 2, length, 8, generator=generator), torch.randn(1, 2, length, 8, generator=generator))
+        for _ in range(2)
+    ])
+
+
+def _same(cache, expected) -> bool:
+    return all(
+        torch.equal(k, ek) and torch.equal(v, ev)
+        for (k, v), (ek, ev) in zip(cache_to_tensors(cache), cache_to_tensors(expected))
+    )
+
+
+def test_entries_replaced_when_prompt_changes():
+    """Entries survive a restart; a new prompt hash replaces the mode's old entry"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32)
+        prompt_v1, prompt_v2 = [1, 2, 3, 4], [1, 2, 3, 5, 6]
+        states_v1, states_v2 = _states(4, 1), _states(5, 2)
+
+        assert store.load('academic', None, prompt_v1) is None
+        store.save('academic', None, prompt_v1, states_v1)
+        store.save('nuno-writing-style', 'proofread', prompt_v1, states_v1)
+        entries = sorted(p.name for p in store.directory.glob('*.pt'))
+        assert entries == [f"academic--base--{store.prompt_hash(prompt_v1)}.pt",
+                           f"nuno-writing-style--proofread--{store.prompt_hash(prompt_v1)}.pt"], entries
+
+        # A new process loads the entry from disk
+        restarted = PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32)
+        assert _same(restarted.load('academic', None, prompt_v1), states_v1)
+
+        # The mode prompt was edited: the new entry replaces the old one, other modes are kept
+        restarted.save('academic', None, prompt_v2, states_v2)
+        entries = sorted(p.name for p in store.directory.glob('*.pt'))
+        assert entries == [f"academic--base--{store.prompt_hash(prompt_v2)}.pt",
+                           f"nuno-writing-style--proofread--{store.prompt_hash(prompt_v1)}.pt"], entries
+        fresh = PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32)
+        assert fresh.load('academic', None, prompt_v1) is None
+        assert _same(fresh.load('academic', None, prompt_v2), states_v2)
+
+        # Loaded caches are copies: extending one leaves the stored states intact
+        cache = fresh.load('academic', None, prompt_v2)
+        layer = cache_to_tensors(_states(1, 3))[0]
+        cache.update(layer[0], layer[1], 0)
+        assert _same(fresh.load('academic', None, prompt_v2), states_v2)
+        print("✓ Prefix entries persisted and replaced on prompt change")
+
+
+def test_default_mode_keeps_one_entry():
+    """Each new set of custom instructions in the default mode replaces the previous entry"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32)
+        store.save('academic', None, [1, 2, 3], _states(3, 1))
+        for i in range(5):
+            prompt = [1, 2, 3, 10 + i]
+            store.save(None, None, prompt, _states(4, i))
+
+        entries = sorted(p.name for p in store.directory.glob('*.pt'))
+        assert entries == [f"academic--base--{store.prompt_hash([1, 2, 3])}.pt",
+                           f"default--base--{store.prompt_hash(prompt)}.pt"], entries
+        assert _same(PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32).load(None, None, prompt),
+                     _states(4, 4))
+        print("✓ Default mode keeps one prefix entry")
+
+
+def test_bad_entries_and_model_keys():
+    """Corrupt entries are dropped, and each model, dtype and quantization has its own directory"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32)
+        prompt = [7, 8, 9]
+        store.save('academic', None, prompt, _states(3, 1))
+        entry_file = next(store.directory.glob('*.pt'))
+        entry_file.write_bytes(b'truncated')
+
+        restarted = PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32)
+        assert restarted.load('academic', None, prompt) is None and not entry_file.exists()
+
+        keys = {
+            PrefixCacheStore(tmp_dir, '/models/tiny', torch.float32).model_key,
+            PrefixCacheStore(tmp_dir, '/models/tiny', torch.bfloat16).model_key,
+            PrefixCacheStore(tmp_dir, '/models/tiny', torch.bfloat16, quantization='int8').model_key,
+            PrefixCacheStore(tmp_dir, '/models/other', torch.float32).model_key,
+        }
+        assert len(keys) == 4
+
+        # Without a cache directory entries are kept in memory only
+        memory_only = PrefixCacheStore(None, '/models/tiny', torch.float32)
+        memory_only.save('academic', None, prompt, _states(3, 1))
+        assert memory_only.directory is None and memory_only.load('academic', None, prompt) is not None
+        assert list(Path(tmp_dir).rglob('*.pt')) == []
+        print("✓ Corrupt entries dropped, model keys distinct")
+
+
+if __name__ == '__main__':
+    test_entries_replaced_when_prompt_changes()
+    test_default_mode_keeps_one_entry()
+    test_bad_entries_and_model_keys()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Test document splitting, the document prompt and reuse of stored results for the proofread command"""
+
+import tempfile
+from pathlib import Path
+
+import yaml
+
+from writing_assistant.proofread_store import ProofreadStore
+from writing_assistant.proofreader import DocumentProofreader, document_prompt, iter_blocks
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+DOCUMENT = """# Introduction
+
+Proteomics has grown quickly.
+It now covers many fields.
+
+Second paragraph.
+
+```python
+x = 1
+
+y = 2
+```
+
+| a | b |
+|---|---|
+
+$$
+E = mc^2
+$$
+Last paragraph without newline"""
+
+
+def test_blocks_roundtrip():
+    """Joining all blocks reproduces the document exactly"""
+    blocks = list(iter_blocks(DOCUMENT.splitlines(keepends=True)))
+    assert ''.join(block.text for block in blocks) == DOCUMENT
+    print("✓ Blocks reproduce the document")
+
+
+def test_only_paragraphs_are_proofread():
+    """Headings, code, tables and math are passed through verbatim"""
+    blocks = list(iter_blocks(DOCUMENT.splitlines(keepends=True)))
+    paragraphs = [block.text for block in blocks if block.proofread]
+
+    assert paragraphs == [
+        "Proteomics has grown quickly.\nIt now covers many fields.\n",
+        "Second paragraph.\n",
+        "Last paragraph without newline",
+    ]
+    assert not any('x = 1' in p or 'E = mc^2' in p or '|' in p for p in paragraphs)
+    print(f"✓ Found {len(paragraphs)} paragraphs to proofread")
+
+
+class ExplainingLoader:
+    """Stands in for QWenModelLoader: revises each paragraph, then explains the changes as in a chat"""
+    model_config = {'batch_size': 4}
+    last_generation_stats = {}
+
+    def generate_batch(self, conversations, batch_size=None, max_new_tokens=None, stop_strings=None):
+        return [f"REVISED {c[-1]['content']}\n\n**Changes:** fixed the grammar.\n\n- Key improvement"
+                for c in conversations]
+
+
+class RecordingLoader:
+    """Stands in for QWenModelLoader: revises each paragraph and records the paragraphs it was sent"""
+    model_config = {'batch_size': 4, 'name': 'tiny', 'max_length': 64, 'temperature': 0.7, 'top_p': 0.9}
+    last_generation_stats = {}
+
+    def __init__(self):
+        self.sent = []
+
+    def generate_batch(self, conversations, batch_size=None, max_new_tokens=None, stop_strings=None):
+        paragraphs = [c[-1]['content'] for c in conversations]
+        self.sent += paragraphs
+        return [f"REVISED {p}" for p in paragraphs]
+
+
+def test_document_prompt_asks_only_for_the_paragraph():
+    """The proofread prompt's chat response format is dropped from the document prompt"""
+    with open(ROOT / 'prompts' / 'nuno-writing-style.yaml', 'r') as f:
+        proofread = yaml.safe_load(f)['proofread']
+    assert 'explanation of major changes' in proofread
+
+    prompt = document_prompt(proofread)
+    assert 'explanation of major changes' not in prompt and 'Response Format' not in prompt
+    # The other sections are kept, and the document instructions come last
+    assert '**Step 4: Quality Check**' in prompt and '**Special Instructions:**' in prompt
+    assert prompt.endswith("If the paragraph needs no changes, return it unchanged.")
+    print("✓ Document prompt drops the chat response format")
+
+
+def test_explanations_are_not_spliced_into_the_document():
+    """Only the revised paragraph of each reply is written back"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / 'paper.md'
+        output = Path(tmp_dir) / 'revised.md'
+        source.write_text(DOCUMENT, encoding='utf-8')
+        DocumentProofreader(ExplainingLoader(), "system").proofread_file(str(source), str(output))
+        revised = output.read_text(encoding='utf-8')
+
+    assert 'Changes' not in revised and 'Key improvement' not in revised
+    assert revised == DOCUMENT.replace("Proteomics", "REVISED Proteomics") \
+        .replace("Second", "REVISED Second").replace("Last", "REVISED Last")
+    print("✓ Explanations are not spliced into the document")
+
+
+def test_only_changed_paragraphs_are_rerun():
+    """A re-run reuses stored paragraphs and sends only edited ones; a new prompt or refresh reruns all"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / 'paper.md'
+        output = Path(tmp_dir) / 'revised.md'
+        log_directory = Path(tmp_dir) / 'users'
+
+        def run(system_prompt="system", refresh=False):
+            loader = RecordingLoader()
+            # A new store per run, as for a new proofread command
+            store = ProofreadStore(str(log_directory), system_prompt, loader.model_config)
+            stats = DocumentProofreader(loader, system_prompt, store=store, refresh=refresh).proofread_file(
+                str(source), str(output))
+            return loader.sent, stats, output.read_text(encoding='utf-8')
+
+        source.write_text(DOCUMENT, encoding='utf-8')
+        sent, stats, first = run()
+        assert len(sent) == 3 and stats['reused'] == 0
+
+        sent, stats, again = run()
+        assert sent == [] and stats['reused'] == 3 and again == first
+
+        # Edit one paragraph: only it goes to the model, the others come from the store
+        source.write_text(DOCUMENT.replace("Second paragraph.", "Second paragraph, edited."), encoding='utf-8')
+        sent, stats, edited = run()
+        assert sent == ["Second paragraph, edited."] and stats['reused'] == 2 and stats['paragraphs'] == 3
+        assert edited == first.replace("REVISED Second paragraph.", "REVISED Second paragraph, edited.")
+
+        # A different prompt is a different context; refresh ignores the store
+        assert len(run(system_prompt="another prompt")[0]) == 3
+        assert len(run(refresh=True)[0]) == 3
+        print("✓ Only changed paragraphs are proofread again")
+
+
+if __name__ == '__main__':
+    test_blocks_roundtrip()
+    test_only_paragraphs_are_proofread()
+    test_document_prompt_asks_only_for_the_paragraph()
+    test_explanations_are_not_spliced_into_the_document()
+    test_only_changed_paragraphs_are_rerun()
+    print("\n✅ All tests passed!")
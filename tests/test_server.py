@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Test request validation of the OpenAI-compatible server"""
+
+import json
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from types import SimpleNamespace
+
+import yaml
+
+from tests.conftest import ROOT, write_config
+from writing_assistant.server import ChatService, RequestError, create_server, finish_reason
+from writing_assistant.session_manager import SessionManager
+
+
+class StubTokenizer:
+    eos_token_id = None
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return '\n'.join(m['content'] for m in messages)
+
+    def __call__(self, text):
+        return {'input_ids': [ord(c) % 64 for c in text] or [1]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return ''.join(chr(ord('a') + i % 26) for i in ids)
+
+
+class StubModelLoader:
+    """Enough of QWenModelLoader for ChatService; requests here never reach the model"""
+
+    def __init__(self, config_path: str):
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+        self.model_config = self.config['model']
+        self.tokenizer = StubTokenizer()
+        self.model = SimpleNamespace(device='cpu', generation_config=SimpleNamespace(eos_token_id=None))
+
+    def get_system_prompt(self, custom_instructions=None):
+        return custom_instructions or "You are a writing assistant."
+
+
+def _post(port: int, body: dict):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/v1/chat/completions",
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_user_cannot_escape_log_directory():
+    """A 'user' that is not a plain name is rejected with 400 and nothing is written"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        service = ChatService(StubModelLoader(config_path), config_path, prompts_dir=str(ROOT / 'prompts'))
+        server = create_server(service, '127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for user in ['../../escaped', '/tmp/escaped', '.hidden', 'a/b', '', 42]:
+                status, reply = _post(server.server_address[1], {
+                    'user': user,
+                    'messages': [{'role': 'user', 'content': 'Hello'}]
+                })
+                assert status == 400 and 'user' in reply['error']['message'], (user, status, reply)
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+        # SessionManager refuses them too, whoever the caller is
+        try:
+            SessionManager(config_path).start_session('../escaped')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("start_session accepted '../escaped'")
+
+        written = [p.relative_to(tmp_dir) for p in Path(tmp_dir).rglob('session_*')]
+        assert not written, f"session files written: {written}"
+        print("✓ Invalid usernames rejected")
+
+
+def test_failures_use_openai_errors():
+    """A failed generation is an error response, never an OpenAI-invalid finish_reason"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        # The stub model cannot be called, so every generation fails in the scheduler
+        service = ChatService(StubModelLoader(config_path), config_path, prompts_dir=str(ROOT / 'prompts'))
+        server = create_server(service, '127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        port = server.server_address[1]
+        try:
+            status, reply = _post(port, {'user': 'tester', 'messages': [{'role': 'user', 'content': 'Hello'}]})
+            assert status == 500 and reply['error']['type'] == 'server_error', (status, reply)
+
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/v1/chat/completions",
+                data=json.dumps({'user': 'tester', 'stream': True,
+                                 'messages': [{'role': 'user', 'content': 'Hello'}]}).encode('utf-8'),
+                headers={'Content-Type': 'application/json'}
+            )
+            with urllib.request.urlopen(request, timeout=10) as response:
+                events = [line[len(b'data: '):] for line in response.read().splitlines() if line.startswith(b'data: ')]
+            assert events[-1] == b'[DONE]', events
+            error = json.loads(events[-2])
+            assert error['error']['type'] == 'server_error', error
+            for event in events[:-2]:
+                for choice in json.loads(event)['choices']:
+                    assert choice['finish_reason'] in (None, 'stop', 'length'), choice
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+    # Internal reasons map onto the ones the OpenAI API defines
+    for internal, reported in [('length', 'length'), ('stop', 'stop'), ('cancelled', 'stop'), (None, 'stop')]:
+        assert finish_reason(SimpleNamespace(finish_reason=internal)) == reported
+    print("✓ Failures reported as OpenAI errors")
+
+
+def test_only_prompt_keys_are_submodes():
+    """Settings sections of a mode file (generation) are neither listed nor accepted as submodes"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        service = ChatService(StubModelLoader(config_path), config_path, prompts_dir=str(ROOT / 'prompts'))
+        try:
+            names = [model['id'] for model in service.list_models()['data']]
+            assert 'nuno-writing-style:proofread' in names and 'academic' in names
+            assert not [name for name in names if name.endswith((':generation', ':custom_instructions'))], names
+
+            for model in ['academic:generation', 'nuno-writing-style:generation']:
+                try:
+                    service.build_messages({'model': model, 'messages': [{'role': 'user', 'content': 'Hi'}]})
+                except RequestError as e:
+                    assert e.status == 404, (model, e.status)
+                else:
+                    raise AssertionError(f"Accepted {model}")
+
+            messages = service.build_messages({
+                'model': 'nuno-writing-style:proofread',
+                'messages': [{'role': 'user', 'content': 'Hi'}]
+            })
+            assert messages[0]['content'] == service.modes['nuno-writing-style']['proofread']
+        finally:
+            service.close()
+        print(f"✓ {len(names)} models listed, settings sections excluded")
+
+
+def test_null_sampling_settings_use_defaults():
+    """"temperature": null and "top_p": null mean the configured defaults; 0 is kept"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        loader = StubModelLoader(config_path)
+        service = ChatService(loader, config_path, prompts_dir=str(ROOT / 'prompts'))
+        messages = [{'role': 'user', 'content': 'Hi'}]
+        try:
+            request = service.create_request({'messages': messages, 'temperature': None, 'top_p': None})
+            assert (request.temperature, request.top_p) == \
+                (loader.model_config['temperature'], loader.model_config['top_p'])
+            request = service.create_request({'messages': messages, 'temperature': 0, 'top_p': 0.5})
+            assert (request.temperature, request.top_p) == (0.0, 0.5)
+        finally:
+            service.close()
+        print("✓ Null temperature and top_p use the defaults")
+
+
+if __name__ == '__main__':
+    test_user_cannot_escape_log_directory()
+    test_failures_use_openai_errors()
+    test_only_prompt_keys_are_submodes()
+    test_null_sampling_settings_use_defaults()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Test archiving old sessions into compressed monthly segments"""
+
+import gzip
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from tests.conftest import write_config
+from writing_assistant.session_manager import SessionManager
+
+
+def _write_log(user_dir: Path, session_id: str, started_at: str, contents) -> bytes:
+    """Write a finished session log by hand and return its bytes"""
+    user_dir.mkdir(parents=True, exist_ok=True)
+    entries = [{'type': 'session_start', 'timestamp': started_at, 'mode': 'academic'}]
+    entries += [{'type': 'message', 'timestamp': started_at, 'role': 'user' if i % 2 == 0 else 'assistant',
+                 'content': c} for i, c in enumerate(contents)]
+    entries.append({'type': 'session_end', 'timestamp': started_at})
+    raw = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries).encode('utf-8')
+    (user_dir / f"session_{session_id}.jsonl").write_bytes(raw)
+    return raw
+
+
+def test_archived_sessions_stay_readable():
+    """Archived sessions are listed, viewed, summarized and searched as before"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir))
+        user_dir = Path(manager.log_directory) / 'tester'
+        old = {
+            '20240301_090000_aaaaaa': ["Bonjour — café ✓", "Réponse longue " * 50, "日本語", "fin"],
+            '20240315_090000_bbbbbb': ["Second session, same month", "ok"],
+            '20240402_090000_cccccc': ["Next month", "ok"],
+        }
+        raws = {sid: _write_log(user_dir, sid, f"{sid[:4]}-{sid[4:6]}-{sid[6:8]}T09:00:00", contents)
+                for sid, contents in old.items()}
+        for sid in old:
+            manager.write_summary_file('tester', sid)
+
+        # A session that just ended is not old enough
+        manager.start_session('tester')
+        recent = manager.session_id
+        manager.add_message('user', "Recent message")
+        manager.end_session()
+        manager.wait_for_finalize()
+
+        before = {sid: manager.load_session_history('tester', sid) for sid in old}
+        summaries = {sid: (user_dir / f"session_{sid}.txt").read_text(encoding='utf-8') for sid in old}
+
+        stats = manager.archive_sessions(older_than_days=30)
+        assert stats['sessions'] == 3 and stats['bytes_after'] < stats['bytes_before'], stats
+        assert sorted(p.name for p in (user_dir / 'archive').glob('*.jsonl.gz')) == \
+            ['2024-03.jsonl.gz', '2024-04.jsonl.gz']
+        assert sorted(p.stem[len('session_'):] for p in user_dir.glob('session_*.jsonl')) == [recent]
+        assert not [p for p in user_dir.glob('session_*.txt') if recent not in p.name]
+
+        # Each session is its own gzip member; the whole segment is still one valid gzip file
+        for sid, raw in raws.items():
+            assert manager.catalog.archive.read_session('tester', sid) == raw
+        with gzip.open(user_dir / 'archive' / '2024-03.jsonl.gz', 'rb') as f:
+            assert f.read() == raws['20240301_090000_aaaaaa'] + raws['20240315_090000_bbbbbb']
+
+        assert [s['session_id'] for s in manager.find_sessions('tester')] == [recent] + sorted(old, reverse=True)
+        for sid in old:
+            assert manager.load_session_history('tester', sid) == before[sid]
+            out = io.StringIO()
+            manager.write_summary('tester', sid, out)
+            assert out.getvalue() == summaries[sid]
+        assert [m['content'] for m in manager.load_session_history('tester', '20240301_090000_aaaaaa', 1, 2)] == \
+            old['20240301_090000_aaaaaa'][1:3]
+        assert [r['session_id'] for r in manager.catalog.search('café')] == ['20240301_090000_aaaaaa']
+
+        # Archiving again changes nothing
+        assert manager.archive_sessions(older_than_days=30)['sessions'] == 0
+        assert manager.catalog.archive.add_session('tester', '20240315_090000_bbbbbb', Path(os.devnull)) > 0
+        assert manager.catalog.archive.read_session('tester', '20240315_090000_bbbbbb') == \
+            raws['20240315_090000_bbbbbb']
+        print(f"✓ {stats['sessions']} sessions archived: {stats['bytes_before']} → {stats['bytes_after']} bytes")
+
+
+def test_keep_summaries():
+    """With keep_summaries the .txt summary stays next to the archive"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir))
+        user_dir = Path(manager.log_directory) / 'tester'
+        _write_log(user_dir, '20240301_090000_aaaaaa', '2024-03-01T09:00:00', ["Hello", "Hi"])
+        manager.write_summary_file('tester', '20240301_090000_aaaaaa')
+
+        stats = manager.archive_sessions(older_than_days=30, username='tester', keep_summaries=True)
+        assert stats['sessions'] == 1
+        assert not (user_dir / 'session_20240301_090000_aaaaaa.jsonl').exists()
+        assert (user_dir / 'session_20240301_090000_aaaaaa.txt').exists()
+        print("✓ Summaries kept on request")
+
+
+if __name__ == '__main__':
+    test_archived_sessions_stay_readable()
+    test_keep_summaries()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Test the session catalog: message ranges, unicode round trips and session filters"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from tests.conftest import ROOT, write_config
+from writing_assistant.session_catalog import SessionCatalog
+from writing_assistant.session_manager import SessionManager
+
+
+# Starts a session, logs three messages and dies without ending it
+CRASHING_SESSION = """
+import os, sys
+from writing_assistant.session_manager import SessionManager
+
+manager = SessionManager(sys.argv[1])
+manager.start_session('tester')
+for content in ['first', 'second zebra', 'third']:
+    manager.add_message('user', content)
+manager.log_writer.flush()
+print(manager.session_id, flush=True)
+os._exit(1)
+"""
+
+MESSAGES = ["Hello — café", "Réponse: naïve ✓", "日本語の文章を校正して", "Ok 👍", "\"quoted\"\nnew line", "last"]
+
+
+def _write_log(user_dir: Path, session_id: str, started_at: str, mode: str, messages: int) -> None:
+    """Write a finished session log by hand, as an older process would have left it"""
+    user_dir.mkdir(parents=True, exist_ok=True)
+    entries = [{'type': 'session_start', 'timestamp': started_at, 'mode': mode}]
+    entries += [{'type': 'message', 'timestamp': started_at, 'role': 'user', 'content': f"m{i}"} for i in range(messages)]
+    entries.append({'type': 'session_end', 'timestamp': started_at})
+    with open(user_dir / f"session_{session_id}.jsonl", 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(e) + '\n' for e in entries)
+
+
+def test_message_ranges_round_trip():
+    """Ranges of unicode messages read back identically, from open and from ended sessions"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir))
+        manager.start_session('tester')
+        session_id = manager.session_id
+        for i, content in enumerate(MESSAGES):
+            manager.add_message('user' if i % 2 == 0 else 'assistant', content)
+
+        ranges = [(0, None), (2, None), (1, 3), (-2, None), (-4, 2), (10, None), (-10, 2)]
+        manager.log_writer.flush()
+        # Open session: no offsets in the catalog yet, the log is read whole
+        open_results = {r: manager.load_session_history('tester', session_id, *r) for r in ranges}
+        manager.end_session()
+        manager.wait_for_finalize()
+
+        for start, count in ranges:
+            expected = MESSAGES[start:] if count is None else MESSAGES[start:][:count]
+            if start < 0 and -start > len(MESSAGES):
+                expected = MESSAGES[:count]
+            # Ended session: only the selected messages are read, at their catalogued offsets
+            ended = manager.load_session_history('tester', session_id, start, count)
+            assert [m['content'] for m in ended] == expected, (start, count, ended)
+            assert ended == open_results[(start, count)], (start, count)
+
+        roles = [m['role'] for m in manager.load_session_history('tester', session_id)]
+        assert roles == ['user', 'assistant'] * 3
+        print(f"✓ {len(ranges)} message ranges read back identically")
+
+
+def _crashed_session(config_path: str) -> str:
+    """Run a session in a process that is killed before end_session(); return its id"""
+    result = subprocess.run([sys.executable, '-c', CRASHING_SESSION, config_path],
+                            cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 1 and 'Traceback' not in result.stderr, result.stderr
+    return result.stdout.strip()
+
+
+def test_crashed_sessions_are_rescanned():
+    """A session whose process died is catalogued from its log, and again when the log grows"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        session_id = _crashed_session(config_path)
+        manager = SessionManager(config_path)
+
+        [session] = manager.find_sessions('tester')
+        assert session['session_id'] == session_id and session['ended_at'] is None
+        assert session['message_count'] == 3, session
+        # Unchanged logs are not scanned again
+        assert manager.catalog.sync_user('tester') == 0
+        assert [m['content'] for m in manager.load_session_history('tester', session_id, -2)] == \
+            ['second zebra', 'third']
+
+        log_file = manager.catalog.log_file('tester', session_id)
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'type': 'message', 'timestamp': '2024-01-01T00:00:00', 'role': 'assistant',
+                                'content': 'late'}) + '\n')
+            f.write('{"type": "message", "cut sh')
+        assert manager.catalog.sync_user('tester') == 1
+        [session] = manager.find_sessions('tester')
+        assert session['message_count'] == 4 and session['log_size'] == log_file.stat().st_size, session
+        print("✓ Crashed sessions catalogued from their logs")
+
+
+def test_find_sessions_filters():
+    """Mode, date range, sort order and pagination select the right sessions"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir))
+        user_dir = Path(manager.log_directory) / 'tester'
+        _write_log(user_dir, '20240301_090000_aaaaaa', '2024-03-01T09:00:00', 'academic', 2)
+        _write_log(user_dir, '20240302_100000_bbbbbb', '2024-03-02T10:00:00', 'nuno-writing-style:proofread', 5)
+        _write_log(user_dir, '20240302_230000_cccccc', '2024-03-02T23:00:00', 'nuno-writing-style', 1)
+        _write_log(user_dir, '20240305_080000_dddddd', '2024-03-05T08:00:00', 'academic', 3)
+        _write_log(Path(manager.log_directory) / 'other', '20240302_120000_eeeeee', '2024-03-02T12:00:00',
+                   'academic', 4)
+
+        def ids(**filters):
+            return [s['session_id'][-6:] for s in manager.find_sessions('tester', **filters)]
+
+        assert ids() == ['dddddd', 'cccccc', 'bbbbbb', 'aaaaaa']
+        assert ids(sort='oldest') == ['aaaaaa', 'bbbbbb', 'cccccc', 'dddddd']
+        assert ids(sort='messages') == ['bbbbbb', 'dddddd', 'aaaaaa', 'cccccc']
+        assert ids(mode='nuno-writing-style') == ['cccccc', 'bbbbbb']
+        assert ids(mode='nuno-writing-style:proofread') == ['bbbbbb']
+        # A bare until date includes that whole day
+        assert ids(since='2024-03-02', until='2024-03-02') == ['cccccc', 'bbbbbb']
+        assert ids(since='2024-03-02T12:00:00') == ['dddddd', 'cccccc']
+        assert ids(until='2024-03-01') == ['aaaaaa']
+        assert ids(sort='oldest', limit=2, offset=1) == ['bbbbbb', 'cccccc']
+
+        sessions = manager.find_sessions('tester', sort='oldest')
+        assert [s['message_count'] for s in sessions] == [2, 5, 1, 3]
+        assert all(s['ended_at'] for s in sessions)
+        print("✓ Session filters")
+
+
+def test_catalog_path_and_journal_mode():
+    """The catalog can live outside the log directory, with the rollback journal for network filesystems"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        catalog_path = os.path.join(tmp_dir, 'local', 'catalog.sqlite3')
+        manager = SessionManager(write_config(
+            tmp_dir, session={'catalog_path': catalog_path, 'catalog_journal_mode': 'delete'}
+        ))
+        manager.start_session('tester')
+        manager.add_message('user', "hello")
+        manager.end_session()
+        manager.wait_for_finalize()
+
+        assert manager.catalog.path == Path(catalog_path) and Path(catalog_path).exists()
+        assert not (Path(manager.log_directory) / '.catalog.sqlite3').exists()
+        assert manager.catalog.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
+        assert not list(Path(catalog_path).parent.glob('*-wal'))
+        [session] = manager.find_sessions('tester')
+        assert session['message_count'] == 1
+
+        # Local disks default to WAL
+        default = SessionManager(write_config(tmp_dir))
+        assert default.catalog.path == Path(default.log_directory) / '.catalog.sqlite3'
+        assert default.catalog.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        try:
+            SessionCatalog(manager.log_directory, journal_mode='memory')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("invalid journal mode accepted")
+        print("✓ Catalog path and journal mode configurable")
+
+
+if __name__ == '__main__':
+    test_message_ranges_round_trip()
+    test_crashed_sessions_are_rescanned()
+    test_find_sessions_filters()
+    test_catalog_path_and_journal_mode()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Stress test: hundreds of concurrent sessions of one user, across processes"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from tests.conftest import ROOT, write_config
+
+
+# Worker processes x sessions per process (threads), all started at once
+PROCESSES = int(os.environ.get('STRESS_PROCESSES', '4'))
+SESSIONS_PER_PROCESS = int(os.environ.get('STRESS_SESSIONS', '50'))
+MESSAGES = 10
+USERNAME = 'stress'
+
+# Every session of a worker runs in its own thread; prints the session ids it used
+WORKER = """
+import json, os, sys, threading
+from writing_assistant.session_manager import SessionManager
+
+config_path, sessions, messages = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+start = threading.Barrier(sessions)
+ids = []
+
+def run(n):
+    manager = SessionManager(config_path)
+    start.wait()
+    manager.start_session('stress', mode='academic')
+    ids.append(manager.session_id)
+    for i in range(messages):
+        # Some messages are larger than a pipe buffer, so appends are not atomic by themselves
+        body = 'x' * (10000 if i % 3 == 0 else 10)
+        manager.add_message('user' if i % 2 == 0 else 'assistant', f"{manager.session_id}/{i} {body}")
+    manager.end_session()
+    manager.wait_for_finalize()
+
+threads = [threading.Thread(target=run, args=(n,)) for n in range(sessions)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(json.dumps(ids))
+"""
+
+
+def _check_log(log_file: Path, session_id: str) -> None:
+    """A log holds exactly its own session: start, every message in order, end"""
+    with open(log_file, 'r', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert entries[0]['type'] == 'session_start' and entries[0]['session_id'] == session_id
+    assert entries[-1]['type'] == 'session_end'
+    contents = [e['content'].split(' ')[0] for e in entries if e.get('type') == 'message']
+    assert contents == [f"{session_id}/{i}" for i in range(MESSAGES)], f"{log_file.name}: {contents}"
+
+
+def test_concurrent_sessions_keep_logs_intact():
+    """Sessions started together never share or interleave log files"""
+    from writing_assistant.session_manager import SessionManager
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        workers = [
+            subprocess.Popen(
+                [sys.executable, '-c', WORKER, config_path, str(SESSIONS_PER_PROCESS), str(MESSAGES)],
+                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+            for _ in range(PROCESSES)
+        ]
+        session_ids = []
+        for worker in workers:
+            out, err = worker.communicate(timeout=600)
+            assert worker.returncode == 0 and 'Traceback' not in err, err
+            session_ids += json.loads(out)
+
+        total = PROCESSES * SESSIONS_PER_PROCESS
+        assert len(set(session_ids)) == total, f"{total - len(set(session_ids))} session ids reused"
+
+        user_dir = Path(tmp_dir) / 'users' / USERNAME
+        assert len(list(user_dir.glob('session_*.jsonl'))) == total
+        for session_id in session_ids:
+            _check_log(user_dir / f"session_{session_id}.jsonl", session_id)
+            summary = (user_dir / f"session_{session_id}.txt").read_text(encoding='utf-8')
+            assert f"Messages: {MESSAGES}" in summary
+        assert not list(user_dir.glob('.*.tmp*')), "temporary summary files left behind"
+
+        sessions = SessionManager(config_path).find_sessions(USERNAME)
+        assert len(sessions) == total
+        assert all(s['message_count'] == MESSAGES and s['ended_at'] for s in sessions)
+        print(f"✓ {total} concurrent sessions in {PROCESSES} processes: logs, summaries and catalog intact")
+
+
+if __name__ == '__main__':
+    test_concurrent_sessions_keep_logs_intact()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Test full-text search across session logs"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from tests.conftest import write_config
+from writing_assistant.session_catalog import MATCH_END, MATCH_START
+from writing_assistant.session_manager import SessionManager
+
+
+def _write_log(user_dir: Path, session_id: str, started_at: str, contents) -> None:
+    """Write a finished session log by hand, one user message per content"""
+    user_dir.mkdir(parents=True, exist_ok=True)
+    entries = [{'type': 'session_start', 'timestamp': started_at}]
+    entries += [{'type': 'message', 'timestamp': started_at, 'role': 'user', 'content': c} for c in contents]
+    entries.append({'type': 'session_end', 'timestamp': started_at})
+    with open(user_dir / f"session_{session_id}.jsonl", 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(e, ensure_ascii=False) + '\n' for e in entries)
+
+
+def test_search_ranking_and_filters():
+    """Better matches rank first; user and date filters narrow the results"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir))
+        log_directory = Path(manager.log_directory)
+        _write_log(log_directory / 'alice', '20240301_090000_aaaaaa', '2024-03-01T09:00:00', [
+            "The results section reports the peptide identification rate.",
+            "Peptide peptide peptide: identification of every peptide.",
+        ])
+        _write_log(log_directory / 'alice', '20240415_090000_bbbbbb', '2024-04-15T09:00:00', [
+            "Shorter abstract about peptide identification and a long discussion of unrelated "
+            "methods, figures, tables, appendices and acknowledgements.",
+        ])
+        _write_log(log_directory / 'bob', '20240320_090000_cccccc', '2024-03-20T09:00:00', [
+            "Café naïve résumé: a peptide identification note.",
+            "Nothing to see here.",
+        ])
+        assert manager.catalog.sync_all() == 3
+
+        results = manager.catalog.search('peptide identification')
+        assert len(results) == 4, results
+        # The message that repeats the term most ranks first
+        assert (results[0]['session_id'], results[0]['seq']) == ('20240301_090000_aaaaaa', 1), results
+        assert MATCH_START + 'peptide' in results[0]['snippet'].lower() and MATCH_END in results[0]['snippet']
+
+        assert {r['username'] for r in manager.catalog.search('peptide', username='bob')} == {'bob'}
+        assert [r['session_id'][-6:] for r in manager.catalog.search('peptide', since='2024-04-01')] == ['bbbbbb']
+        assert {r['session_id'][-6:] for r in manager.catalog.search('peptide', until='2024-03-20')} == \
+            {'aaaaaa', 'cccccc'}
+        assert [r['session_id'][-6:] for r in manager.catalog.search(
+            'peptide', username='alice', since='2024-03-02', until='2024-03-31')] == []
+
+        # Diacritics are folded; every word must match; quotes in the query are plain text
+        assert [r['username'] for r in manager.catalog.search('cafe naive resume')] == ['bob']
+        assert manager.catalog.search('peptide unrelated-word-xyz') == []
+        assert manager.catalog.search('"peptide') and manager.catalog.search('   ') == []
+        assert len(manager.catalog.search('peptide', limit=2)) == 2
+        print("✓ Search ranking and filters")
+
+
+def test_ended_sessions_are_searchable():
+    """A session is in the index once it ends, and reindexing does not duplicate it"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = SessionManager(write_config(tmp_dir))
+        manager.start_session('tester')
+        session_id = manager.session_id
+        manager.add_message('user', "Proofread my zymurgy chapter")
+        manager.add_message('assistant', "Here is the zymurgy chapter, proofread.")
+        assert manager.catalog.search('zymurgy') == []
+        manager.end_session()
+        manager.wait_for_finalize()
+
+        results = manager.catalog.search('zymurgy')
+        assert sorted((r['session_id'], r['seq'], r['role']) for r in results) == \
+            [(session_id, 0, 'user'), (session_id, 1, 'assistant')], results
+
+        manager.catalog.index_log('tester', session_id)
+        assert len(manager.catalog.search('zymurgy')) == 2
+        print("✓ Ended sessions indexed once")
+
+
+def test_sessions_that_never_ended_are_searchable():
+    """--reindex adds the text of a session whose process died before end_session()"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        crashed = SessionManager(config_path)
+        crashed.start_session('tester')
+        crashed.add_message('user', "The zebra paragraph")
+        crashed.add_message('assistant', "The revised zebra paragraph")
+        crashed.log_writer.flush()
+        # The process is gone: end_session() never runs
+
+        manager = SessionManager(config_path)
+        assert manager.catalog.search('zebra') == []
+        assert manager.catalog.sync_all() == 1
+        results = manager.catalog.search('zebra')
+        assert sorted((r['session_id'], r['seq']) for r in results) == \
+            [(crashed.session_id, 0), (crashed.session_id, 1)], results
+
+        # Indexed once: a second sync finds nothing new
+        assert manager.catalog.sync_all() == 0 and len(manager.catalog.search('zebra')) == 2
+        print("✓ Sessions that never ended are searchable after --reindex")
+
+
+if __name__ == '__main__':
+    test_search_ranking_and_filters()
+    test_ended_sessions_are_searchable()
+    test_sessions_that_never_ended_are_searchable()
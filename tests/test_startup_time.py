@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Test that non-inference commands start without importing torch/transformers"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from tests.conftest import ROOT, write_config
+
+
+
+HEAVY_MODULES = ('torch', 'transformers', 'accelerate')
+
+# Wall-clock budget per command, in seconds (override on slow machines)
+STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET_SECONDS', '1.5'))
+
+
+def _run(args):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, 'main.py'] + args, cwd=ROOT, capture_output=True, text=True)
+    return result, time.perf_counter() - started
+
+
+def test_cli_import_is_light():
+    """Importing the CLI does not pull in the inference stack"""
+    code = (
+        "import sys; import writing_assistant.cli; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '', f"Imported at startup: {result.stdout.strip()}"
+    print("✓ writing_assistant.cli imports without torch/transformers")
+
+
+def test_log_commands_within_budget():
+    """list-sessions, view-session, search and summary start within the budget"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = write_config(tmp_dir)
+        commands = [
+            ['list-sessions', '-u', 'nobody', '-c', config_path],
+            ['view-session', '-u', 'nobody', '-s', '20250101_000000', '-c', config_path],
+            ['search', 'paragraph', '-c', config_path],
+            ['summary', '-u', 'nobody', '-s', '20250101_000000', '-c', config_path],
+            ['--help'],
+        ]
+        for args in commands:
+            result, elapsed = _run(args)
+            assert 'Traceback' not in result.stderr, result.stderr
+            assert elapsed < STARTUP_BUDGET, f"{args[0]} took {elapsed:.2f}s (budget {STARTUP_BUDGET}s)"
+            print(f"✓ {args[0]}: {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    test_cli_import_is_light()
+    test_log_commands_within_budget()
@@ -0,0 +1,70 @@
+"""Load the model in a background thread"""
+
+import threading
+import time
+from typing import Optional
+
+
+class BackgroundModelLoader:
+    """Import the inference stack and load a QWenModelLoader in a thread
+
+    The interactive session starts while the model loads; wait() blocks
+    only for whatever loading is left. stage describes the current step
+    for progress display.
+    """
+
+    def __init__(self, config_path: str = "config.yaml"):
+        """Initialize the loader for a config file"""
+        self.config_path = config_path
+        self.stage = "Waiting to start"
+        self.model_loader = None
+        self.error: Optional[Exception] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start loading"""
+        self.started_at = time.perf_counter()
+        # A daemon thread: quitting during the load must not wait for it
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def wait(self, timeout: Optional[float] = None):
+        """Return the loaded QWenModelLoader, waiting for it; re-raises a load error
+
+        Returns None if timeout expires first.
+        """
+        self._thread.join(timeout)
+        if not self.ready:
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.model_loader
+
+    def _set_stage(self, stage: str) -> None:
+        self.stage = stage
+
+    def _run(self) -> None:
+        try:
+            self.stage = "Importing torch and transformers"
+            from .model_loader import QWenModelLoader
+
+            model_loader = QWenModelLoader(self.config_path)
+            model_loader.load_model(on_progress=self._set_stage)
+            self.model_loader = model_loader
+        except Exception as e:
+            self.error = e
+            self.stage = "Failed"
+        finally:
+            self.finished_at = time.perf_counter()
@@ -2,15 +2,31 @@
 
 import click
 from rich.console import Console
-from rich.markdown import Markdown
+from rich.markup import escape
 from rich.panel import Panel
 from rich.prompt import Prompt
 from rich import print as rprint
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
+import signal
 import sys
-
-from .model_loader import QWenModelLoader
-from .session_manager import SessionManager
+import threading
+
+# Keep module-level imports light: list-sessions, view-session, search and
+# the other log commands must start fast. torch/transformers (model_loader,
+# scheduler, server) and rich's Markdown/Live/Progress are imported inside
+# the functions that use them; tests/test_startup_time.py checks this.
+from .background_loader import BackgroundModelLoader
+from .compaction import SessionCompactor
+from .daemon import ModelDaemon, connect_daemon, daemon_status, get_socket_path, stop_daemon
+from .edit_script import EditScriptError, apply_edits, parse_edits, word_diff
+from .generation_rules import GenerationRules
+from .kv_cache import ConversationCache
+from .prompts import build_system_prompt, mode_submodes
+from .session_catalog import MATCH_END, MATCH_START
+from .session_manager import SessionManager, valid_username
+from .speculation import use_prompt_lookup
 
 
 console = Console()
@@ -22,41 +38,113 @@ class WritingAssistant:
     def __init__(self, config_path: str = "config.yaml"):
         """Initialize the writing assistant"""
         self.config_path = config_path
-        self.model_loader = None
+        self.model_loader = None  # Set once the model is loaded (or the daemon attached)
+        self.background_loader = None
         self.session_manager = None
         self.system_prompt = None
         self.running = False
         self.mode_name = None
-        self.nuno_submode = None  # Track !outline or !proofread
+        self.nuno_submode = None  # Track !outline, !proofread or !edits
         self.mode_config = None  # Store loaded mode config
+        self.conversation_cache = ConversationCache()  # KV states reused across turns
+        self.compactor = None  # Summarizes old turns between turns when enabled
 
     def initialize(self, username: str, custom_instructions: str = None):
         """Initialize the assistant with model and session"""
         console.print("\n[bold blue]Initializing Writing Assistant...[/bold blue]\n")
 
-        # Initialize model loader
-        console.print("[cyan]Loading model...[/cyan]")
-        self.model_loader = QWenModelLoader(self.config_path)
-        self.model_loader.load_model()
-
-        # Display model and device info
-        model_name = self.model_loader.model_config['name']
-        device = self.model_loader.device
-        console.print(f"[green]✓ Model loaded: {model_name}[/green]")
-        console.print(f"[green]✓ Device: {device.upper()}[/green]")
-
-        # Get system prompt
-        self.system_prompt = self.model_loader.get_system_prompt(custom_instructions)
+        # Attach to a running model daemon, or start loading the model in-process.
+        # The load runs in the background while the session starts and the user
+        # types; _ensure_model() waits for whatever is left before the first reply.
+        daemon_loader = connect_daemon(self.config_path)
+        if daemon_loader is None:
+            self.background_loader = BackgroundModelLoader(self.config_path)
+            self.background_loader.start()
+            console.print("[cyan]Loading model in the background...[/cyan]")
 
         # Initialize session manager
         self.session_manager = SessionManager(self.config_path)
-        log_file = self.session_manager.start_session(username, custom_instructions)
+        log_file = self.session_manager.start_session(username, custom_instructions, mode=self.mode_name)
+        self.system_prompt = self._build_system_prompt(custom_instructions)
 
         console.print(f"[green]✓ Session started for user: {username}[/green]")
         console.print(f"[dim]Log file: {log_file}[/dim]\n")
 
+        if daemon_loader is not None:
+            console.print(f"[cyan]Attached to model daemon (pid {daemon_loader.daemon_pid})[/cyan]")
+            self._on_model_ready(daemon_loader)
+
         self.running = True
 
+    def _build_system_prompt(self, custom_instructions: str = None) -> str:
+        """Build the system prompt from the config, without needing the model"""
+        return build_system_prompt(self.session_manager.config['prompts'], custom_instructions)
+
+    def _on_model_ready(self, model_loader):
+        """Finish the setup that needs the model: token budget, prompt cache and compaction"""
+        self.model_loader = model_loader
+        console.print(f"[green]✓ Model loaded: {model_loader.model_config['name']}[/green]")
+        console.print(f"[green]✓ Device: {model_loader.device.upper()}[/green]")
+        self.compactor = SessionCompactor(model_loader, self.session_manager)
+        self._apply_system_prompt()
+
+    def _ensure_model(self) -> bool:
+        """Wait for the background model load to finish, showing its progress
+
+        Returns False if the load failed: the error is shown once and the
+        session ends, since no reply can be generated without the model.
+        """
+        if self.model_loader is not None:
+            return True
+
+        loader = self.background_loader
+        if loader is None:
+            return False
+        try:
+            if not loader.ready:
+                with console.status("") as status:
+                    while not loader.ready:
+                        status.update(f"[cyan]Loading model: {loader.stage} ({loader.elapsed:.0f}s)[/cyan]")
+                        loader.wait(timeout=0.2)
+            model_loader = loader.wait()
+        except Exception as e:
+            console.print(f"\n[red]Error: the model could not be loaded: {str(e)}[/red]")
+            console.print("[yellow]Check model.name in the config file[/yellow]")
+            self.background_loader = None
+            self.shutdown()
+            return False
+
+        self._on_model_ready(model_loader)
+        return True
+
+    def _show_loading_progress(self):
+        """Before a prompt, tell the user the model is still loading (or has finished)"""
+        if self.model_loader is not None or self.background_loader is None:
+            return
+        if self.background_loader.ready:
+            self._ensure_model()
+        else:
+            console.print(
+                f"[dim]Model loading in the background: {self.background_loader.stage} "
+                f"({self.background_loader.elapsed:.0f}s) - you can type already[/dim]"
+            )
+
+    def _apply_system_prompt(self):
+        """Reset the conversation cache for the current system prompt
+
+        The token budget and prompt cache need the model; until it is loaded
+        this only resets the cache and _on_model_ready() applies the rest.
+        A summary still running in the background is waited for first: it
+        works on the history that the new budget may trim, and it may be
+        using the model (or the daemon connection) right now.
+        """
+        self._wait_for_compaction()
+        self.conversation_cache.reset()
+        if self.model_loader is None:
+            return
+        self.session_manager.set_token_budget(self.model_loader.count_tokens, self.system_prompt)
+        self._prime_prefix_cache()
+
     def run_interactive_session(self):
         """Run the interactive chat session"""
         # Check if a mode is being used
@@ -72,6 +160,7 @@ class WritingAssistant:
                     "\n[dim]Nuno Commands:[/dim]\n"
                     "  [yellow]!outline[/yellow]   - Paper outline drafting\n"
                     "  [yellow]!proofread[/yellow] - Writing improvement\n"
+                    "  [yellow]!edits[/yellow]     - Proofreading as a list of edits, shown as a diff\n"
                 )
 
         console.print(Panel.fit(
@@ -95,6 +184,10 @@ class WritingAssistant:
 
         while self.running:
             try:
+                self._show_loading_progress()
+                if not self.running:
+                    break
+
                 # Get user input
                 user_input = Prompt.ask("\n[bold green]You[/bold green]")
 
@@ -106,7 +199,10 @@ class WritingAssistant:
                     self.shutdown()
                     break
                 elif user_input.lower() == '/clear':
-                    self.session_manager.conversation_history = []
+                    # A summary still being written works on the history about to be cleared
+                    self._wait_for_compaction()
+                    self.session_manager.clear_history()
+                    self.conversation_cache.reset()
                     console.print("[yellow]Conversation history cleared[/yellow]")
                     continue
                 elif user_input.lower() == '/help':
@@ -126,6 +222,15 @@ class WritingAssistant:
                 elif user_input.lower() == '!proofread':
                     self.activate_nuno_submode('proofread')
                     continue
+                elif user_input.lower() == '!edits':
+                    self.activate_nuno_submode('edits')
+                    continue
+
+                # Wait for whatever is left of the model load, and for a summary
+                # started after the last turn, before using the model
+                if not self._ensure_model():
+                    break
+                self._wait_for_compaction()
 
                 # Add user message to history
                 self.session_manager.add_message("user", user_input)
@@ -136,17 +241,23 @@ class WritingAssistant:
                 ]
                 messages.extend(self.session_manager.get_conversation_history())
 
-                # Generate response
-                console.print("\n[bold cyan]Assistant[/bold cyan] [dim](thinking...)[/dim]", end="\r")
-                response = self.model_loader.generate_response(messages)
+                # Stream the response; only tokens past the cached prefix are prefilled.
+                # If add_message trimmed the history (by message count or token
+                # budget), the prefix no longer matches
+                # and the cache is cropped back to the system prompt.
+                console.print("\n[bold cyan]Assistant:[/bold cyan]\n")
+                response = self._stream_response(messages, **self._generation_options(user_input))
+                metadata = dict(self.model_loader.last_generation_stats)
 
-                # Clear the "thinking" line and display response
-                console.print(" " * 50, end="\r")
-                console.print(f"[bold cyan]Assistant:[/bold cyan]\n")
-                console.print(Markdown(response))
+                # In edits mode the reply is an edit script applied to the user's text
+                if self.nuno_submode == 'edits' and metadata.get('stop_reason') != 'cancelled':
+                    metadata.update(self._show_edits(user_input, response))
 
                 # Add assistant message to history
-                self.session_manager.add_message("assistant", response)
+                self.session_manager.add_message("assistant", response, metadata=metadata)
+
+                # Summarize the oldest turns while the user reads and types
+                self.compactor.maybe_start()
 
             except KeyboardInterrupt:
                 console.print("\n\n[yellow]Interrupted by user[/yellow]")
@@ -156,6 +267,122 @@ class WritingAssistant:
                 console.print(f"\n[red]Error: {str(e)}[/red]")
                 console.print("[yellow]Session will continue. Type /quit to exit.[/yellow]")
 
+    def _generation_options(self, text: str, submode: Optional[str] = None) -> dict:
+        """Token budget, stop strings and decoding for a reply to text in the current mode
+
+        The budget and mode stop strings come from the mode file's generation
+        section (see GenerationRules); replies that mostly copy the input
+        (proofreading, long pasted text) use prompt lookup.
+        """
+        submode = submode or self.nuno_submode
+        mode = f"{self.mode_name}:{submode}" if submode else self.mode_name
+        model_config = self.model_loader.model_config
+        rules = GenerationRules(self.mode_config, submode, model_config['max_length'])
+        count_input_tokens = lru_cache(maxsize=None)(lambda: self.model_loader.count_tokens(text))
+
+        return {
+            'max_length': rules.max_new_tokens(text, count_input_tokens),
+            'stop_strings': list(model_config.get('stop_strings') or []) + rules.stop_strings,
+            'prompt_lookup': use_prompt_lookup(model_config.get('prompt_lookup'), mode, count_input_tokens)
+        }
+
+    def _stream_response(self, messages: list, use_cache: bool = True, **options) -> str:
+        """Render the response incrementally as it is generated and return the full text
+
+        options (max_length, stop_strings, prompt_lookup) are passed on to the
+        model; use_cache=False generates outside the conversation (no KV
+        cache reuse). Ctrl-C during generation only cancels this response:
+        the text generated so far is returned and the model stays loaded.
+        """
+        from rich.live import Live
+        from rich.markdown import Markdown
+
+        response = ""
+        cancel = threading.Event()
+        previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: cancel.set())
+        try:
+            with Live(Markdown("*(thinking...)*"), console=console, refresh_per_second=8,
+                      vertical_overflow="visible") as live:
+                cache = self.conversation_cache if use_cache else None
+                for chunk in self.model_loader.generate_response_stream(
+                    messages, cache=cache, cancel_event=cancel, **options
+                ):
+                    response += chunk
+                    live.update(Markdown(response))
+
+                # The stop string itself was streamed; take it back out
+                stop_string = self.model_loader.last_generation_stats.get('stop_string')
+                if stop_string and stop_string in response:
+                    response = response[:response.index(stop_string)]
+                    live.update(Markdown(response))
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+
+        stop_reason = self.model_loader.last_generation_stats.get('stop_reason')
+        if stop_reason == 'cancelled':
+            console.print("[yellow]Response cancelled; the partial reply is kept[/yellow]")
+        elif stop_reason == 'timeout':
+            console.print(f"[yellow]Response stopped after model.turn_timeout "
+                          f"({self.model_loader.model_config.get('turn_timeout')}s)[/yellow]")
+
+        if self.session_manager.ui_config.get('show_generation_stats', True):
+            stats = self.model_loader.last_generation_stats
+            line = (
+                f"first token {stats['time_to_first_token']:.2f}s · "
+                f"{stats['new_tokens']} tokens · {stats['tokens_per_second']:.1f} tok/s"
+            )
+            if stats.get('stop_reason') not in (None, 'eos', 'cancelled', 'timeout'):
+                line += f" · stopped: {stats['stop_reason'].replace('_', ' ')}"
+            if 'acceptance_rate' in stats:
+                source = "prompt lookup" if stats['decoding'] == 'prompt_lookup' else "drafts"
+                line += f" · {stats['acceptance_rate']:.0%} {source} accepted"
+                if 'speedup' in stats:
+                    line += f" · ~{stats['speedup']:.1f}x"
+            console.print(f"[dim]{line}[/dim]")
+            if stats.get('draft_dropped'):
+                threshold = self.model_loader.model_config.get('draft_min_acceptance', 0.3)
+                console.print(f"[dim]Draft model dropped: under {threshold:.0%} of its tokens "
+                              f"accepted in recent replies[/dim]")
+
+        return response.strip()
+
+    def _show_edits(self, text: str, script: str) -> dict:
+        """Apply an edit script to the user's text and show the result as a word diff
+
+        If the script cannot be parsed or applied, the text is rewritten in
+        full with the proofread prompt instead. Returns metadata for the log.
+        """
+        from rich.text import Text
+
+        try:
+            edits = parse_edits(script)
+            revised = apply_edits(text, edits)
+        except EditScriptError as e:
+            console.print(f"\n[yellow]Edits could not be applied ({escape(str(e))}); rewriting the full text[/yellow]\n")
+            messages = [
+                {"role": "system", "content": self._build_system_prompt(self.mode_config.get('proofread', ''))},
+                {"role": "user", "content": text}
+            ]
+            revised = self._stream_response(messages, use_cache=False, **self._generation_options(text, 'proofread'))
+            return {
+                'edit_script': 'fallback',
+                'edit_error': str(e),
+                'revised': revised,
+                'rewrite': self.model_loader.last_generation_stats
+            }
+
+        if not edits:
+            console.print("\n[green]No changes needed[/green]")
+            return {'edit_script': 'applied', 'edits': 0}
+
+        styles = {'equal': '', 'delete': 'red strike', 'insert': 'bold green'}
+        diff = Text()
+        for tag, segment in word_diff(text, revised):
+            diff.append(segment, style=styles[tag])
+        console.print(Panel(diff, title=f"{len(edits)} edits", border_style="dim", expand=False))
+        console.print(Panel(Text(revised), title="Revised text", border_style="green", expand=False))
+        return {'edit_script': 'applied', 'edits': len(edits), 'revised': revised}
+
     def switch_mode(self, mode_name: str):
         """Switch to a different writing mode during the session"""
         mode_file = Path(f"prompts/{mode_name}.yaml")
@@ -174,13 +401,14 @@ class WritingAssistant:
                 mode_instructions = mode_config.get('custom_instructions', '')
 
             # Update system prompt
-            self.system_prompt = self.model_loader.get_system_prompt(mode_instructions)
+            self.system_prompt = self._build_system_prompt(mode_instructions)
             self.mode_name = mode_name
             self.nuno_submode = None  # Reset submode
+            self.session_manager.set_mode(mode_name)
 
             # Clear conversation history to avoid confusion with different modes
-            old_history_count = len(self.session_manager.conversation_history)
-            self.session_manager.conversation_history = []
+            old_history_count = self.session_manager.clear_history()
+            self._apply_system_prompt()
 
             console.print(f"\n[green]✓ Switched to mode: {mode_name}[/green]")
             console.print(f"[dim]Previous conversation history cleared ({old_history_count} messages)[/dim]")
@@ -191,6 +419,7 @@ class WritingAssistant:
                 console.print("Available commands:")
                 console.print("  • [yellow]!outline[/yellow] - Paper outline drafting mode")
                 console.print("  • [yellow]!proofread[/yellow] - Writing improvement mode")
+                console.print("  • [yellow]!edits[/yellow] - Proofreading as a list of edits")
                 console.print("  • General writing help and questions\n")
             else:
                 console.print(f"\n[cyan]{mode_name.title()} mode activated[/cyan]\n")
@@ -199,10 +428,10 @@ class WritingAssistant:
             console.print(f"[red]Error loading mode: {str(e)}[/red]")
 
     def activate_nuno_submode(self, submode: str):
-        """Activate outline or proofread submode in nuno-writing-style"""
+        """Activate the outline, proofread or edits submode in nuno-writing-style"""
         # Check if we're in nuno mode
         if self.mode_name != 'nuno-writing-style':
-            console.print(f"[red]✗ Commands !outline and !proofread only work in nuno-writing-style mode[/red]")
+            console.print(f"[red]✗ Commands !outline, !proofread and !edits only work in nuno-writing-style mode[/red]")
             console.print("[yellow]Use /nuno to switch to nuno-writing-style mode first[/yellow]")
             return
 
@@ -218,12 +447,13 @@ class WritingAssistant:
             return
 
         # Update system prompt with submode instructions
-        self.system_prompt = self.model_loader.get_system_prompt(submode_prompt)
+        self.system_prompt = self._build_system_prompt(submode_prompt)
         self.nuno_submode = submode
+        self.session_manager.set_mode(f"{self.mode_name}:{submode}")
 
         # Clear conversation history for clean slate
-        old_history_count = len(self.session_manager.conversation_history)
-        self.session_manager.conversation_history = []
+        old_history_count = self.session_manager.clear_history()
+        self._apply_system_prompt()
 
         # Show activation message
         if submode == 'outline':
@@ -238,9 +468,48 @@ class WritingAssistant:
             console.print("\n[cyan]✏️  Writing Improvement & Proofreading[/cyan]")
             console.print("Paste your text and I'll improve grammar, style, and clarity.")
             console.print("You can request: 'grammar only', 'style only', or comprehensive revision.\n")
+        elif submode == 'edits':
+            console.print(f"\n[green]✓ Activated: PROOFREAD EDITS MODE[/green]")
+            console.print(f"[dim]Previous conversation history cleared ({old_history_count} messages)[/dim]")
+            console.print("\n[cyan]✏️  Proofreading as Edits[/cyan]")
+            console.print("Paste your text: I'll list the edits, apply them and show the changes as a diff.")
+            console.print("If the edits cannot be applied, the text is rewritten in full instead.\n")
+
+    def _wait_for_compaction(self):
+        """Wait for a background summary of old turns, showing a spinner if it is still running"""
+        if self.compactor is None:
+            return
+        if self.compactor.running:
+            with console.status("[dim]Compacting session memory...[/dim]"):
+                self.compactor.wait()
+        else:
+            self.compactor.wait()
+        if self.compactor.error is not None:
+            console.print(f"[dim]Session compaction skipped: {str(self.compactor.error)}[/dim]")
+            self.compactor.error = None
+
+    def _prime_prefix_cache(self):
+        """Load the stored system-prompt KV states for the current mode into the conversation cache"""
+        self._wait_for_compaction()
+        try:
+            hit = self.model_loader.prime_cache(
+                self.conversation_cache,
+                self.system_prompt,
+                self.mode_name,
+                self.nuno_submode
+            )
+        except Exception as e:
+            self.conversation_cache.reset()
+            console.print(f"[dim]Prompt cache unavailable: {str(e)}[/dim]")
+            return
+
+        if not hit:
+            console.print("[dim]System prompt cached for this mode[/dim]")
 
     def show_help(self):
         """Show help information"""
+        from rich.markdown import Markdown
+
         help_text = """
         ## Available Commands
 
@@ -254,12 +523,14 @@ class WritingAssistant:
         **Nuno Mode Commands** (only in nuno-writing-style mode):
         - `!outline` - Activate paper outline drafting mode
         - `!proofread` - Activate writing improvement mode
+        - `!edits` - Proofread with a list of edits, shown as a diff (faster for long text)
 
         ## What I Can Do
 
         **For Nuno Writing Style Mode:**
         - **!outline**: Create comprehensive paper outlines with detailed section guidance
         - **!proofread**: Improve writing (grammar, style, clarity, conciseness)
+        - **!edits**: Same improvements, returned as edits that are applied to your text and shown as a diff
         - General writing questions and academic writing guidance
 
         **For All Modes:**
@@ -301,10 +572,14 @@ class WritingAssistant:
         """Shutdown the assistant gracefully"""
         console.print("\n[yellow]Shutting down...[/yellow]")
 
+        if self.compactor:
+            self.compactor.wait()
+
         if self.session_manager:
             self.session_manager.end_session()
             console.print("[green]✓ Session saved[/green]")
 
+        self.conversation_cache.reset()
         if self.model_loader:
             self.model_loader.unload_model()
 
@@ -331,6 +606,11 @@ def start(username: str, instructions: str, mode: str, config: str):
         console.print("[yellow]Please create a config.yaml file first.[/yellow]")
         sys.exit(1)
 
+    if not valid_username(username):
+        console.print(f"[red]Error: Invalid username: {username}[/red]")
+        console.print("[yellow]Use letters, digits, '_', '-' and '.' (not starting with '.').[/yellow]")
+        sys.exit(1)
+
     # Handle built-in mode
     mode_config_data = None
     if mode:
@@ -362,11 +642,20 @@ def start(username: str, instructions: str, mode: str, config: str):
 
 @cli.command()
 @click.option('--username', '-u', required=True, help='Username to list sessions for')
+@click.option('--mode', '-m', help='Only sessions in this mode (e.g., academic, nuno-writing-style:proofread)')
+@click.option('--since', help='Only sessions started on or after this date (YYYY-MM-DD)')
+@click.option('--until', help='Only sessions started on or before this date (YYYY-MM-DD)')
+@click.option('--sort', type=click.Choice(['newest', 'oldest', 'messages']), default='newest', help='Sort order')
+@click.option('--limit', '-n', type=int, default=50, help='Sessions per page (default: 50)')
+@click.option('--page', '-p', type=int, default=1, help='Page number')
 @click.option('--config', '-c', default='config.yaml', help='Path to config file')
-def list_sessions(username: str, config: str):
-    """List all sessions for a user"""
+def list_sessions(username: str, mode: str, since: str, until: str, sort: str, limit: int, page: int, config: str):
+    """List sessions for a user"""
     session_manager = SessionManager(config)
-    sessions = session_manager.list_user_sessions(username)
+    sessions = session_manager.find_sessions(
+        username, mode=mode, since=since, until=until, sort=sort,
+        limit=limit, offset=(max(page, 1) - 1) * limit
+    )
 
     if not sessions:
         console.print(f"[yellow]No sessions found for user: {username}[/yellow]")
@@ -374,15 +663,25 @@ def list_sessions(username: str, config: str):
 
     console.print(f"\n[bold]Sessions for {username}:[/bold]\n")
     for session in sessions:
-        console.print(f"  • {session}")
+        started = (session['started_at'] or '')[:16].replace('T', ' ')
+        details = f"{started}  {session['message_count'] or 0} messages"
+        if not session['ended_at']:
+            details += " (open)"
+        if session['mode']:
+            details += f"  [yellow]{session['mode']}[/yellow]"
+        console.print(f"  • session_{session['session_id']}  [dim]{details}[/dim]")
+    if len(sessions) == limit:
+        console.print(f"\n[dim]More sessions: --page {max(page, 1) + 1}[/dim]")
     console.print()
 
 
 @cli.command()
 @click.option('--username', '-u', required=True, help='Username')
 @click.option('--session-id', '-s', required=True, help='Session ID to view')
+@click.option('--start', type=int, default=0, help='First message to show (negative counts from the end)')
+@click.option('--count', '-n', type=int, help='Number of messages to show')
 @click.option('--config', '-c', default='config.yaml', help='Path to config file')
-def view_session(username: str, session_id: str, config: str):
+def view_session(username: str, session_id: str, start: int, count: int, config: str):
     """View a previous session"""
     session_manager = SessionManager(config)
 
@@ -391,7 +690,7 @@ def view_session(username: str, session_id: str, config: str):
         if session_id.startswith('session_'):
             session_id = session_id[8:]
 
-        messages = session_manager.load_session_history(username, session_id)
+        messages = session_manager.load_session_history(username, session_id, start, count)
 
         console.print(f"\n[bold]Session: {session_id}[/bold]")
         console.print(f"[dim]User: {username}[/dim]\n")
@@ -416,5 +715,311 @@ def view_session(username: str, session_id: str, config: str):
         sys.exit(1)
 
 
+@cli.command()
+@click.option('--username', '-u', help='Only archive this user\'s sessions (default: all users)')
+@click.option('--older-than', type=int, default=30, help='Archive sessions that ended more than this many days ago')
+@click.option('--keep-summaries', is_flag=True, help='Keep the .txt summaries of archived sessions')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def archive(username: str, older_than: int, keep_summaries: bool, config: str):
+    """Pack old sessions into compressed monthly archives
+
+    Archived sessions still show up in list-sessions, view-session and
+    search; their summaries can be printed with the summary command.
+    """
+    session_manager = SessionManager(config)
+    with console.status("[cyan]Archiving sessions...[/cyan]"):
+        stats = session_manager.archive_sessions(older_than, username, keep_summaries)
+
+    if not stats['sessions']:
+        console.print(f"[yellow]No sessions older than {older_than} days to archive[/yellow]")
+        return
+    console.print(
+        f"[green]✓ Archived {stats['sessions']} sessions[/green] "
+        f"[dim]({stats['bytes_before'] / 1024:.0f} KB → {stats['bytes_after'] / 1024:.0f} KB)[/dim]"
+    )
+
+
+@cli.command()
+@click.option('--username', '-u', required=True, help='Username')
+@click.option('--session-id', '-s', required=True, help='Session ID')
+@click.option('--output', '-o', help='Write the summary to this file instead of printing it')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def summary(username: str, session_id: str, output: str, config: str):
+    """Print the text summary of a session, rendered from its (possibly archived) log"""
+    session_manager = SessionManager(config)
+    if session_id.startswith('session_'):
+        session_id = session_id[8:]
+
+    try:
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                session_manager.write_summary(username, session_id, f)
+            console.print(f"[green]✓ Summary written to {output}[/green]")
+        else:
+            session_manager.write_summary(username, session_id, sys.stdout)
+    except FileNotFoundError as e:
+        console.print(f"[red]Error: {str(e)}[/red]")
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--username', '-u', help='Only this user\'s sessions (default: all users)')
+@click.option('--workers', '-w', type=int, help='Parallel worker processes (default: CPU count)')
+@click.option('--missing-only', is_flag=True, help='Skip sessions whose summary is up to date')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def rebuild_summaries(username: str, workers: int, missing_only: bool, config: str):
+    """Regenerate the .txt summaries of sessions from their JSONL logs"""
+    from rich.progress import Progress, BarColumn, MofNCompleteColumn, TextColumn, TimeElapsedColumn
+
+    session_manager = SessionManager(config)
+    jobs = session_manager.find_summary_jobs(username, missing_only)
+    if not jobs:
+        console.print("[yellow]No summaries to rebuild[/yellow]")
+        return
+
+    with Progress(
+        TextColumn("[cyan]Summaries[/cyan]"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        console=console
+    ) as progress:
+        task = progress.add_task("summaries", total=len(jobs))
+        written = session_manager.rebuild_summaries(
+            jobs, workers,
+            on_progress=lambda n: progress.update(task, advance=n)
+        )
+
+    console.print(f"[green]✓ Wrote {written} summaries[/green]")
+
+
+@cli.command()
+@click.argument('query')
+@click.option('--username', '-u', help='Only search this user\'s sessions')
+@click.option('--since', help='Only messages written on or after this date (YYYY-MM-DD)')
+@click.option('--until', help='Only messages written on or before this date (YYYY-MM-DD)')
+@click.option('--limit', '-n', type=int, default=20, help='Maximum number of results (default: 20)')
+@click.option('--reindex', is_flag=True, help='Index sessions missing from the search index, or never ended, first')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def search(query: str, username: str, since: str, until: str, limit: int, reindex: bool, config: str):
+    """Search the messages of all sessions"""
+    import time
+
+    session_manager = SessionManager(config)
+    if reindex:
+        with console.status("[cyan]Indexing session logs...[/cyan]"):
+            added = session_manager.catalog.sync_all()
+        console.print(f"[green]✓ Indexed {added} sessions[/green]")
+
+    started = time.perf_counter()
+    results = session_manager.catalog.search(query, username=username, since=since, until=until, limit=limit)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if not results:
+        console.print(f"[yellow]No messages found for: {query}[/yellow] [dim]({elapsed_ms:.1f} ms)[/dim]")
+        return
+
+    console.print(f"\n[bold]{len(results)} results for \"{escape(query)}\"[/bold] [dim]({elapsed_ms:.1f} ms)[/dim]\n")
+    for result in results:
+        snippet = escape(result['snippet'].replace('\n', ' '))
+        snippet = snippet.replace(MATCH_START, '[bold yellow]').replace(MATCH_END, '[/bold yellow]')
+        console.print(
+            f"[cyan]{result['username']}[/cyan] session_{result['session_id']} "
+            f"[dim]message {result['seq']} · {result['role']} · {(result['timestamp'] or '')[:16].replace('T', ' ')}[/dim]"
+        )
+        console.print(f"  {snippet}\n")
+    console.print(f"[dim]View with: python main.py view-session -u <user> -s <session> --start <message>[/dim]\n")
+
+
+@cli.command()
+@click.option('--mode', '-m', default='nuno-writing-style', help='Mode whose prompt is used (default: nuno-writing-style)')
+@click.option('--submode', default='proofread', help='Submode prompt within the mode file (default: proofread)')
+@click.option('--input', '-i', 'input_path', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Document to proofread (Markdown or plain text)')
+@click.option('--output', '-o', 'output_path', required=True, help='Where to write the revised document')
+@click.option('--batch-size', '-b', type=int, help='Paragraphs per generate call (default: model.batch_size)')
+@click.option('--refresh', is_flag=True, help='Regenerate all paragraphs instead of reusing earlier results')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def proofread(mode: str, submode: str, input_path: str, output_path: str, batch_size: int, refresh: bool, config: str):
+    """Proofread a whole document paragraph by paragraph
+
+    Paragraphs proofread before with the same prompt, model and generation
+    settings are reused, so a re-run only sends changed paragraphs.
+    """
+    if not Path(config).exists():
+        console.print(f"[red]Error: Config file not found: {config}[/red]")
+        sys.exit(1)
+
+    mode_file = Path(f"prompts/{mode}.yaml")
+    if not mode_file.exists():
+        console.print(f"[red]Error: Mode file not found: {mode_file}[/red]")
+        console.print(f"[yellow]Available modes: nuno-writing-style, academic, creative, business[/yellow]")
+        sys.exit(1)
+
+    import yaml
+    from rich.progress import Progress, BarColumn, MofNCompleteColumn, TextColumn, TimeElapsedColumn
+    from .proofread_store import ProofreadStore
+    from .proofreader import DocumentProofreader, document_prompt
+
+    with open(mode_file, 'r') as f:
+        mode_config = yaml.safe_load(f)
+
+    from .model_loader import QWenModelLoader
+
+    # Modes without submodes fall back to their general instructions
+    if submode in mode_submodes(mode_config):
+        mode_instructions = mode_config[submode]
+    else:
+        mode_instructions = mode_config.get('custom_instructions', '')
+
+    model_loader = QWenModelLoader(config)
+    model_loader.load_model()
+    system_prompt = model_loader.get_system_prompt(document_prompt(mode_instructions))
+    # Per-paragraph budgets and stop strings, as for a proofread turn in the chat
+    rules = GenerationRules(mode_config, submode, model_loader.model_config['max_length'])
+
+    store = ProofreadStore(
+        model_loader.config['session']['log_directory'],
+        system_prompt,
+        model_loader.model_config,
+        rules.rules
+    )
+    proofreader = DocumentProofreader(model_loader, system_prompt, batch_size, store=store, refresh=refresh,
+                                      rules=rules)
+    total = proofreader.count_paragraphs(input_path)
+    console.print(f"\n[cyan]Proofreading {total} paragraphs from {input_path} "
+                  f"(mode: {mode}, batch size: {proofreader.batch_size})[/cyan]\n")
+
+    with Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        console=console
+    ) as progress:
+        task = progress.add_task("Proofreading", total=total)
+        stats = proofreader.proofread_file(
+            input_path,
+            output_path,
+            on_progress=lambda done: progress.advance(task, done)
+        )
+
+    padding = stats['padding_tokens'] / max(stats['prompt_tokens'] + stats['padding_tokens'], 1)
+    console.print(f"[green]✓ Revised document written to {output_path}[/green]")
+    console.print(
+        f"[dim]{stats['paragraphs']} paragraphs ({stats['words']} words, {stats['reused']} unchanged) "
+        f"in {stats['total_time']:.1f}s · "
+        f"{stats['paragraphs_per_second']:.2f} paragraphs/s · {stats['new_tokens']} tokens generated · "
+        f"{stats['tokens_per_second']:.1f} tok/s · {padding:.0%} padding[/dim]\n"
+    )
+    cut_short = {reason: count for reason, count in stats['stop_reasons'].items()
+                 if reason in ('repetition', 'max_new_tokens')}
+    if cut_short:
+        console.print(f"[yellow]Paragraphs cut short: "
+                      f"{', '.join(f'{count} ({reason})' for reason, count in cut_short.items())}[/yellow]\n")
+    model_loader.unload_model()
+
+
+@cli.command()
+@click.option('--host', default=None, help='Address to bind (default: server.host or 127.0.0.1)')
+@click.option('--port', '-p', type=int, default=None, help='Port to listen on (default: server.port or 8000)')
+@click.option('--max-batch-size', type=int, default=None, help='Concurrent sequences per decoding step')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def serve(host: str, port: int, max_batch_size: int, config: str):
+    """Serve an OpenAI-compatible /v1/chat/completions API from one loaded model"""
+    if not Path(config).exists():
+        console.print(f"[red]Error: Config file not found: {config}[/red]")
+        sys.exit(1)
+
+    from .model_loader import QWenModelLoader
+    from .server import ChatService, create_server
+
+    model_loader = QWenModelLoader(config)
+    model_loader.load_model()
+
+    server_config = model_loader.config.get('server', {})
+    host = host or server_config.get('host', '127.0.0.1')
+    port = port or server_config.get('port', 8000)
+
+    service = ChatService(model_loader, config, max_batch_size=max_batch_size)
+    server = create_server(service, host, port)
+
+    console.print(f"[green]✓ Serving {service.model_name} on http://{host}:{port}/v1 "
+                  f"(batch size {service.scheduler.max_batch_size})[/green]")
+    console.print(f"[dim]Modes: {', '.join(sorted(service.modes))}. Press Ctrl-C to stop.[/dim]")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Shutting down server...[/yellow]")
+    finally:
+        server.server_close()
+        service.close()
+        model_loader.unload_model()
+
+
+@cli.group()
+def daemon():
+    """Keep the model loaded in a background daemon that sessions attach to"""
+    pass
+
+
+@daemon.command('start')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def daemon_start(config: str):
+    """Load the model and serve it to CLI sessions until stopped"""
+    if not Path(config).exists():
+        console.print(f"[red]Error: Config file not found: {config}[/red]")
+        sys.exit(1)
+
+    import yaml
+    from .model_loader import QWenModelLoader
+
+    with open(config, 'r') as f:
+        try:
+            socket_path = get_socket_path(yaml.safe_load(f))
+        except RuntimeError as e:
+            console.print(f"[red]Error: {str(e)}[/red]")
+            sys.exit(1)
+
+    model_loader = QWenModelLoader(config)
+    model_loader.load_model()
+
+    console.print(f"[green]✓ Model daemon listening on {socket_path}[/green]")
+    console.print("[dim]Sessions started with 'python main.py start' attach automatically. "
+                  "Stop with 'python main.py daemon stop' or Ctrl-C.[/dim]")
+    try:
+        ModelDaemon(model_loader, socket_path).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        console.print(f"[red]Error: {str(e)}[/red]")
+        sys.exit(1)
+    finally:
+        model_loader.unload_model()
+
+
+@daemon.command('stop')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def daemon_stop(config: str):
+    """Stop the running model daemon"""
+    if stop_daemon(config):
+        console.print("[green]✓ Model daemon stopped[/green]")
+    else:
+        console.print("[yellow]No model daemon is running[/yellow]")
+
+
+@daemon.command('status')
+@click.option('--config', '-c', default='config.yaml', help='Path to config file')
+def daemon_status_command(config: str):
+    """Show whether the model daemon is running"""
+    info = daemon_status(config)
+    if info is None:
+        console.print("[yellow]No model daemon is running[/yellow]")
+        return
+    console.print(f"[green]✓ Model daemon running (pid {info['pid']})[/green]")
+    console.print(f"[dim]Model: {info['model']} on {info['device'].upper()}[/dim]")
+
+
 if __name__ == '__main__':
     cli()
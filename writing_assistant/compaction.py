@@ -0,0 +1,103 @@
+"""Rolling summarization of long conversations"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+
+# System prompt for the summarization step
+SUMMARY_INSTRUCTIONS = """You maintain the memory of a writing session between a user and a writing assistant.
+Summarize the conversation below in a compact form that lets the assistant continue the session.
+Keep the user's goals, requested style and constraints, decisions made, and any text still being worked on.
+Drop greetings, repetition and text that has been finished. Write plain prose, no headings."""
+
+# Prepended to the summary message that replaces the compacted turns
+SESSION_MEMORY_PREFIX = "Session memory (summary of the earlier conversation):\n"
+
+
+def format_transcript(messages: List[Dict[str, str]]) -> str:
+    """Render messages as a plain transcript for the summarizer"""
+    return "\n\n".join(f"{m['role'].upper()}:\n{m['content']}" for m in messages)
+
+
+class SessionCompactor:
+    """Summarize the oldest turns of a session in the background
+
+    When the history grows past session.compaction.trigger_tokens, the
+    oldest messages (all but the last keep_recent) are summarized by the
+    model into a single "session memory" message that replaces them in
+    SessionManager.conversation_history. An earlier summary is folded into
+    the next one, so the prompt stays roughly constant in size. The full
+    transcript stays in the JSONL log.
+
+    Summaries run in a thread between turns; call wait() before the next
+    generation so the model is only used by one caller at a time.
+    """
+
+    def __init__(self, model_loader, session_manager):
+        """Initialize with a loaded model loader and an active session"""
+        self.model_loader = model_loader
+        self.session_manager = session_manager
+        self.config = session_manager.session_config.get('compaction') or {}
+        self.enabled = self.config.get('enabled', False)
+        self.trigger_tokens = self.config.get('trigger_tokens', 8192)
+        self.keep_recent = self.config.get('keep_recent', 6)
+        self.max_summary_tokens = self.config.get('max_summary_tokens', 512)
+        self.error: Optional[Exception] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def needs_compaction(self) -> bool:
+        """Whether the history is over the trigger and has turns to summarize"""
+        if not self.enabled or self.session_manager.token_counter is None:
+            return False
+        history = self.session_manager.conversation_history
+        return (
+            self.session_manager.get_history_tokens() > self.trigger_tokens
+            and len(history) > self.keep_recent + 1
+        )
+
+    def maybe_start(self) -> bool:
+        """Start summarizing in the background if the history needs it"""
+        if self.running or not self.needs_compaction():
+            return False
+
+        history = self.session_manager.conversation_history
+        count = len(history) - self.keep_recent
+        # Keep whole exchanges: the kept part starts with a user message
+        while count < len(history) and history[count]['role'] != 'user':
+            count += 1
+        if count < 2 or count >= len(history):
+            return False
+
+        self.error = None
+        self._thread = threading.Thread(
+            target=self._compact,
+            args=(list(history[:count]),),
+            name="session-compaction",
+            daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def wait(self) -> None:
+        """Block until a running summarization has been applied"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _compact(self, messages: List[Dict[str, str]]) -> None:
+        try:
+            transcript = [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": format_transcript(messages)}
+            ]
+            summary = self.model_loader.generate_response(transcript, max_length=self.max_summary_tokens)
+            if summary:
+                stats: Dict[str, Any] = dict(self.model_loader.last_generation_stats)
+                self.session_manager.compact_history(messages, SESSION_MEMORY_PREFIX + summary, stats)
+        except Exception as e:
+            # Compaction is an optimization; the session continues with the full history
+            self.error = e
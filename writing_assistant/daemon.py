@@ -0,0 +1,408 @@
+"""Long-lived model daemon reachable over a Unix domain socket"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import yaml
+
+from .prompts import build_system_prompt
+
+
+SOCKET_NAME = "writing-assistant.sock"
+
+
+def default_socket_path() -> str:
+    """Return a socket path only this user can reach
+
+    $XDG_RUNTIME_DIR (a per-user 0700 directory) when it is set, otherwise
+    a writing-assistant-<uid> directory created with mode 0700 in the temp
+    directory. Raises RuntimeError if that directory exists but is not a
+    private directory of this user (e.g. created by someone else first).
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir) and os.stat(runtime_dir).st_uid == os.getuid():
+        return os.path.join(runtime_dir, SOCKET_NAME)
+
+    directory = Path(tempfile.gettempdir()) / f"writing-assistant-{os.getuid()}"
+    try:
+        directory.mkdir(mode=0o700)
+    except FileExistsError:
+        pass
+    info = directory.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{directory} is not a private directory of this user; set daemon.socket_path")
+    return str(directory / SOCKET_NAME)
+
+
+def get_socket_path(config: Dict[str, Any]) -> str:
+    """Return the daemon socket path from a loaded config (default: default_socket_path())"""
+    return config.get('daemon', {}).get('socket_path') or default_socket_path()
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    """Return the uid of the process at the other end of a Unix socket, or None where unsupported"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', credentials)[1]
+
+
+def check_peer(sock: socket.socket, socket_path: str) -> None:
+    """Raise PermissionError unless the daemon behind a connected socket runs as this user
+
+    Uses the peer credentials (SO_PEERCRED) where available, otherwise the
+    owner of the socket file.
+    """
+    uid = _peer_uid(sock)
+    if uid is None:
+        uid = os.stat(socket_path).st_uid
+    if uid != os.getuid():
+        raise PermissionError(f"{socket_path} is served by uid {uid}, not by this user")
+
+
+class ModelDaemon:
+    """Keep a QWenModelLoader resident and serve it to CLI sessions
+
+    The protocol is one JSON object per line. Each connection is one CLI
+    session and gets its own conversation cache, so turn-to-turn KV reuse
+    works as it does in-process. Generation is serialized across
+    connections with a lock. A ``cancel`` request, which gets no reply,
+    ends the connection's running generation after the current step.
+    """
+
+    def __init__(self, model_loader, socket_path: str):
+        """Initialize the daemon for a loaded model"""
+        self.model_loader = model_loader
+        self.socket_path = socket_path
+        self.model_lock = threading.Lock()
+        self.server: Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def serve_forever(self) -> None:
+        """Listen on the socket until a shutdown request or KeyboardInterrupt"""
+        if Path(self.socket_path).exists():
+            if _ping(self.socket_path) is not None:
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            # Left over from a daemon that did not exit cleanly
+            try:
+                os.unlink(self.socket_path)
+            except OSError as e:
+                raise RuntimeError(f"Cannot replace {self.socket_path}: {e}")
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                # Sessions carry the user's text: serve only the user running the daemon
+                if _peer_uid(self.request) not in (None, os.getuid()):
+                    return
+                daemon._handle_connection(self.rfile, self.wfile)
+
+        # Create the socket with mode 0600 from the start, not chmod it after bind
+        previous_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(previous_umask)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if Path(self.socket_path).exists():
+                os.unlink(self.socket_path)
+
+    def _read_requests(self, rfile, requests: queue.Queue, cancel: threading.Event) -> None:
+        """Queue the connection's requests, acting on cancel ones at once (runs in a thread)"""
+        try:
+            for line in rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    requests.put(e)
+                    continue
+                if request.get('op') == 'cancel':
+                    cancel.set()
+                    continue
+                if request.get('op') == 'generate':
+                    # A cancel sent before this request belongs to an earlier one
+                    cancel.clear()
+                requests.put(request)
+        except OSError:
+            pass
+        finally:
+            # The client is gone: stop a generation still running for it
+            cancel.set()
+            requests.put(None)
+
+    def _handle_connection(self, rfile, wfile) -> None:
+        from .kv_cache import ConversationCache
+
+        cache = ConversationCache()
+        cancel = threading.Event()
+
+        def send(payload: Dict[str, Any]) -> None:
+            wfile.write((json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8'))
+            wfile.flush()
+
+        # Requests are read in a thread so that a cancel can arrive during generation
+        requests: queue.Queue = queue.Queue()
+        threading.Thread(
+            target=self._read_requests, args=(rfile, requests, cancel), name="daemon-reader", daemon=True
+        ).start()
+
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            try:
+                if isinstance(request, Exception):
+                    raise request
+                op = request.get('op')
+
+                if op == 'ping':
+                    send({
+                        'ok': True,
+                        'model': self.model_loader.model_config['name'],
+                        'device': self.model_loader.device,
+                        'pid': os.getpid()
+                    })
+                elif op == 'prime':
+                    with self.model_lock:
+                        hit = self.model_loader.prime_cache(
+                            cache, request['system_prompt'], request.get('mode'), request.get('submode')
+                        )
+                    send({'ok': True, 'hit': hit})
+                elif op == 'count_tokens':
+                    send({'ok': True, 'tokens': self.model_loader.count_tokens(request['text'])})
+                elif op == 'reset':
+                    cache.reset()
+                    send({'ok': True})
+                elif op == 'generate':
+                    with self.model_lock:
+                        for chunk in self.model_loader.generate_response_stream(
+                            request['messages'],
+                            max_length=request.get('max_length'),
+                            temperature=request.get('temperature'),
+                            top_p=request.get('top_p'),
+                            # One-off generations (summaries, fallbacks) leave the session's cache alone
+                            cache=cache if request.get('use_cache', True) else None,
+                            prompt_lookup=request.get('prompt_lookup', False),
+                            stop_strings=request.get('stop_strings'),
+                            cancel_event=cancel
+                        ):
+                            send({'chunk': chunk})
+                        send({'done': True, 'stats': self.model_loader.last_generation_stats})
+                elif op == 'shutdown':
+                    send({'ok': True})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+                else:
+                    send({'error': f"Unknown operation: {op}"})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                send({'error': str(e)})
+
+
+class DaemonModelLoader:
+    """Client with the QWenModelLoader interface backed by a running ModelDaemon
+
+    The model stays resident in the daemon: load_model() does nothing and
+    unload_model() only closes the connection.
+    """
+
+    def __init__(self, config_path: str = "config.yaml"):
+        """Connect to the daemon named in the config"""
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+
+        self.model_config = self.config['model']
+        self.prompts_config = self.config['prompts']
+        self.socket_path = get_socket_path(self.config)
+        self.last_generation_stats: Dict[str, Any] = {}
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(self.socket_path)
+        try:
+            check_peer(self._sock, self.socket_path)
+        except OSError:
+            self._sock.close()
+            raise
+        self._file = self._sock.makefile('rwb')
+
+        info = self._call({'op': 'ping'})
+        self.device = info['device']
+        self.daemon_pid = info['pid']
+        if info['model'] != self.model_config['name']:
+            self.unload_model()
+            raise RuntimeError(f"Daemon serves a different model: {info['model']}")
+
+    def _send(self, payload: Dict[str, Any]) -> None:
+        self._file.write((json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8'))
+        self._file.flush()
+
+    def _receive(self) -> Dict[str, Any]:
+        line = self._file.readline()
+        if not line:
+            raise RuntimeError("Model daemon closed the connection")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(f"Model daemon error: {reply['error']}")
+        return reply
+
+    def _call(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self._send(payload)
+        return self._receive()
+
+    def load_model(self) -> None:
+        """The daemon already holds the model"""
+
+    def get_system_prompt(self, custom_instructions: Optional[str] = None) -> str:
+        """Get the system prompt with optional custom instructions"""
+        return build_system_prompt(self.prompts_config, custom_instructions)
+
+    def count_tokens(self, text: str) -> int:
+        """Return the number of tokens in a piece of text, counted by the daemon's tokenizer"""
+        return self._call({'op': 'count_tokens', 'text': text})['tokens']
+
+    def prime_cache(self, cache, system_prompt: str, mode: Optional[str] = None,
+                    submode: Optional[str] = None) -> bool:
+        """Seed this connection's daemon-side conversation cache with the system prompt"""
+        return self._call({
+            'op': 'prime',
+            'system_prompt': system_prompt,
+            'mode': mode,
+            'submode': submode
+        })['hit']
+
+    def generate_response_stream(
+        self,
+        messages: list,
+        max_length: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        cache=None,
+        prompt_lookup: bool = False,
+        stop_strings: Optional[List[str]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        """Generate a response in the daemon, yielding text chunks
+
+        The daemon keeps one conversation cache per connection, so the
+        cache argument only selects whether it is used: without one the
+        daemon generates without a cache and keeps the session's intact.
+        Once cancel_event is set, the daemon is asked to stop at the next
+        chunk received.
+        """
+        self._send({
+            'op': 'generate',
+            'messages': messages,
+            'use_cache': cache is not None,
+            'max_length': max_length,
+            'temperature': temperature,
+            'top_p': top_p,
+            'prompt_lookup': prompt_lookup,
+            'stop_strings': stop_strings
+        })
+        cancel_sent = False
+        while True:
+            reply = self._receive()
+            if reply.get('done'):
+                self.last_generation_stats = reply.get('stats', {})
+                return
+            if cancel_event is not None and cancel_event.is_set() and not cancel_sent:
+                self._send({'op': 'cancel'})
+                cancel_sent = True
+            yield reply['chunk']
+
+    def generate_response(self, messages: list, max_length: Optional[int] = None,
+                          temperature: Optional[float] = None, top_p: Optional[float] = None,
+                          cache=None, prompt_lookup: bool = False, stop_strings: Optional[List[str]] = None,
+                          cancel_event: Optional[threading.Event] = None) -> str:
+        """Generate a response in the daemon"""
+        response = ''.join(self.generate_response_stream(
+            messages, max_length, temperature, top_p, cache, prompt_lookup, stop_strings, cancel_event
+        ))
+        stop_string = self.last_generation_stats.get('stop_string')
+        if stop_string and stop_string in response:
+            response = response[:response.index(stop_string)]
+        return response.strip()
+
+    def unload_model(self) -> None:
+        """Detach from the daemon; the model stays loaded there"""
+        try:
+            self._file.close()
+            self._sock.close()
+        except OSError:
+            pass
+        print("Detached from model daemon")
+
+
+def _ping(socket_path: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+    """Return the daemon's ping reply, or None if nothing answers"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            check_peer(sock, socket_path)
+            sock.sendall(b'{"op": "ping"}\n')
+            with sock.makefile('rb') as f:
+                return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def daemon_status(config_path: str = "config.yaml") -> Optional[Dict[str, Any]]:
+    """Return the running daemon's ping reply, or None"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    try:
+        socket_path = get_socket_path(config)
+    except RuntimeError:
+        return None
+    if not Path(socket_path).exists():
+        return None
+    return _ping(socket_path)
+
+
+def stop_daemon(config_path: str = "config.yaml") -> bool:
+    """Ask the running daemon to shut down; returns False if none is running"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    try:
+        socket_path = get_socket_path(config)
+    except RuntimeError:
+        return False
+    if _ping(socket_path) is None:
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        check_peer(sock, socket_path)
+        sock.sendall(b'{"op": "shutdown"}\n')
+        with sock.makefile('rb') as f:
+            f.readline()
+    return True
+
+
+def connect_daemon(config_path: str = "config.yaml") -> Optional[DaemonModelLoader]:
+    """Attach to a running daemon, or return None to fall back to in-process loading"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    # Windows has no Unix domain sockets: sessions always load the model themselves
+    if not config.get('daemon', {}).get('enabled', True) or not hasattr(socket, 'AF_UNIX'):
+        return None
+    try:
+        if not Path(get_socket_path(config)).exists():
+            return None
+        return DaemonModelLoader(config_path)
+    except (OSError, RuntimeError, ValueError):
+        return None
@@ -0,0 +1,107 @@
+"""Edit scripts: proofreading replies as a list of edits applied locally"""
+
+import difflib
+import re
+from typing import List, NamedTuple, Tuple
+
+
+NO_CHANGES = "NO CHANGES"
+
+# 1. "original text" -> "replacement" (reason)
+EDIT_LINE = re.compile(
+    r'^\s*(?:\d+[.)]|[-*])?\s*"(?P<old>.*?)"\s*(?:->|→)\s*"(?P<new>.*?)"\s*(?:\((?P<reason>.*)\))?\s*$'
+)
+
+
+class EditScriptError(ValueError):
+    """An edit script that cannot be parsed or applied to the text"""
+
+
+class Edit(NamedTuple):
+    """Replace the first occurrence of old (after the previous edit) with new"""
+    old: str
+    new: str
+    reason: str = ''
+
+
+def parse_edits(script: str) -> List[Edit]:
+    """Parse a model reply into edits
+
+    Blank lines and a leading or trailing line of prose are tolerated; any
+    other line that is not an edit makes the script invalid, as does a
+    reply with no edits that does not say NO CHANGES.
+    """
+    lines = [line for line in script.strip().splitlines() if line.strip()]
+    if not lines:
+        raise EditScriptError("empty reply")
+    if len(lines) == 1 and lines[0].strip().strip('.').upper() == NO_CHANGES:
+        return []
+
+    edits = []
+    for n, line in enumerate(lines):
+        match = EDIT_LINE.match(line)
+        if match:
+            edits.append(Edit(match['old'], match['new'], (match['reason'] or '').strip()))
+        elif n not in (0, len(lines) - 1):
+            raise EditScriptError(f"unparsable line: {line.strip()[:60]}")
+
+    if not edits:
+        raise EditScriptError("no edits found in the reply")
+    return edits
+
+
+def locate_edits(text: str, edits: List[Edit]) -> List[Tuple[int, int, Edit]]:
+    """Return the (start, end, edit) span of every edit in text
+
+    Edits are expected in reading order: each one is searched for after the
+    previous edit, then anywhere in the text if it occurs exactly once
+    there. Raises EditScriptError for an edit that is not found, is
+    ambiguous, or overlaps another.
+    """
+    spans = []
+    cursor = 0
+    for edit in edits:
+        if not edit.old:
+            raise EditScriptError("edit with an empty original text")
+        start = text.find(edit.old, cursor)
+        if start < 0:
+            if text.count(edit.old) != 1:
+                problem = "not found" if edit.old not in text else "ambiguous"
+                raise EditScriptError(f'original text {problem}: "{edit.old[:60]}"')
+            start = text.find(edit.old)
+        spans.append((start, start + len(edit.old), edit))
+        cursor = start + len(edit.old)
+
+    spans.sort(key=lambda span: span[0])
+    for (_, end, edit), (start, _, _) in zip(spans, spans[1:]):
+        if start < end:
+            raise EditScriptError(f'overlapping edits at "{edit.old[:60]}"')
+    return spans
+
+
+def apply_edits(text: str, edits: List[Edit]) -> str:
+    """Return text with the edits applied; raises EditScriptError if any does not apply"""
+    parts = []
+    position = 0
+    for start, end, edit in locate_edits(text, edits):
+        parts.append(text[position:start])
+        parts.append(edit.new)
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def word_diff(original: str, revised: str) -> List[Tuple[str, str]]:
+    """Return a word-level diff as (tag, text) segments, tag being 'equal', 'delete' or 'insert'"""
+    a = re.split(r'(\s+)', original)
+    b = re.split(r'(\s+)', revised)
+    segments = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            segments.append(('equal', ''.join(a[i1:i2])))
+            continue
+        if i2 > i1:
+            segments.append(('delete', ''.join(a[i1:i2])))
+        if j2 > j1:
+            segments.append(('insert', ''.join(b[j1:j2])))
+    return segments
@@ -0,0 +1,206 @@
+"""Asyncio engine: many concurrent sessions sharing one loaded model"""
+
+import asyncio
+import time
+import weakref
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import yaml
+
+from .generation_rules import GenerationRules
+from .prompts import mode_submodes
+from .scheduler import ContinuousBatchScheduler, GenerationRequest, IncrementalDecoder
+from .session_manager import SessionManager
+
+
+class AsyncGenerationRequest(GenerationRequest):
+    """A GenerationRequest whose tokens are read from an event loop
+
+    The scheduler thread hands tokens over with call_soon_threadsafe, so
+    consumers await them instead of blocking a thread per request.
+    """
+
+    def __init__(self, *args, loop: asyncio.AbstractEventLoop, **kwargs):
+        """Initialize for the event loop that consumes the tokens"""
+        super().__init__(*args, **kwargs)
+        self._loop = loop
+        self._async_tokens: "asyncio.Queue[Optional[int]]" = asyncio.Queue()
+
+    def _push(self, token: Optional[int]) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._async_tokens.put_nowait, token)
+        except RuntimeError:
+            # The event loop is closed: nobody is reading any more
+            self.cancel()
+
+    async def aiter_tokens(self) -> AsyncIterator[int]:
+        """Yield generated token ids until the request finishes"""
+        while True:
+            token = await self._async_tokens.get()
+            if token is None:
+                break
+            yield token
+        if self.error is not None:
+            raise self.error
+
+    async def aiter_text(self, tokenizer) -> AsyncIterator[str]:
+        """Yield decoded text deltas as tokens arrive"""
+        decoder = IncrementalDecoder(tokenizer)
+        async for token in self.aiter_tokens():
+            text = decoder.push(token)
+            if text:
+                yield text
+        text = decoder.flush()
+        if text:
+            yield text
+
+
+class AsyncEngine:
+    """Serve chat turns of many SessionManagers from one QWenModelLoader
+
+    Requests from all sessions go through one ContinuousBatchScheduler,
+    which batches them and lets users take turns for free batch slots.
+    Backpressure comes from two limits (``engine`` in config.yaml):
+    ``max_pending`` requests queued or generating in total and
+    ``max_pending_per_user`` per username; past them, chat() and stream()
+    wait for a slot instead of growing the queue. Turns of one session run
+    one after the other, in call order.
+
+    Usage::
+
+        async with AsyncEngine(model_loader) as engine:
+            reply = await engine.chat(session, "Proofread: ...")
+            async for text in engine.stream(session, "Shorter, please"):
+                print(text, end="")
+
+    The system prompt follows the session's mode (``session.mode``, e.g.
+    ``nuno-writing-style:proofread``) as in the HTTP server, and the reply
+    budget follows the mode's ``generation`` rules. To stop reading a
+    stream early, iterate it inside ``contextlib.aclosing()`` so the request
+    is cancelled right away rather than when the iterator is collected.
+    """
+
+    def __init__(self, model_loader, prompts_dir: str = "prompts", max_batch_size: Optional[int] = None,
+                 max_pending: Optional[int] = None, max_pending_per_user: Optional[int] = None):
+        """Initialize the engine and start the batch scheduler"""
+        self.model_loader = model_loader
+        self.tokenizer = model_loader.tokenizer
+        engine_config = model_loader.config.get('engine', {})
+
+        self.modes: Dict[str, Dict[str, Any]] = {}
+        for mode_file in sorted(Path(prompts_dir).glob("*.yaml")):
+            with open(mode_file, 'r') as f:
+                self.modes[mode_file.stem] = yaml.safe_load(f) or {}
+
+        self.scheduler = ContinuousBatchScheduler(
+            model_loader,
+            max_batch_size or engine_config.get('max_batch_size', 8)
+        )
+        self.scheduler.start()
+
+        self.max_pending_per_user = max_pending_per_user or engine_config.get('max_pending_per_user', 2)
+        self._pending = asyncio.Semaphore(max_pending or engine_config.get('max_pending', 64))
+        self._user_pending: Dict[Optional[str], asyncio.Semaphore] = {}
+        self._session_locks: "weakref.WeakKeyDictionary[SessionManager, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+    async def __aenter__(self) -> "AsyncEngine":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Stop the scheduler, cancelling unfinished requests"""
+        await asyncio.to_thread(self.scheduler.stop)
+
+    def system_prompt(self, session: SessionManager) -> str:
+        """Return the system prompt for the session's mode"""
+        mode, _, submode = (session.mode or '').partition(':')
+        mode_config = self.modes.get(mode, {})
+        key = submode if submode in mode_submodes(mode_config) else 'custom_instructions'
+        instructions = mode_config.get(key) or None
+        return self.model_loader.get_system_prompt(instructions)
+
+    async def generate(self, messages: List[Dict[str, str]], max_new_tokens: Optional[int] = None,
+                       username: Optional[str] = None, stats: Optional[Dict[str, Any]] = None
+                       ) -> AsyncIterator[str]:
+        """Stream the reply to a list of chat messages (system prompt included)
+
+        Waits for a free slot under the pending limits first. Leaving the
+        iteration early cancels the request and frees its batch slot. stats,
+        if given, is filled with generation statistics when the request ends.
+        """
+        model_config = self.model_loader.model_config
+        # Take the user's slot before a shared one, so a user over their limit
+        # does not hold slots that other users could use
+        async with self._user_slots(username), self._pending:
+            request = AsyncGenerationRequest(
+                await asyncio.to_thread(self._tokenize, messages),
+                max_new_tokens=max_new_tokens or model_config['max_length'],
+                temperature=model_config['temperature'],
+                top_p=model_config['top_p'],
+                repetition_penalty=model_config.get('repetition_penalty', 1.1),
+                username=username,
+                messages=messages,
+                loop=asyncio.get_running_loop()
+            )
+            self.scheduler.submit(request)
+            try:
+                async for text in request.aiter_text(self.tokenizer):
+                    yield text
+            finally:
+                request.cancel()
+                if stats is not None:
+                    stats.update({
+                        'prompt_tokens': len(request.prompt_ids),
+                        'new_tokens': len(request.output_ids),
+                        'finish_reason': request.finish_reason or 'cancelled',
+                        'time_to_first_token': round(
+                            (request.first_token_at or time.perf_counter()) - request.submitted_at, 3)
+                    })
+
+    async def stream(self, session: SessionManager, message: str) -> AsyncIterator[str]:
+        """Add a user message to the session and stream the assistant reply
+
+        The reply is added to the session when it ends; a reply cut short
+        (the iteration was left early or the task cancelled) is kept as
+        far as it got.
+        """
+        async with self._session_lock(session):
+            session.add_message("user", message)
+            messages = [{"role": "system", "content": self.system_prompt(session)}]
+            messages.extend(session.get_conversation_history())
+
+            mode, _, submode = (session.mode or '').partition(':')
+            rules = GenerationRules(self.modes.get(mode), submode or None, self.model_loader.model_config['max_length'])
+            max_new_tokens = rules.max_new_tokens(message, lambda: len(self.tokenizer(message)['input_ids']))
+
+            pieces = []
+            stats: Dict[str, Any] = {}
+            try:
+                async with aclosing(self.generate(messages, max_new_tokens, session.username, stats)) as texts:
+                    async for text in texts:
+                        pieces.append(text)
+                        yield text
+            finally:
+                session.add_message("assistant", ''.join(pieces).strip(), metadata=stats)
+
+    async def chat(self, session: SessionManager, message: str) -> str:
+        """Add a user message to the session and return the assistant reply"""
+        return ''.join([text async for text in self.stream(session, message)]).strip()
+
+    def _session_lock(self, session: SessionManager) -> asyncio.Lock:
+        if session not in self._session_locks:
+            self._session_locks[session] = asyncio.Lock()
+        return self._session_locks[session]
+
+    def _user_slots(self, username: Optional[str]) -> asyncio.Semaphore:
+        if username not in self._user_pending:
+            self._user_pending[username] = asyncio.Semaphore(self.max_pending_per_user)
+        return self._user_pending[username]
+
+    def _tokenize(self, messages: List[Dict[str, str]]) -> List[int]:
+        text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return self.tokenizer(text)['input_ids']
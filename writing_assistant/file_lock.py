@@ -0,0 +1,39 @@
+"""Exclusive locks on open files, on POSIX and Windows"""
+
+import os
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def locked(f: IO) -> Iterator[IO]:
+    """Hold an exclusive lock on an open file while the block runs
+
+    Uses flock on POSIX. On Windows the first byte is locked with
+    msvcrt.locking (retrying for about 10 seconds, then raising OSError);
+    files opened for appending still write at their end.
+    """
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+        return
+
+    position = f.tell()
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    f.seek(position, os.SEEK_SET)
+    try:
+        yield f
+    finally:
+        f.flush()
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
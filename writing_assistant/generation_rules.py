@@ -0,0 +1,66 @@
+"""Per-mode generation budgets and stop strings from the prompt YAMLs"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+
+# "an outline with 5 sections", "4 main sections"
+SECTION_COUNT = re.compile(r'\b(\d{1,2})\s+(?:main\s+|major\s+)?sections?\b', re.IGNORECASE)
+# Requested sections listed one per line: "- Methods", "2. Results", "## Discussion"
+SECTION_LINE = re.compile(r'^\s*(?:[-*•]|\d{1,2}[.)]|#{1,6})\s+\S', re.MULTILINE)
+
+BUDGET_KEYS = ('base_tokens', 'input_ratio', 'tokens_per_section')
+
+
+def count_sections(text: str, default: int = 6) -> int:
+    """Return the number of sections a request asks for, or default if it does not say"""
+    match = SECTION_COUNT.search(text)
+    if match:
+        return int(match.group(1))
+    listed = len(SECTION_LINE.findall(text))
+    return listed if listed >= 2 else default
+
+
+class GenerationRules:
+    """Generation settings of a mode, optionally refined by one of its submodes
+
+    A mode file's ``generation`` section holds settings for the whole mode;
+    a nested section named after a submode (``proofread``, ``outline``...)
+    overrides them in that submode::
+
+        generation:
+          max_new_tokens: 2048
+          proofread:
+            base_tokens: 200
+            input_ratio: 1.5
+
+    The budget is ``base_tokens + input_ratio * input tokens +
+    tokens_per_section * requested sections`` (only the keys present are
+    used), capped by ``max_new_tokens`` and model.max_length. Without any of
+    these keys the cap itself is the budget.
+    """
+
+    def __init__(self, mode_config: Optional[Dict[str, Any]], submode: Optional[str], max_length: int):
+        """Initialize from a loaded mode file (None for no mode) and the model's max_length"""
+        generation = (mode_config or {}).get('generation') or {}
+        self.rules = {key: value for key, value in generation.items() if not isinstance(value, dict)}
+        if submode and isinstance(generation.get(submode), dict):
+            self.rules.update(generation[submode])
+        self.max_length = max_length
+
+    @property
+    def stop_strings(self) -> List[str]:
+        return list(self.rules.get('stop_strings') or [])
+
+    def max_new_tokens(self, text: str, count_input_tokens: Callable[[], int]) -> int:
+        """Return the token budget for a reply to text (count_input_tokens is called only if needed)"""
+        cap = min(self.rules.get('max_new_tokens', self.max_length), self.max_length)
+        if not any(key in self.rules for key in BUDGET_KEYS):
+            return cap
+
+        budget = self.rules.get('base_tokens', 0)
+        if 'input_ratio' in self.rules:
+            budget += self.rules['input_ratio'] * count_input_tokens()
+        if 'tokens_per_section' in self.rules:
+            budget += self.rules['tokens_per_section'] * count_sections(text, self.rules.get('default_sections', 6))
+        return max(1, min(int(budget), cap))
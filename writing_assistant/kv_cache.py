@@ -0,0 +1,92 @@
+"""Key/value cache reuse across conversation turns"""
+
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import torch
+    from transformers import DynamicCache
+
+
+# torch and transformers are imported lazily so that ConversationCache can be
+# used by sessions attached to the model daemon without loading them
+
+
+def cache_to_tensors(past_key_values) -> List[Tuple['torch.Tensor', 'torch.Tensor']]:
+    """Return the (key, value) tensors of every layer of a DynamicCache"""
+    if hasattr(past_key_values, 'layers'):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    return [
+        (past_key_values.key_cache[i], past_key_values.value_cache[i])
+        for i in range(len(past_key_values.key_cache))
+    ]
+
+
+def cache_from_tensors(layers: List[Tuple['torch.Tensor', 'torch.Tensor']]) -> 'DynamicCache':
+    """Build a DynamicCache from per-layer (key, value) tensors"""
+    from transformers import DynamicCache
+
+    if hasattr(DynamicCache, 'from_legacy_cache'):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    return DynamicCache(layers)
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    """Return the number of leading tokens shared by two token id lists"""
+    limit = min(len(a), len(b))
+    n = 0
+    while n < limit and a[n] == b[n]:
+        n += 1
+    return n
+
+
+class ConversationCache:
+    """Keep the model's key/value states for the prompt of a running conversation
+
+    Every turn re-renders the chat template over the full history, so the new
+    prompt normally starts with exactly the tokens the cache already covers.
+    Only the uncovered suffix (the new user message) has to be prefilled.
+    Whenever the history changes in a way that breaks the prefix (a trimmed
+    history, a different system prompt), the cache is cropped back to the
+    longest shared prefix before it is reused.
+    """
+
+    def __init__(self):
+        """Initialize an empty cache"""
+        self.past_key_values = None
+        self.token_ids: List[int] = []
+        self.reused_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self.token_ids)
+
+    def reset(self) -> None:
+        """Drop all cached states"""
+        self.past_key_values = None
+        self.token_ids = []
+        self.reused_tokens = 0
+
+    def prepare(self, input_ids: List[int]) -> Optional[object]:
+        """Return cached states valid for a prefix of input_ids, or None"""
+        if self.past_key_values is None:
+            self.reused_tokens = 0
+            return None
+
+        # At least one token has to be fed to the model to get fresh logits
+        keep = min(common_prefix_length(self.token_ids, input_ids), len(input_ids) - 1)
+        if keep <= 0:
+            self.reset()
+            return None
+
+        if keep < len(self.token_ids):
+            # Negative values remove tokens from the end of the cache
+            self.past_key_values.crop(keep - len(self.token_ids))
+            self.token_ids = self.token_ids[:keep]
+
+        self.reused_tokens = keep
+        return self.past_key_values
+
+    def update(self, past_key_values, sequence_ids: List[int]) -> None:
+        """Record the states produced by a generate call over sequence_ids"""
+        self.past_key_values = past_key_values
+        # The last sampled token is never fed back, so the cache is one short
+        self.token_ids = list(sequence_ids[:past_key_values.get_seq_length()])
@@ -0,0 +1,171 @@
+"""Buffered background writer for JSONL session logs"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .file_lock import locked
+
+
+FSYNC_POLICIES = ('entry', 'interval', 'end')
+
+
+class LogWriter:
+    """Append JSON lines to log files from a background thread
+
+    write() only queues the entry, so the chat loop never waits on the
+    filesystem. The thread drains the queue in batches and appends each
+    file's lines with one write call. fsync policy:
+
+    - ``entry``: fsync after every batch, before the next one is taken
+    - ``interval``: fsync at most every ``fsync_interval`` seconds
+    - ``end``: fsync only when flush(sync=True) is called (end of session)
+
+    One writer can be shared by any number of sessions; see get_log_writer().
+    Each batch is appended under an exclusive flock, so it is never
+    interleaved with appends to the same file from other processes.
+    """
+
+    def __init__(self, fsync: str = 'end', fsync_interval: float = 1.0):
+        """Initialize and start the writer thread"""
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync} (expected one of {', '.join(FSYNC_POLICIES)})")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.error: Optional[Exception] = None
+        self._queue: "queue.Queue[Tuple[str, Any, Any]]" = queue.Queue()
+        self._dirty: set = set()  # files written since their last fsync
+        self._last_sync = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path: Path, entry: Dict[str, Any]) -> int:
+        """Queue a log entry to be appended to path and return its size in bytes"""
+        if self._closed:
+            raise RuntimeError("Log writer is closed")
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        self._queue.put(('write', str(path), line))
+        return len(line.encode('utf-8'))
+
+    def flush(self, path: Optional[Path] = None, sync: bool = False) -> None:
+        """Block until every queued entry is written; with sync, fsync path (or all files)
+
+        Raises the first write error since the last flush, if any.
+        """
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(('flush', (str(path) if path is not None else None, sync), done))
+        done.wait()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self) -> None:
+        """Write everything queued, fsync all files and stop the thread"""
+        if self._closed:
+            return
+        try:
+            self.flush(sync=True)
+        finally:
+            self._closed = True
+            self._queue.put(('stop', None, None))
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            timeout = self.fsync_interval if self.fsync == 'interval' and self._dirty else None
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                self._sync_due()
+                continue
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            pending: Dict[str, List[str]] = defaultdict(list)
+            for kind, target, payload in batch:
+                if kind == 'write':
+                    pending[target].append(payload)
+                    continue
+
+                # Flush and stop requests apply to everything queued before them
+                self._write_pending(pending)
+                if kind == 'stop':
+                    return
+                path, sync = target
+                if sync:
+                    self._sync([path] if path is not None else list(self._dirty))
+                payload.set()
+
+            self._write_pending(pending)
+            if self.fsync == 'entry':
+                self._sync(list(self._dirty))
+            elif self.fsync == 'interval':
+                self._sync_due()
+
+    def _write_pending(self, pending: Dict[str, List[str]]) -> None:
+        for path, lines in pending.items():
+            try:
+                with open(path, 'a', encoding='utf-8') as f, locked(f):
+                    f.write(''.join(lines))
+                    f.flush()
+                self._dirty.add(path)
+            except OSError as e:
+                self.error = self.error or e
+        pending.clear()
+
+    def _sync_due(self) -> None:
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync(list(self._dirty))
+
+    def _sync(self, paths: List[str]) -> None:
+        for path in paths:
+            if path not in self._dirty:
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                self.error = self.error or e
+            self._dirty.discard(path)
+        self._last_sync = time.monotonic()
+
+
+_writers: Dict[Tuple[str, float], LogWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_log_writer(session_config: Dict[str, Any]) -> LogWriter:
+    """Return the process-wide writer for the session config's fsync policy"""
+    key = (session_config.get('log_fsync', 'end'), float(session_config.get('log_fsync_interval', 1.0)))
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = LogWriter(*key)
+        return _writers[key]
+
+
+@atexit.register
+def _close_writers() -> None:
+    # Runs on normal exit and after an unhandled exception
+    with _writers_lock:
+        for writer in _writers.values():
+            try:
+                writer.close()
+            except Exception:
+                pass
+        _writers.clear()
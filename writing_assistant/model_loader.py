@@ -1,10 +1,47 @@
 """QWen3-8b Model Loader"""
 
+import threading
+import time
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from typing import Optional, Dict, Any
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, StoppingCriteriaList, TextIteratorStreamer
+from transformers.utils import logging as hf_logging
+from typing import Callable, Optional, Dict, Any, Iterator, List
 import yaml
 
+from .kv_cache import ConversationCache
+from .prefix_cache import PrefixCacheStore
+from .prompts import build_system_prompt
+from .speculation import DraftFallback, SpeculationMonitor
+from .stopping import StopAtBudget, StopOnEvent, StopOnRepetition, StopOnStrings, StopOnTimeout
+
+
+# model.cpu_precision -> dtype the weights are loaded in. int8 loads bfloat16
+# weights (half the peak memory of float32) and quantizes the linear layers.
+CPU_PRECISIONS = {
+    'float32': torch.float32,
+    'bfloat16': torch.bfloat16,
+    'int8': torch.bfloat16,
+}
+
+
+def quantize_linear_int8(model, skip: tuple = ('lm_head',)) -> None:
+    """Replace the model's nn.Linear layers with dynamically quantized int8 layers, in place
+
+    Layers are converted one at a time, so only one float32 copy of a layer
+    exists at any point. The remaining parameters (embeddings, norms and the
+    skipped layers, by default the output projection) are kept in float32,
+    which the quantized layers expect as input.
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    for parent_name, parent in list(model.named_modules()):
+        for name, child in list(parent.named_children()):
+            full_name = f"{parent_name}.{name}" if parent_name else name
+            if isinstance(child, torch.nn.Linear) and full_name not in skip:
+                quantized = quantize_dynamic(torch.nn.Sequential(child.float()), {torch.nn.Linear}, dtype=torch.qint8)
+                setattr(parent, name, quantized[0])
+    model.float()
+
 
 class QWenModelLoader:
     """Load and manage QWen3-8b model for writing assistance"""
@@ -19,10 +56,25 @@ class QWenModelLoader:
         self.model = None
         self.tokenizer = None
         self.device = None
+        self.prefix_store = None
+        self.draft_model = None
+        self.draft_fallback = DraftFallback(
+            self.model_config.get('draft_min_acceptance', 0.3),
+            self.model_config.get('draft_patience', 3)
+        )
+        self.last_generation_stats: Dict[str, Any] = {}
+
+    def load_model(self, on_progress: Optional[Callable[[str], None]] = None) -> None:
+        """Load the QWen model and tokenizer
 
-    def load_model(self) -> None:
-        """Load the QWen model and tokenizer"""
-        print(f"Loading model: {self.model_config['name']}...")
+        Progress messages are printed, or passed to on_progress instead (which
+        also hides the weight loading progress bar), e.g. when loading in a
+        background thread while the CLI prompt is shown.
+        """
+        report = on_progress or print
+        report(f"Loading model: {self.model_config['name']}...")
+        if on_progress is not None:
+            hf_logging.disable_progress_bar()
 
         model_path = self.model_config['name']
 
@@ -30,6 +82,7 @@ class QWenModelLoader:
         is_local = ('/' in model_path and not model_path.startswith('http'))
 
         # Load tokenizer
+        report("Loading tokenizer")
         tokenizer_kwargs = {'use_fast': False}  # Workaround for local loading bug
         if not is_local or 'Qwen' in model_path or 'qwen' in model_path.lower():
             tokenizer_kwargs['trust_remote_code'] = True
@@ -46,45 +99,129 @@ class QWenModelLoader:
             self.device = self.model_config['device']
 
         # Load model
+        precision = self.model_config.get('cpu_precision', 'float32') if self.device == 'cpu' else None
+        if precision not in CPU_PRECISIONS and precision is not None:
+            raise ValueError(f"Unknown model.cpu_precision: {precision} (expected one of {', '.join(CPU_PRECISIONS)})")
+
         model_kwargs = {
-            'dtype': torch.float16 if self.device == 'cuda' else torch.float32,
+            'dtype': torch.float16 if self.device == 'cuda' else CPU_PRECISIONS.get(precision, torch.float32),
             'device_map': 'auto' if self.device == 'cuda' else None,
         }
 
         if not is_local or 'Qwen' in model_path:
             model_kwargs['trust_remote_code'] = True
 
+        report("Loading model weights")
         self.model = AutoModelForCausalLM.from_pretrained(
             model_path,
             **model_kwargs
         )
 
-        if self.device == 'cpu':
+        # Weights are memory-mapped from safetensors straight into the requested
+        # dtype on the CPU; no .to() copy is needed there
+        if self.device not in ('cpu', 'cuda'):
             self.model = self.model.to(self.device)
+        if precision == 'int8':
+            report("Quantizing linear layers to int8")
+            quantize_linear_int8(self.model)
+        if self.model_config.get('draft_model'):
+            self._load_draft_model(report)
+        if on_progress is not None:
+            hf_logging.enable_progress_bar()
 
-        print(f"Model loaded successfully on {self.device}")
+        self.prefix_store = PrefixCacheStore(
+            self.model_config.get('prefix_cache_dir'),
+            model_path,
+            self.model.dtype,
+            str(self.model.device),
+            quantization='int8' if precision == 'int8' else None
+        )
+
+        report(f"Model loaded successfully on {self.device}")
+
+    def _load_draft_model(self, report: Callable[[str], None]) -> None:
+        """Load model.draft_model for assisted decoding; on any failure, decode without it"""
+        draft_path = self.model_config['draft_model']
+        report(f"Loading draft model: {draft_path}")
+        try:
+            draft_tokenizer = AutoTokenizer.from_pretrained(draft_path, use_fast=False)
+            if draft_tokenizer.get_vocab() != self.tokenizer.get_vocab():
+                raise ValueError("its tokenizer differs from the model's")
+
+            draft_model = AutoModelForCausalLM.from_pretrained(draft_path, dtype=self.model.dtype)
+            draft_model = draft_model.to(self.model.device)
+
+            # Checkpoints of one family can pad the embeddings to different
+            # sizes (Qwen2.5 0.5B vs 7B); the drafted logits must line up
+            vocab_size = self.model.config.get_text_config().vocab_size
+            if draft_model.config.get_text_config().vocab_size != vocab_size:
+                draft_model.resize_token_embeddings(vocab_size)
+        except Exception as e:
+            report(f"Draft model unavailable ({e}); using standard decoding")
+            self.draft_model = None
+            return
+
+        draft_model.generation_config.num_assistant_tokens = self.model_config.get('draft_tokens', 5)
+        self.draft_model = draft_model
 
     def get_system_prompt(self, custom_instructions: Optional[str] = None) -> str:
         """Get the system prompt with optional custom instructions"""
-        base_prompt = self.prompts_config['system_prompt']
-        style = self.prompts_config['writing_style']
-        instructions = self.prompts_config['working_instructions']
+        return build_system_prompt(self.prompts_config, custom_instructions)
 
-        system_prompt = f"{base_prompt}\n\n## Writing Style\n{style}\n\n## Working Instructions\n{instructions}"
+    def count_tokens(self, text: str) -> int:
+        """Return the number of tokens in a piece of text"""
+        if self.tokenizer is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
 
-        if custom_instructions:
-            system_prompt += f"\n\n## Additional Instructions\n{custom_instructions}"
+    def prime_cache(
+        self,
+        cache: ConversationCache,
+        system_prompt: str,
+        mode: Optional[str] = None,
+        submode: Optional[str] = None
+    ) -> bool:
+        """Seed a conversation cache with the key/value states of the system prompt
 
-        return system_prompt
+        The states are loaded from the prefix store when available; otherwise
+        the prefix is prefilled once and stored. Returns True on a store hit.
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
 
-    def generate_response(
+        prefix_text = self.tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}],
+            tokenize=False,
+            add_generation_prompt=False
+        )
+        token_ids = self.tokenizer(prefix_text)['input_ids']
+
+        past_key_values = self.prefix_store.load(mode, submode, token_ids)
+        hit = past_key_values is not None
+
+        if not hit:
+            input_ids = torch.tensor([token_ids], device=self.model.device)
+            with torch.no_grad():
+                outputs = self.model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True)
+            self.prefix_store.save(mode, submode, token_ids, outputs.past_key_values)
+            # Hand the session its own cache object over the stored tensors
+            past_key_values = self.prefix_store.load(mode, submode, token_ids)
+
+        cache.update(past_key_values, token_ids)
+        return hit
+
+    def _prepare_generation(
         self,
         messages: list,
-        max_length: Optional[int] = None,
-        temperature: Optional[float] = None,
-        top_p: Optional[float] = None
-    ) -> str:
-        """Generate a response from the model"""
+        max_length: Optional[int],
+        temperature: Optional[float],
+        top_p: Optional[float],
+        cache: Optional[ConversationCache],
+        prompt_lookup: bool = False,
+        stop_strings: Optional[List[str]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Dict[str, Any]:
+        """Tokenize the conversation and build the keyword arguments for model.generate"""
         if self.model is None or self.tokenizer is None:
             raise RuntimeError("Model not loaded. Call load_model() first.")
 
@@ -103,27 +240,342 @@ class QWenModelLoader:
         # Tokenize input
         inputs = self.tokenizer([text], return_tensors="pt").to(self.device)
 
-        # Generate response
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=max_length,
-                temperature=temperature,
-                top_p=top_p,
-                repetition_penalty=self.model_config.get('repetition_penalty', 1.1),
-                do_sample=True,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id
+        generate_kwargs = dict(
+            inputs,
+            max_new_tokens=max_length,
+            temperature=temperature,
+            top_p=top_p,
+            repetition_penalty=self.model_config.get('repetition_penalty', 1.1),
+            do_sample=True,
+            pad_token_id=self.tokenizer.pad_token_id,
+            eos_token_id=self.tokenizer.eos_token_id
+        )
+
+        # Stop early when cancelled, out of time (model.turn_timeout), on a
+        # stop string or on a reply stuck repeating itself
+        prompt_length = inputs['input_ids'].shape[1]
+        stopping_criteria = []
+        if cancel_event is not None:
+            stopping_criteria.append(StopOnEvent(cancel_event))
+        if self.model_config.get('turn_timeout'):
+            stopping_criteria.append(StopOnTimeout(self.model_config['turn_timeout']))
+        stopping_criteria += self._content_criteria(prompt_length, stop_strings)
+        if stopping_criteria:
+            generate_kwargs['stopping_criteria'] = StoppingCriteriaList(stopping_criteria)
+
+        # Reuse the conversation prefix states if available
+        if cache is not None:
+            past_key_values = cache.prepare(inputs['input_ids'][0].tolist())
+            generate_kwargs['past_key_values'] = past_key_values or DynamicCache()
+
+        # Speculative decoding: candidate tokens are copied from the prompt
+        # (prompt lookup) or proposed by the draft model, and the model
+        # verifies them in one pass, so outputs follow its own distribution
+        if prompt_lookup:
+            lookup_config = self.model_config.get('prompt_lookup') or {}
+            generate_kwargs['prompt_lookup_num_tokens'] = lookup_config.get('num_tokens', 10)
+            generate_kwargs['max_matching_ngram_size'] = lookup_config.get('max_ngram_size', 3)
+        elif self.draft_model is not None:
+            generate_kwargs['assistant_model'] = self.draft_model
+        if prompt_lookup or self.draft_model is not None:
+            generate_kwargs.setdefault('past_key_values', DynamicCache())
+
+        return generate_kwargs
+
+    def _content_criteria(self, prompt_length: int, stop_strings: Optional[List[str]]) -> list:
+        """Stop strings and the model.stop_on_repetition check, evaluated per row"""
+        criteria = []
+        if stop_strings:
+            criteria.append(StopOnStrings(self.tokenizer, stop_strings, prompt_length))
+        repetition = self.model_config.get('stop_on_repetition') or {}
+        if repetition.get('enabled', True):
+            criteria.append(StopOnRepetition(
+                prompt_length,
+                max_ngram=repetition.get('max_ngram', 32),
+                min_repeats=repetition.get('min_repeats', 3),
+                min_tokens=repetition.get('min_tokens', 48)
+            ))
+        return criteria
+
+    def _generate(self, generate_kwargs: Dict[str, Any]):
+        """Run model.generate, watching the acceptance of speculated tokens
+
+        Returns the outputs and a SpeculationMonitor (None for plain decoding).
+        """
+        if 'assistant_model' not in generate_kwargs and 'prompt_lookup_num_tokens' not in generate_kwargs:
+            with torch.no_grad():
+                return self.model.generate(**generate_kwargs), None
+
+        with SpeculationMonitor(self.model) as monitor, torch.no_grad():
+            outputs = self.model.generate(**generate_kwargs)
+        return outputs, monitor
+
+    def _finish_generation(
+        self,
+        outputs: torch.Tensor,
+        generate_kwargs: Dict[str, Any],
+        cache: Optional[ConversationCache],
+        started: float,
+        first_token_at: Optional[float] = None,
+        monitor: Optional[SpeculationMonitor] = None
+    ) -> str:
+        """Update the conversation cache and statistics, and decode the new tokens"""
+        finished = time.perf_counter()
+        prompt_length = generate_kwargs['input_ids'].shape[1]
+        new_tokens = outputs.shape[1] - prompt_length
+
+        if cache is not None:
+            cache.update(generate_kwargs['past_key_values'], outputs[0].tolist())
+
+        elapsed = finished - started
+        self.last_generation_stats = {
+            'prompt_tokens': prompt_length,
+            'cached_tokens': cache.reused_tokens if cache is not None else 0,
+            'new_tokens': new_tokens,
+            'max_new_tokens': generate_kwargs['max_new_tokens'],
+            'stop_reason': self._stop_reason(outputs, generate_kwargs, new_tokens),
+            'time_to_first_token': round((first_token_at or finished) - started, 3),
+            'total_time': round(elapsed, 3),
+            'tokens_per_second': round(new_tokens / elapsed, 2) if elapsed > 0 else 0.0
+        }
+        for criteria in generate_kwargs.get('stopping_criteria', []):
+            if isinstance(criteria, StopOnStrings) and criteria.triggered:
+                self.last_generation_stats['stop_string'] = criteria.matched
+        if monitor is not None:
+            self.last_generation_stats['decoding'] = (
+                'prompt_lookup' if 'prompt_lookup_num_tokens' in generate_kwargs else 'draft_model'
             )
+            self.last_generation_stats.update(monitor.stats(new_tokens, elapsed))
+            if self.last_generation_stats['decoding'] == 'draft_model' and \
+                    self.draft_fallback.record(self.last_generation_stats.get('acceptance_rate')):
+                # Rejected drafts cost more than they save: decode without them from now on
+                self.draft_model = None
+                self.last_generation_stats['draft_dropped'] = True
 
         # Decode response
-        response = self.tokenizer.decode(
-            outputs[0][inputs['input_ids'].shape[1]:],
+        return self.tokenizer.decode(
+            outputs[0][prompt_length:],
             skip_special_tokens=True
         )
 
+    def _stop_reason(self, outputs: torch.Tensor, generate_kwargs: Dict[str, Any], new_tokens: int) -> str:
+        """Return why generation ended: eos, max_new_tokens, cancelled, timeout, stop_string or repetition"""
+        for criteria in generate_kwargs.get('stopping_criteria', []):
+            if criteria.triggered:
+                return criteria.reason
+        if new_tokens > 0 and outputs[0, -1].item() == self.tokenizer.eos_token_id:
+            return 'eos'
+        if new_tokens >= generate_kwargs['max_new_tokens']:
+            return 'max_new_tokens'
+        return 'eos'
+
+    def generate_response(
+        self,
+        messages: list,
+        max_length: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        cache: Optional[ConversationCache] = None,
+        prompt_lookup: bool = False,
+        stop_strings: Optional[List[str]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> str:
+        """Generate a response from the model
+
+        If a ConversationCache is given, the key/value states of the longest
+        prompt prefix seen on the previous call are reused, so only the new
+        tokens are prefilled, and the cache is updated for the next turn.
+        prompt_lookup drafts tokens from n-grams of the prompt, which speeds
+        up replies that mostly copy the input (model.prompt_lookup settings).
+        Generation ends at any of stop_strings (removed from the reply) or
+        when the reply keeps repeating itself (model.stop_on_repetition).
+        Setting cancel_event (from another thread) or reaching
+        model.turn_timeout seconds ends it after the current step, keeping
+        the partial reply; last_generation_stats['stop_reason'] tells which.
+        """
+        generate_kwargs = self._prepare_generation(
+            messages, max_length, temperature, top_p, cache, prompt_lookup, stop_strings, cancel_event
+        )
+
+        started = time.perf_counter()
+        outputs, monitor = self._generate(generate_kwargs)
+
+        response = self._finish_generation(outputs, generate_kwargs, cache, started, monitor=monitor)
+        stop_string = self.last_generation_stats.get('stop_string')
+        if stop_string and stop_string in response:
+            response = response[:response.index(stop_string)]
         return response.strip()
 
+    def generate_response_stream(
+        self,
+        messages: list,
+        max_length: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        cache: Optional[ConversationCache] = None,
+        prompt_lookup: bool = False,
+        stop_strings: Optional[List[str]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        """Generate a response from the model, yielding text chunks as they are decoded
+
+        Takes the same arguments as generate_response. Generation runs in a
+        background thread; statistics, including the time to the first
+        token, are available in last_generation_stats once the iterator is
+        exhausted. A matched stop string has already been streamed; it is
+        given in last_generation_stats['stop_string'] for the caller to cut.
+        """
+        generate_kwargs = self._prepare_generation(
+            messages, max_length, temperature, top_p, cache, prompt_lookup, stop_strings, cancel_event
+        )
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generate_kwargs['streamer'] = streamer
+        result = {}
+
+        def run():
+            try:
+                result['outputs'], result['monitor'] = self._generate(generate_kwargs)
+            except Exception as e:
+                result['error'] = e
+                streamer.end()
+
+        started = time.perf_counter()
+        first_token_at = None
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        for chunk in streamer:
+            if not chunk:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield chunk
+
+        thread.join()
+        if 'error' in result:
+            raise result['error']
+
+        self._finish_generation(result['outputs'], generate_kwargs, cache, started, first_token_at,
+                                result['monitor'])
+
+    def generate_batch(
+        self,
+        conversations: List[list],
+        batch_size: Optional[int] = None,
+        max_length: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        max_new_tokens: Optional[List[int]] = None,
+        stop_strings: Optional[List[str]] = None
+    ) -> List[str]:
+        """Generate responses for many conversations with one generate call per micro-batch
+
+        Prompts are sorted by token length and grouped into micro-batches of
+        batch_size (model.batch_size in config.yaml), so each left-padded
+        batch holds prompts of similar length. max_new_tokens gives each
+        conversation its own budget (capped by max_length). As in
+        generate_response, a sequence ends at a stop string (cut from its
+        response) or when it keeps repeating itself, without ending the rest
+        of its batch. Responses are returned in input order; batch
+        statistics, with a count of each stop_reason, are stored in
+        last_generation_stats.
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+
+        batch_size = batch_size or self.model_config.get('batch_size', 8)
+        max_length = max_length or self.model_config['max_length']
+        temperature = temperature or self.model_config['temperature']
+        top_p = top_p or self.model_config['top_p']
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id
+
+        prompts = []
+        for messages in conversations:
+            text = self.tokenizer.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            prompts.append(self.tokenizer(text)['input_ids'])
+
+        # Length bucketing: neighbours in sorted order need little padding
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        budgets = [min(b, max_length) for b in max_new_tokens] if max_new_tokens else [max_length] * len(prompts)
+        responses: List[Optional[str]] = [None] * len(prompts)
+        stop_reasons: Dict[str, int] = {}
+        prompt_tokens = padding_tokens = new_tokens = batches = 0
+        started = time.perf_counter()
+
+        for offset in range(0, len(order), batch_size):
+            indices = order[offset:offset + batch_size]
+            width = max(len(prompts[i]) for i in indices)
+
+            # Left-pad so every prompt ends where generation starts
+            input_ids = torch.full((len(indices), width), pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(indices), width), dtype=torch.long)
+            for row, i in enumerate(indices):
+                length = len(prompts[i])
+                input_ids[row, width - length:] = torch.tensor(prompts[i], dtype=torch.long)
+                attention_mask[row, width - length:] = 1
+                prompt_tokens += length
+                padding_tokens += width - length
+
+            criteria = self._content_criteria(width, stop_strings)
+            batch_budgets = [budgets[i] for i in indices]
+            if len(set(batch_budgets)) > 1:
+                criteria.append(StopAtBudget(width, batch_budgets))
+
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    input_ids=input_ids.to(self.device),
+                    attention_mask=attention_mask.to(self.device),
+                    max_new_tokens=max(batch_budgets),
+                    stopping_criteria=StoppingCriteriaList(criteria),
+                    temperature=temperature,
+                    top_p=top_p,
+                    repetition_penalty=self.model_config.get('repetition_penalty', 1.1),
+                    do_sample=True,
+                    pad_token_id=pad_token_id,
+                    eos_token_id=self.tokenizer.eos_token_id
+                )
+
+            for row, i in enumerate(indices):
+                # The criterion that stopped the row first; tokens after it are padding
+                stops = [(c.stopped_at[row], c) for c in criteria if c.stopped_at and c.stopped_at[row] is not None]
+                stopped_at, stopped_by = min(stops, key=lambda s: s[0]) if stops else (outputs.shape[1], None)
+                generated = outputs[row, width:stopped_at]
+                # Rows that finished at EOS are padded up to the longest row
+                kept = (generated != pad_token_id).nonzero()
+                generated = generated[:int(kept[-1]) + 1 if len(kept) else 0]
+                new_tokens += len(generated)
+
+                response = self.tokenizer.decode(generated, skip_special_tokens=True)
+                if stopped_by is not None:
+                    reason = stopped_by.reason
+                else:
+                    reason = 'max_new_tokens' if len(generated) >= batch_budgets[row] else 'eos'
+                if isinstance(stopped_by, StopOnStrings) and stopped_by.matches[row] in response:
+                    response = response[:response.index(stopped_by.matches[row])]
+                stop_reasons[reason] = stop_reasons.get(reason, 0) + 1
+                responses[i] = response.strip()
+            batches += 1
+
+        elapsed = time.perf_counter() - started
+        self.last_generation_stats = {
+            'sequences': len(prompts),
+            'batches': batches,
+            'prompt_tokens': prompt_tokens,
+            'padding_tokens': padding_tokens,
+            'new_tokens': new_tokens,
+            'stop_reasons': stop_reasons,
+            'total_time': round(elapsed, 3),
+            'tokens_per_second': round(new_tokens / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+        return responses
+
     def unload_model(self) -> None:
         """Unload the model to free memory"""
         if self.model is not None:
@@ -132,6 +584,8 @@ class QWenModelLoader:
         if self.tokenizer is not None:
             del self.tokenizer
             self.tokenizer = None
+        self.prefix_store = None
+        self.draft_model = None
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         print("Model unloaded successfully")
@@ -0,0 +1,103 @@
+"""Persistent key/value cache for mode system prompts"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from .kv_cache import cache_from_tensors, cache_to_tensors
+
+
+class PrefixCacheStore:
+    """Store the system-prompt key/value states per (model, mode, submode)
+
+    Entries live under ``<cache_dir>/<model key>/`` and are named after the
+    mode, the submode and a hash of the prefix token ids. The token ids are
+    rendered from config.yaml and the mode YAML, so editing either produces
+    a new hash and the old entry for that mode/submode is removed on save.
+    The default mode keeps one entry too: each distinct set of custom
+    instructions (``-i``) replaces the previous one instead of piling up.
+    Entries are memory-mapped on load and kept in memory for the session.
+    """
+
+    def __init__(self, cache_dir: Optional[str], model_path: str, dtype: torch.dtype, device: str = 'cpu',
+                 quantization: Optional[str] = None):
+        """Initialize the store for one model (quantized weights give different states)"""
+        self.device = device
+        self.model_key = self._model_key(model_path, dtype, quantization)
+        self.directory = Path(cache_dir) / self.model_key if cache_dir else None
+        self._memory: Dict[str, Tuple[List[int], list]] = {}
+
+    @staticmethod
+    def _model_key(model_path: str, dtype: torch.dtype, quantization: Optional[str] = None) -> str:
+        """Hash the model path, its weights' modification time, the dtype and any quantization"""
+        fingerprint = f"{model_path}|{dtype}"
+        if quantization:
+            fingerprint += f"|{quantization}"
+        config_file = Path(model_path) / 'config.json'
+        if config_file.exists():
+            fingerprint += f"|{config_file.stat().st_mtime_ns}"
+        return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def prompt_hash(token_ids: List[int]) -> str:
+        """Hash the prefix token ids"""
+        data = ','.join(str(t) for t in token_ids).encode('ascii')
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    def _entry_name(self, mode: Optional[str], submode: Optional[str]) -> str:
+        return f"{mode or 'default'}--{submode or 'base'}"
+
+    def load(self, mode: Optional[str], submode: Optional[str], token_ids: List[int]):
+        """Return a DynamicCache for the prefix, or None if nothing is stored"""
+        digest = self.prompt_hash(token_ids)
+
+        if digest not in self._memory and self.directory is not None:
+            entry_file = self.directory / f"{self._entry_name(mode, submode)}--{digest}.pt"
+            if entry_file.exists():
+                try:
+                    data = torch.load(entry_file, mmap=True, weights_only=True)
+                except Exception:
+                    # A truncated or incompatible entry is recomputed
+                    entry_file.unlink(missing_ok=True)
+                else:
+                    if data['token_ids'].tolist() == token_ids:
+                        layers = [
+                            (k.to(self.device), v.to(self.device))
+                            for k, v in zip(data['keys'], data['values'])
+                        ]
+                        self._memory[digest] = (token_ids, layers)
+
+        if digest not in self._memory:
+            return None
+
+        # Cache updates concatenate into new tensors, so the stored ones stay intact
+        _, layers = self._memory[digest]
+        return cache_from_tensors(layers)
+
+    def save(self, mode: Optional[str], submode: Optional[str], token_ids: List[int], past_key_values) -> None:
+        """Store the prefix states and remove stale entries for the same mode/submode"""
+        digest = self.prompt_hash(token_ids)
+        layers = [(k.detach(), v.detach()) for k, v in cache_to_tensors(past_key_values)]
+        self._memory[digest] = (token_ids, layers)
+
+        if self.directory is None:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = self._entry_name(mode, submode)
+        entry_file = self.directory / f"{name}--{digest}.pt"
+
+        tmp_file = entry_file.with_suffix(f".tmp{os.getpid()}")
+        torch.save({
+            'token_ids': torch.tensor(token_ids, dtype=torch.long),
+            'keys': [k.cpu().contiguous() for k, _ in layers],
+            'values': [v.cpu().contiguous() for _, v in layers],
+        }, tmp_file)
+        os.replace(tmp_file, entry_file)
+
+        for old_file in self.directory.glob(f"{name}--*.pt"):
+            if old_file != entry_file:
+                old_file.unlink(missing_ok=True)
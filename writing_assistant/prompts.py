@@ -0,0 +1,27 @@
+"""System prompt construction"""
+
+from typing import Any, Dict, List, Optional
+
+
+# Mode file keys that hold settings rather than a submode prompt
+MODE_SETTING_KEYS = ('custom_instructions', 'generation')
+
+
+def mode_submodes(mode_config: Optional[Dict[str, Any]]) -> List[str]:
+    """Return the submodes of a mode file: its non-empty text keys other than the mode settings"""
+    return [key for key, value in (mode_config or {}).items()
+            if key not in MODE_SETTING_KEYS and isinstance(value, str) and value.strip()]
+
+
+def build_system_prompt(prompts_config: Dict[str, Any], custom_instructions: Optional[str] = None) -> str:
+    """Combine the config.yaml prompt sections with optional custom instructions"""
+    base_prompt = prompts_config['system_prompt']
+    style = prompts_config['writing_style']
+    instructions = prompts_config['working_instructions']
+
+    system_prompt = f"{base_prompt}\n\n## Writing Style\n{style}\n\n## Working Instructions\n{instructions}"
+
+    if custom_instructions:
+        system_prompt += f"\n\n## Additional Instructions\n{custom_instructions}"
+
+    return system_prompt
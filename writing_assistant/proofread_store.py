@@ -0,0 +1,73 @@
+"""Content-addressed store of proofread paragraphs"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class ProofreadStore:
+    """Remember proofread results so unchanged paragraphs are not regenerated
+
+    Results are keyed by a hash of the paragraph text and a context hash
+    covering the system prompt (config.yaml plus the mode/submode prompt),
+    the model, its CPU precision and the generation parameters (including
+    the mode's generation rules and the stop settings). Changing any of them yields
+    new keys, so stale results are never reused. Entries are stored as
+    small JSON files in ``<log_directory>/.proofread_cache/``, next to the
+    per-user session directories.
+    """
+
+    def __init__(self, log_directory: str, system_prompt: str, model_config: Dict[str, Any],
+                 generation: Optional[Dict[str, Any]] = None):
+        """Initialize the store for one proofreading context (generation: GenerationRules.rules)"""
+        self.directory = Path(log_directory) / '.proofread_cache'
+        context = {
+            'system_prompt': system_prompt,
+            'model': model_config['name'],
+            'cpu_precision': model_config.get('cpu_precision', 'float32'),
+            'max_length': model_config['max_length'],
+            'temperature': model_config['temperature'],
+            'top_p': model_config['top_p'],
+            'repetition_penalty': model_config.get('repetition_penalty', 1.1),
+            'stop_strings': model_config.get('stop_strings'),
+            'stop_on_repetition': model_config.get('stop_on_repetition'),
+            'generation': generation,
+        }
+        self.context_hash = self._hash(json.dumps(context, sort_keys=True))
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def key(self, paragraph: str) -> str:
+        """Return the content address of a paragraph in this context"""
+        return self._hash(f"{self.context_hash}\n{paragraph.strip()}")
+
+    def _entry_file(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, paragraph: str) -> Optional[str]:
+        """Return the stored revision of a paragraph, or None"""
+        entry_file = self._entry_file(self.key(paragraph))
+        try:
+            with open(entry_file, 'r', encoding='utf-8') as f:
+                return json.load(f)['revised']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def put(self, paragraph: str, revised: str) -> None:
+        """Store the revision of a paragraph"""
+        entry_file = self._entry_file(self.key(paragraph))
+        entry_file.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_file = entry_file.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'revised': revised,
+                'context': self.context_hash,
+                'created': datetime.now().isoformat()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, entry_file)
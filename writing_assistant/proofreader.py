@@ -0,0 +1,269 @@
+"""Offline document proofreading"""
+
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+
+# Appended to the proofread prompt: the output is spliced back into the document
+DOCUMENT_INSTRUCTIONS = """You are proofreading one paragraph of a longer document.
+Return only the revised paragraph, with no explanation, heading or commentary.
+Keep Markdown and LaTeX markup, citations and references unchanged.
+If the paragraph needs no changes, return it unchanged."""
+
+# Sections of a mode's prompt that only make sense for a chat reply: the proofread
+# prompt's response format asks for an explanation after the revised text
+CHAT_ONLY_SECTIONS = ('Response Format',)
+
+_SECTION_HEADING = re.compile(r'^\*\*(.+?):?\*\*:?\s*$')
+_BLANK_LINE = re.compile(r'\n[ \t]*\n')
+
+
+def document_prompt(mode_instructions: str) -> str:
+    """Return the mode's instructions for proofreading one paragraph of a document
+
+    Bold-headed sections listed in CHAT_ONLY_SECTIONS are dropped and
+    DOCUMENT_INSTRUCTIONS appended, so nothing asks for text besides the
+    revised paragraph.
+    """
+    kept: List[str] = []
+    skipping = False
+    for line in mode_instructions.splitlines():
+        heading = _SECTION_HEADING.match(line.strip())
+        if heading:
+            skipping = heading.group(1).strip() in CHAT_ONLY_SECTIONS
+        if not skipping:
+            kept.append(line)
+    instructions = '\n'.join(kept).strip()
+    return f"{instructions}\n\n{DOCUMENT_INSTRUCTIONS}" if instructions else DOCUMENT_INSTRUCTIONS
+
+
+def revised_paragraph(response: str) -> str:
+    """Return the revised paragraph of a reply, without any commentary after it
+
+    A paragraph has no blank lines, so anything after the first one is an
+    explanation that must not be spliced into the document.
+    """
+    return _BLANK_LINE.split(response.strip(), 1)[0].rstrip()
+
+
+class Block(NamedTuple):
+    """A piece of the document: a paragraph to proofread, or text passed through verbatim"""
+    text: str
+    proofread: bool
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.lstrip()
+    return stripped.startswith('#') or stripped.startswith('\\section') or stripped.startswith('\\subsection')
+
+
+def iter_blocks(lines: Iterable[str]) -> Iterator[Block]:
+    """Split a document into paragraphs and verbatim blocks, preserving every character
+
+    Paragraphs are runs of non-blank lines. Blank lines, headings, fenced
+    code blocks, display math and tables are yielded verbatim. Joining the
+    text of all blocks reproduces the input exactly.
+    """
+    paragraph: List[str] = []
+    fence: Optional[str] = None
+    verbatim: List[str] = []
+
+    def flush_paragraph():
+        if paragraph:
+            text = ''.join(paragraph)
+            paragraph.clear()
+            return Block(text, True)
+        return None
+
+    for line in lines:
+        stripped = line.strip()
+
+        # Inside a fenced code block or display math: copy until the fence closes
+        if fence is not None:
+            verbatim.append(line)
+            if stripped.startswith(fence):
+                yield Block(''.join(verbatim), False)
+                verbatim.clear()
+                fence = None
+            continue
+
+        if stripped.startswith('```') or stripped.startswith('~~~') or stripped == '$$':
+            block = flush_paragraph()
+            if block:
+                yield block
+            fence = stripped[:3] if stripped != '$$' else '$$'
+            verbatim.append(line)
+            continue
+
+        if not stripped or _is_heading(line) or stripped.startswith('|'):
+            block = flush_paragraph()
+            if block:
+                yield block
+            yield Block(line, False)
+            continue
+
+        paragraph.append(line)
+
+    block = flush_paragraph()
+    if block:
+        yield block
+    if verbatim:
+        # Unterminated fence: keep the rest of the document as is
+        yield Block(''.join(verbatim), False)
+
+
+class DocumentProofreader:
+    """Proofread a document paragraph by paragraph using batched generation
+
+    The document is read lazily and processed in windows of a few
+    micro-batches, so memory stays bounded by the window size rather than
+    the document size. Revised paragraphs are written in input order.
+    """
+
+    def __init__(
+        self,
+        model_loader,
+        system_prompt: str,
+        batch_size: Optional[int] = None,
+        store=None,
+        refresh: bool = False,
+        rules=None
+    ):
+        """Initialize with a loaded QWenModelLoader and the proofread system prompt
+
+        With a ProofreadStore, paragraphs proofread before in the same
+        context are taken from the store and only changed or new paragraphs
+        are sent to the model; refresh regenerates them all. rules (the
+        mode's GenerationRules for the submode) give each paragraph its own
+        token budget and add the mode's stop strings to model.stop_strings.
+        """
+        self.model_loader = model_loader
+        self.system_prompt = system_prompt
+        self.store = store
+        self.refresh = refresh
+        self.rules = rules
+        self.batch_size = batch_size or model_loader.model_config.get('batch_size', 8)
+        # Several micro-batches per window give generate_batch room to bucket by length
+        self.window_size = self.batch_size * 4
+        self.stats: Dict[str, Any] = {}
+
+    @staticmethod
+    def count_paragraphs(input_path: str) -> int:
+        """Count the paragraphs that will be proofread, without holding the document"""
+        with open(input_path, 'r', encoding='utf-8') as f:
+            return sum(1 for block in iter_blocks(f) if block.proofread)
+
+    def _revise(self, paragraphs: List[str]) -> List[str]:
+        """Proofread a window of paragraphs, reusing stored results where possible"""
+        revised: List[Optional[str]] = [None] * len(paragraphs)
+        if self.store is not None and not self.refresh:
+            revised = [self.store.get(paragraph) for paragraph in paragraphs]
+        missing = [i for i, text in enumerate(revised) if text is None]
+        self.stats['reused'] += len(paragraphs) - len(missing)
+
+        if missing:
+            conversations = [
+                [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": paragraphs[i].strip()}
+                ]
+                for i in missing
+            ]
+            model_config = self.model_loader.model_config
+            stop_strings = list(model_config.get('stop_strings') or [])
+            max_new_tokens = None
+            if self.rules is not None:
+                stop_strings += self.rules.stop_strings
+                max_new_tokens = [
+                    self.rules.max_new_tokens(paragraphs[i], lambda i=i: self.model_loader.count_tokens(paragraphs[i]))
+                    for i in missing
+                ]
+            responses = self.model_loader.generate_batch(
+                conversations, batch_size=self.batch_size, max_new_tokens=max_new_tokens, stop_strings=stop_strings
+            )
+
+            batch_stats = self.model_loader.last_generation_stats
+            for key in ('prompt_tokens', 'padding_tokens', 'new_tokens'):
+                self.stats[key] += batch_stats.get(key, 0)
+            for reason, count in batch_stats.get('stop_reasons', {}).items():
+                self.stats['stop_reasons'][reason] = self.stats['stop_reasons'].get(reason, 0) + count
+
+            for i, response in zip(missing, responses):
+                response = revised_paragraph(response)
+                # An empty response keeps the original paragraph and is not stored
+                revised[i] = response or paragraphs[i].strip()
+                if response and self.store is not None:
+                    self.store.put(paragraphs[i], response)
+
+        return revised
+
+    def _write_window(self, out, window: List[Block]) -> int:
+        """Proofread the paragraphs of a window and write all its blocks in order"""
+        paragraphs = [block.text for block in window if block.proofread]
+        revised = iter(self._revise(paragraphs)) if paragraphs else iter(())
+
+        for block in window:
+            if not block.proofread:
+                out.write(block.text)
+                continue
+            # Keep the paragraph's original line ending
+            ending = block.text[len(block.text.rstrip('\r\n')):]
+            out.write(next(revised) + ending)
+
+        return len(paragraphs)
+
+    def proofread_file(
+        self,
+        input_path: str,
+        output_path: str,
+        on_progress: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """Proofread input_path into output_path and return throughput statistics"""
+        self.stats = {
+            'paragraphs': 0,
+            'reused': 0,
+            'words': 0,
+            'prompt_tokens': 0,
+            'padding_tokens': 0,
+            'new_tokens': 0,
+            'stop_reasons': {}
+        }
+        started = time.perf_counter()
+
+        # Write to a temporary file so an interrupted run leaves no half document
+        output = Path(output_path)
+        tmp_output = output.with_name(f".{output.name}.partial")
+
+        with open(input_path, 'r', encoding='utf-8') as src, \
+                open(tmp_output, 'w', encoding='utf-8') as out:
+            window: List[Block] = []
+            pending = 0
+
+            for block in iter_blocks(src):
+                window.append(block)
+                if block.proofread:
+                    pending += 1
+                    self.stats['words'] += len(block.text.split())
+                if pending >= self.window_size:
+                    done = self._write_window(out, window)
+                    self.stats['paragraphs'] += done
+                    if on_progress:
+                        on_progress(done)
+                    window, pending = [], 0
+
+            if window:
+                done = self._write_window(out, window)
+                self.stats['paragraphs'] += done
+                if on_progress:
+                    on_progress(done)
+
+        os.replace(tmp_output, output)
+
+        elapsed = time.perf_counter() - started
+        self.stats['total_time'] = round(elapsed, 2)
+        self.stats['paragraphs_per_second'] = round(self.stats['paragraphs'] / elapsed, 3) if elapsed > 0 else 0.0
+        self.stats['tokens_per_second'] = round(self.stats['new_tokens'] / elapsed, 2) if elapsed > 0 else 0.0
+        return self.stats
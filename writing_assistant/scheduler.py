@@ -0,0 +1,373 @@
+"""Continuous batching scheduler for concurrent generation requests"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+from .kv_cache import cache_from_tensors, cache_to_tensors
+
+
+class GenerationRequest:
+    """A generation request handled by the ContinuousBatchScheduler
+
+    Sampled token ids are pushed to a queue as soon as they are produced;
+    consumers read them with iter_tokens() or iter_text(). When the
+    request ends, finish_reason is set to "stop", "length", "cancelled"
+    or "error".
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        repetition_penalty: float = 1.0,
+        username: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None
+    ):
+        """Initialize a request for a tokenized prompt (messages are kept for logging)"""
+        self.request_id = next(self._ids)
+        self.prompt_ids = prompt_ids
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.username = username
+        self.output_ids: List[int] = []
+        self.finish_reason: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.submitted_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        self._tokens: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._next_token: Optional[int] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finish_reason is not None
+
+    def cancel(self) -> None:
+        """Ask the scheduler to stop generating for this request"""
+        self.cancelled.set()
+
+    def _push(self, token: Optional[int]) -> None:
+        """Hand a token id (None once finished) to the consumer; called by the scheduler thread"""
+        self._tokens.put(token)
+
+    def iter_tokens(self) -> Iterator[int]:
+        """Yield generated token ids until the request finishes"""
+        while True:
+            token = self._tokens.get()
+            if token is None:
+                break
+            yield token
+        if self.error is not None:
+            raise self.error
+
+    def iter_text(self, tokenizer) -> Iterator[str]:
+        """Yield decoded text deltas as tokens arrive"""
+        decoder = IncrementalDecoder(tokenizer)
+        for token in self.iter_tokens():
+            text = decoder.push(token)
+            if text:
+                yield text
+        text = decoder.flush()
+        if text:
+            yield text
+
+
+class IncrementalDecoder:
+    """Turn a stream of token ids into text deltas"""
+
+    def __init__(self, tokenizer):
+        """Initialize for a tokenizer"""
+        self.tokenizer = tokenizer
+        self.ids: List[int] = []
+        self.emitted = ""
+
+    def push(self, token: int) -> str:
+        """Add a token and return the new text, if any"""
+        self.ids.append(token)
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True)
+        # Wait for the rest of a multi-byte character
+        if text.endswith('�') or len(text) <= len(self.emitted):
+            return ""
+        delta = text[len(self.emitted):]
+        self.emitted = text
+        return delta
+
+    def flush(self) -> str:
+        """Return whatever text is still held back"""
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True)
+        delta = text[len(self.emitted):] if len(text) > len(self.emitted) else ""
+        self.emitted = text
+        return delta
+
+
+class ContinuousBatchScheduler:
+    """Run many generation requests through one model with iteration-level batching
+
+    A background thread owns the model. At every decoding step it admits
+    waiting requests (prefilling each prompt and merging its key/value
+    states into the running batch), runs one forward pass over all active
+    sequences and removes finished ones, so short requests never wait for
+    long ones to complete. Sequences of different lengths share a
+    left-padded batch cache masked by the attention mask.
+    """
+
+    def __init__(self, model_loader, max_batch_size: int = 8):
+        """Initialize the scheduler for a loaded QWenModelLoader"""
+        if model_loader.model is None or model_loader.tokenizer is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+
+        self.model = model_loader.model
+        self.tokenizer = model_loader.tokenizer
+        self.device = self.model.device
+        self.max_batch_size = max_batch_size
+
+        eos = self.model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, list) else [eos]
+        self.eos_token_ids = {t for t in eos + [self.tokenizer.eos_token_id] if t is not None}
+
+        self._waiting: deque = deque()
+        self._admissions = 0
+        self._last_admitted: Dict[Optional[str], int] = {}  # username -> admission number
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Batch state: one row per active request
+        self._active: List[GenerationRequest] = []
+        self._layers: Optional[list] = None  # per-layer (keys, values) of shape (batch, heads, width, dim)
+        self._lengths: List[int] = []  # real tokens per row, also the next position id
+        self._pads: List[int] = []  # left padding per row
+
+        self.stats: Dict[str, Any] = {'requests': 0, 'steps': 0, 'new_tokens': 0, 'peak_batch': 0}
+
+    def start(self) -> None:
+        """Start the scheduler thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the scheduler thread, cancelling unfinished requests"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, request: GenerationRequest) -> GenerationRequest:
+        """Queue a request for generation"""
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Scheduler is not running")
+            self._waiting.append(request)
+            self.stats['requests'] += 1
+            self._condition.notify()
+        return request
+
+    def pending(self) -> int:
+        """Number of requests waiting or being generated"""
+        with self._condition:
+            return len(self._waiting) + len(self._active)
+
+    def _next_waiting(self) -> GenerationRequest:
+        """Pick the next waiting request to admit
+
+        Users take turns: the oldest request of the user admitted least
+        recently goes first, so a burst of requests from one user does not
+        hold back everyone else. Requests without a username share a turn.
+        """
+        request = min(self._waiting, key=lambda r: self._last_admitted.get(r.username, 0))
+        self._waiting.remove(request)
+        self._admissions += 1
+        self._last_admitted[request.username] = self._admissions
+        return request
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._waiting and not self._active:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                admitted = []
+                while self._waiting and len(self._active) + len(admitted) < self.max_batch_size:
+                    admitted.append(self._next_waiting())
+
+            try:
+                for request in admitted:
+                    if request.cancelled.is_set():
+                        self._finish(request, 'cancelled')
+                    else:
+                        self._prefill(request)
+                for request in self._active:
+                    if request.cancelled.is_set() and not request.finished:
+                        self._finish(request, 'cancelled')
+                self._remove_finished()
+                if self._active:
+                    self._decode_step()
+            except Exception as e:
+                for request in self._active + admitted:
+                    if not request.finished:
+                        self._finish(request, 'error', e)
+                self._active, self._layers, self._lengths, self._pads = [], None, [], []
+
+        # Shutting down: release everyone still waiting on tokens
+        for request in self._active + list(self._waiting):
+            if not request.finished:
+                self._finish(request, 'cancelled')
+        self._waiting.clear()
+        self._active, self._layers, self._lengths, self._pads = [], None, [], []
+
+    def _finish(self, request: GenerationRequest, reason: str, error: Optional[Exception] = None) -> None:
+        request.finish_reason = reason
+        request.error = error
+        request._push(None)
+
+    def _emit(self, request: GenerationRequest, token: int) -> None:
+        """Record a sampled token and decide whether the request is done"""
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+        if token in self.eos_token_ids:
+            self._finish(request, 'stop')
+            return
+
+        request.output_ids.append(token)
+        request._next_token = token
+        request._push(token)
+        self.stats['new_tokens'] += 1
+        if len(request.output_ids) >= request.max_new_tokens:
+            self._finish(request, 'length')
+
+    def _prefill(self, request: GenerationRequest) -> None:
+        """Run the prompt of a new request and merge its states into the batch"""
+        input_ids = torch.tensor([request.prompt_ids], device=self.device)
+        with torch.no_grad():
+            # Only the last position's logits are sampled from
+            outputs = self.model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True,
+                                 logits_to_keep=1)
+
+        layers = cache_to_tensors(outputs.past_key_values)
+        width = layers[0][0].shape[2]
+
+        if self._layers is None:
+            self._layers = layers
+            self._lengths, self._pads = [], []
+        else:
+            batch_width = self._layers[0][0].shape[2]
+            if width < batch_width:
+                layers = [(_pad_left(k, batch_width - width), _pad_left(v, batch_width - width)) for k, v in layers]
+            elif width > batch_width:
+                extra = width - batch_width
+                self._layers = [(_pad_left(k, extra), _pad_left(v, extra)) for k, v in self._layers]
+                self._pads = [pad + extra for pad in self._pads]
+            self._layers = [
+                (torch.cat([bk, k]), torch.cat([bv, v]))
+                for (bk, bv), (k, v) in zip(self._layers, layers)
+            ]
+
+        self._active.append(request)
+        self._lengths.append(len(request.prompt_ids))
+        self._pads.append(self._layers[0][0].shape[2] - len(request.prompt_ids))
+        self.stats['peak_batch'] = max(self.stats['peak_batch'], len(self._active))
+
+        token = self._sample(outputs.logits[:, -1, :], [request])[0]
+        self._emit(request, token)
+
+    def _decode_step(self) -> None:
+        """Feed the last sampled token of every active row through the model"""
+        batch = len(self._active)
+        width = self._layers[0][0].shape[2]
+
+        input_ids = torch.tensor([[r._next_token] for r in self._active], device=self.device)
+        position_ids = torch.tensor([[length] for length in self._lengths], device=self.device)
+        attention_mask = torch.ones((batch, width + 1), dtype=torch.long, device=self.device)
+        for row, pad in enumerate(self._pads):
+            attention_mask[row, :pad] = 0
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=cache_from_tensors(self._layers),
+                use_cache=True
+            )
+
+        self._layers = cache_to_tensors(outputs.past_key_values)
+        self._lengths = [length + 1 for length in self._lengths]
+        self.stats['steps'] += 1
+
+        tokens = self._sample(outputs.logits[:, -1, :], self._active)
+        for request, token in zip(self._active, tokens):
+            self._emit(request, token)
+        self._remove_finished()
+
+    def _remove_finished(self) -> None:
+        """Drop finished rows from the batch and trim padding shared by all rows"""
+        keep = [row for row, request in enumerate(self._active) if not request.finished]
+        if len(keep) == len(self._active):
+            return
+        if not keep:
+            self._active, self._layers, self._lengths, self._pads = [], None, [], []
+            return
+
+        index = torch.tensor(keep, device=self.device)
+        self._layers = [(k.index_select(0, index), v.index_select(0, index)) for k, v in self._layers]
+        self._active = [self._active[row] for row in keep]
+        self._lengths = [self._lengths[row] for row in keep]
+        self._pads = [self._pads[row] for row in keep]
+
+        shared = min(self._pads)
+        if shared > 0:
+            self._layers = [(k[:, :, shared:, :], v[:, :, shared:, :]) for k, v in self._layers]
+            self._pads = [pad - shared for pad in self._pads]
+
+    def _sample(self, logits: torch.Tensor, requests: List[GenerationRequest]) -> List[int]:
+        """Sample one token per row with each request's own sampling parameters"""
+        logits = logits.float()
+        tokens = []
+        for row, request in enumerate(requests):
+            scores = logits[row]
+
+            if request.repetition_penalty != 1.0:
+                seen = torch.tensor(request.prompt_ids + request.output_ids, device=scores.device).unique()
+                picked = scores[seen]
+                scores[seen] = torch.where(picked < 0, picked * request.repetition_penalty,
+                                           picked / request.repetition_penalty)
+
+            if request.temperature <= 0:
+                tokens.append(int(scores.argmax()))
+                continue
+
+            probs = torch.softmax(scores / request.temperature, dim=-1)
+            if request.top_p < 1.0:
+                sorted_probs, sorted_index = probs.sort(descending=True)
+                outside = sorted_probs.cumsum(-1) - sorted_probs > request.top_p
+                sorted_probs[outside] = 0.0
+                choice = torch.multinomial(sorted_probs, 1)
+                tokens.append(int(sorted_index[choice]))
+            else:
+                tokens.append(int(torch.multinomial(probs, 1)))
+
+        return tokens
+
+
+def _pad_left(tensor: torch.Tensor, amount: int) -> torch.Tensor:
+    """Left-pad the sequence dimension of a (batch, heads, seq, dim) tensor with zeros"""
+    return F.pad(tensor, (0, 0, amount, 0))
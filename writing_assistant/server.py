@@ -0,0 +1,308 @@
+"""OpenAI-compatible HTTP server sharing one loaded model"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from .prompts import mode_submodes
+from .scheduler import ContinuousBatchScheduler, GenerationRequest
+from .session_manager import SessionManager, valid_username
+
+
+def finish_reason(request: GenerationRequest) -> str:
+    """Return the OpenAI finish_reason of a finished request
+
+    The API knows "stop" and "length" only: a request cancelled by the
+    client or by shutdown reports "stop". Failed requests are reported as
+    errors instead.
+    """
+    return 'length' if request.finish_reason == 'length' else 'stop'
+
+
+def _setting(body: Dict[str, Any], key: str, default: Any) -> Any:
+    """Return a sampling setting of a request; a missing or null value means the default"""
+    value = body.get(key)
+    return default if value is None else value
+
+
+class RequestError(Exception):
+    """An invalid API request, reported to the client with an HTTP status"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatService:
+    """Serve chat completions for many users from one QWenModelLoader
+
+    Mode prompts from ``prompts/*.yaml`` are applied server-side: a request
+    selects a mode with the ``mode``/``submode`` fields, or with a model
+    name of the form ``<mode>`` or ``<mode>:<submode>``. Client system
+    messages are added as custom instructions. Each username (the
+    OpenAI ``user`` field) gets its own SessionManager log.
+    """
+
+    def __init__(self, model_loader, config_path: str = "config.yaml", prompts_dir: str = "prompts",
+                 max_batch_size: Optional[int] = None):
+        """Initialize the service and start the batch scheduler"""
+        self.model_loader = model_loader
+        self.config_path = config_path
+        self.server_config = model_loader.config.get('server', {})
+        self.model_name = Path(model_loader.model_config['name']).name
+
+        self.modes: Dict[str, Dict[str, Any]] = {}
+        for mode_file in sorted(Path(prompts_dir).glob("*.yaml")):
+            with open(mode_file, 'r') as f:
+                self.modes[mode_file.stem] = yaml.safe_load(f) or {}
+
+        self.scheduler = ContinuousBatchScheduler(
+            model_loader,
+            max_batch_size or self.server_config.get('max_batch_size', 8)
+        )
+        self.scheduler.start()
+
+        self._sessions: Dict[str, Tuple[SessionManager, threading.Lock]] = {}
+        self._sessions_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Stop the scheduler and end all user sessions"""
+        self.scheduler.stop()
+        with self._sessions_lock:
+            for session_manager, lock in self._sessions.values():
+                with lock:
+                    session_manager.end_session()
+            self._sessions.clear()
+
+    def list_models(self) -> Dict[str, Any]:
+        """Return the /v1/models listing: the model itself plus one entry per mode"""
+        names = [self.model_name] + sorted(self.modes)
+        for mode, mode_config in sorted(self.modes.items()):
+            names += [f"{mode}:{submode}" for submode in mode_submodes(mode_config)]
+        return {
+            "object": "list",
+            "data": [{"id": name, "object": "model", "owned_by": "writing-assistant"} for name in names]
+        }
+
+    def _resolve_mode(self, body: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        mode, submode = body.get('mode'), body.get('submode')
+        model = body.get('model') or ''
+        if mode is None and model.split(':')[0] in self.modes:
+            mode, _, submode = model.partition(':')
+            submode = submode or None
+
+        if mode is None and submode is not None:
+            raise RequestError("'submode' requires a 'mode'")
+        if mode is not None and mode not in self.modes:
+            raise RequestError(f"Unknown mode: {mode}", 404)
+        if submode is not None and submode not in mode_submodes(self.modes[mode]):
+            raise RequestError(f"Unknown submode for {mode}: {submode}", 404)
+        return mode, submode
+
+    def build_messages(self, body: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Apply the server-side system prompt to the client's messages"""
+        messages = body.get('messages')
+        if not isinstance(messages, list) or not messages:
+            raise RequestError("'messages' must be a non-empty list")
+
+        mode, submode = self._resolve_mode(body)
+        instructions = []
+        if mode is not None:
+            instructions.append(self.modes[mode].get(submode or 'custom_instructions', ''))
+
+        conversation = []
+        for message in messages:
+            if not isinstance(message, dict) or 'role' not in message:
+                raise RequestError("Each message needs a 'role' and 'content'")
+            content = message.get('content') or ''
+            if isinstance(content, list):
+                # Content parts: keep the text ones
+                content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+            if message['role'] == 'system':
+                instructions.append(content)
+            else:
+                conversation.append({"role": message['role'], "content": content})
+
+        system_prompt = self.model_loader.get_system_prompt('\n\n'.join(i for i in instructions if i) or None)
+        return [{"role": "system", "content": system_prompt}] + conversation
+
+    def create_request(self, body: Dict[str, Any]) -> GenerationRequest:
+        """Tokenize a chat completion request and submit it to the scheduler"""
+        username = body.get('user')
+        if username is not None and not valid_username(username):
+            raise RequestError("Invalid 'user': use letters, digits, '_', '-' and '.' (not starting with '.')")
+        messages = self.build_messages(body)
+        model_config = self.model_loader.model_config
+        text = self.model_loader.tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+        request = GenerationRequest(
+            self.model_loader.tokenizer(text)['input_ids'],
+            max_new_tokens=int(body.get('max_tokens') or body.get('max_completion_tokens') or model_config['max_length']),
+            temperature=float(_setting(body, 'temperature', model_config['temperature'])),
+            top_p=float(_setting(body, 'top_p', model_config['top_p'])),
+            repetition_penalty=model_config.get('repetition_penalty', 1.1),
+            username=username,
+            messages=messages
+        )
+        return self.scheduler.submit(request)
+
+    def log_exchange(self, request: GenerationRequest, response: str) -> None:
+        """Log the last user message and the response to the user's session"""
+        if not request.username:
+            return
+
+        with self._sessions_lock:
+            if request.username not in self._sessions:
+                session_manager = SessionManager(self.config_path)
+                session_manager.start_session(request.username, "served over HTTP")
+                self._sessions[request.username] = (session_manager, threading.Lock())
+            session_manager, lock = self._sessions[request.username]
+
+        user_messages = [m for m in request.messages if m['role'] == 'user']
+        with lock:
+            if user_messages:
+                session_manager.add_message("user", user_messages[-1]['content'])
+            session_manager.add_message("assistant", response, metadata={
+                'prompt_tokens': len(request.prompt_ids),
+                'new_tokens': len(request.output_ids),
+                'finish_reason': request.finish_reason,
+                'time_to_first_token': round((request.first_token_at or time.perf_counter()) - request.submitted_at, 3)
+            })
+
+
+def make_handler(service: ChatService):
+    """Create a request handler class bound to a ChatService"""
+
+    class ChatRequestHandler(BaseHTTPRequestHandler):
+        server_version = "WritingAssistant/1.0"
+
+        def log_message(self, format, *args):
+            # Requests are logged per user by SessionManager; keep stderr quiet
+            pass
+
+        def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_error(self, message: str, status: int, error_type: str = "invalid_request_error") -> None:
+            self._send_json({"error": {"message": message, "type": error_type}}, status)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/v1/models':
+                self._send_json(service.list_models())
+            elif self.path.rstrip('/') == '/health':
+                self._send_json({"status": "ok", "pending": service.scheduler.pending()})
+            else:
+                self._send_error(f"Not found: {self.path}", 404)
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/chat/completions':
+                self._send_error(f"Not found: {self.path}", 404)
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                request = service.create_request(body)
+            except RequestError as e:
+                self._send_error(str(e), e.status)
+                return
+            except (ValueError, TypeError) as e:
+                self._send_error(f"Invalid request: {e}", 400)
+                return
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = body.get('model') or service.model_name
+            if body.get('stream'):
+                self._stream(request, completion_id, model)
+            else:
+                self._complete(request, completion_id, model)
+
+        def _complete(self, request: GenerationRequest, completion_id: str, model: str) -> None:
+            try:
+                response = ''.join(request.iter_text(service.model_loader.tokenizer)).strip()
+            except Exception as e:
+                self._send_error(f"Generation failed: {e}", 500, "server_error")
+                return
+
+            service.log_exchange(request, response)
+            self._send_json({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": response},
+                    "finish_reason": finish_reason(request)
+                }],
+                "usage": {
+                    "prompt_tokens": len(request.prompt_ids),
+                    "completion_tokens": len(request.output_ids),
+                    "total_tokens": len(request.prompt_ids) + len(request.output_ids)
+                }
+            })
+
+        def _stream(self, request: GenerationRequest, completion_id: str, model: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            def chunk(delta: Dict[str, str], finish_reason: Optional[str] = None) -> bytes:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+            pieces = []
+            try:
+                self.wfile.write(chunk({"role": "assistant", "content": ""}))
+                for text in request.iter_text(service.model_loader.tokenizer):
+                    pieces.append(text)
+                    self.wfile.write(chunk({"content": text}))
+                    self.wfile.flush()
+                self.wfile.write(chunk({}, finish_reason(request)))
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client went away: free the batch slot
+                request.cancel()
+            except Exception as e:
+                # Headers are sent: report the failure in the stream, as the OpenAI API does
+                request.cancel()
+                error = {"error": {"message": f"Generation failed: {e}", "type": "server_error"}}
+                try:
+                    self.wfile.write(f"data: {json.dumps(error, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except OSError:
+                    pass
+                return
+
+            service.log_exchange(request, ''.join(pieces).strip())
+
+    return ChatRequestHandler
+
+
+def create_server(service: ChatService, host: str, port: int) -> ThreadingHTTPServer:
+    """Create the HTTP server; call serve_forever() to run it"""
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,105 @@
+"""Compressed monthly archives of finished session logs"""
+
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from .file_lock import locked
+
+
+class SessionArchive:
+    """Pack finished session logs into one compressed segment per user per month
+
+    ``<log_directory>/<user>/archive/<YYYY-MM>.jsonl.gz`` holds the logs of
+    the month's sessions, each as its own gzip member, so a session can be
+    decompressed without touching the others. The sidecar
+    ``<YYYY-MM>.index.json`` maps each session id to the offset and length
+    of its member. The segment is a valid gzip file: ``zcat`` prints all of
+    its logs.
+    """
+
+    def __init__(self, log_directory: str):
+        """Initialize for a log directory"""
+        self.log_directory = Path(log_directory)
+
+    def archive_dir(self, username: str) -> Path:
+        return self.log_directory / username / 'archive'
+
+    @staticmethod
+    def month_of(session_id: str) -> str:
+        """Return the YYYY-MM segment a session belongs to (session ids start with YYYYMMDD)"""
+        return f"{session_id[:4]}-{session_id[4:6]}"
+
+    def _segment(self, username: str, month: str) -> Path:
+        return self.archive_dir(username) / f"{month}.jsonl.gz"
+
+    def _index_file(self, username: str, month: str) -> Path:
+        return self.archive_dir(username) / f"{month}.index.json"
+
+    def _load_index(self, index_file: Path) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)['sessions']
+        except FileNotFoundError:
+            return {}
+
+    def list_sessions(self, username: str) -> Dict[str, str]:
+        """Return {session_id: month} for all archived sessions of a user"""
+        sessions = {}
+        archive_dir = self.archive_dir(username)
+        if archive_dir.exists():
+            for index_file in archive_dir.glob("*.index.json"):
+                month = index_file.name[:-len('.index.json')]
+                sessions.update({session_id: month for session_id in self._load_index(index_file)})
+        return sessions
+
+    def contains(self, username: str, session_id: str) -> bool:
+        """Whether a session is in its month's segment"""
+        return session_id in self._load_index(self._index_file(username, self.month_of(session_id)))
+
+    def read_session(self, username: str, session_id: str) -> Optional[bytes]:
+        """Return the raw JSONL log of an archived session, or None"""
+        month = self.month_of(session_id)
+        entry = self._load_index(self._index_file(username, month)).get(session_id)
+        if entry is None:
+            return None
+        with open(self._segment(username, month), 'rb') as f:
+            f.seek(entry['offset'])
+            return gzip.decompress(f.read(entry['length']))
+
+    def add_session(self, username: str, session_id: str, log_file: Path) -> int:
+        """Append a session log to its month's segment and return the compressed size
+
+        The segment is locked while it is appended to and the index is
+        replaced atomically afterwards, so a crash leaves at most unreferenced
+        bytes at the end of the segment. The log file itself is not removed.
+        """
+        month = self.month_of(session_id)
+        segment = self._segment(username, month)
+        index_file = self._index_file(username, month)
+        segment.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(log_file, 'rb') as f:
+            raw = f.read()
+        member = gzip.compress(raw)
+
+        with open(segment, 'ab') as out, locked(out):
+            index = self._load_index(index_file)
+            if session_id in index:
+                return index[session_id]['length']
+            offset = out.seek(0, os.SEEK_END)
+            out.write(member)
+            out.flush()
+            os.fsync(out.fileno())
+
+            index[session_id] = {'offset': offset, 'length': len(member), 'size': len(raw)}
+            tmp_file = index_file.with_suffix(f".tmp{os.getpid()}")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'segment': segment.name, 'sessions': index}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, index_file)
+
+        return len(member)
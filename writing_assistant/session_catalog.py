@@ -0,0 +1,420 @@
+"""SQLite catalog of session logs"""
+
+import io
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from .session_archive import SessionArchive
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    username TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    started_at TEXT,
+    ended_at TEXT,
+    mode TEXT,
+    message_count INTEGER,
+    log_size INTEGER,
+    PRIMARY KEY (username, session_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_by_start ON sessions (username, started_at);
+CREATE TABLE IF NOT EXISTS messages (
+    username TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    timestamp TEXT,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (username, session_id, seq)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS message_text USING fts5(
+    content,
+    username UNINDEXED,
+    session_id UNINDEXED,
+    seq UNINDEXED,
+    role UNINDEXED,
+    timestamp UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS text_sessions (
+    username TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    first_rowid INTEGER NOT NULL,
+    message_count INTEGER NOT NULL,
+    PRIMARY KEY (username, session_id)
+);
+"""
+
+# Marks the matched terms in search snippets
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+SORT_ORDERS = {
+    'newest': 'started_at DESC',
+    'oldest': 'started_at ASC',
+    'messages': 'message_count DESC, started_at DESC',
+}
+
+
+# Filesystems on which SQLite's WAL mode is unsafe: its shared-memory index needs a local disk
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'afs', '9p', 'ceph', 'glusterfs', 'lustre')
+
+
+def filesystem_type(path: Path) -> Optional[str]:
+    """Return the type of the filesystem holding path, from /proc/mounts (None where that is unavailable)"""
+    try:
+        with open('/proc/mounts', 'r') as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best: Optional[Tuple[str, str]] = None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        # Spaces in mount points are escaped as \040
+        mount_point = fields[1].replace('\\040', ' ')
+        if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+            if best is None or len(mount_point) > len(best[0]):
+                best = (mount_point, fields[2])
+    return best[1] if best else None
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching all of its words"""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def scan_log(log: BinaryIO) -> Tuple[Dict[str, Any], List[Tuple[str, str, int, int]]]:
+    """Read a session log once and return its catalog row and message (role, timestamp, offset, length) entries"""
+    session: Dict[str, Any] = {'started_at': None, 'ended_at': None, 'mode': None}
+    messages = []
+    offset = 0
+    with log as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                offset += len(line)
+                continue
+            kind = entry.get('type')
+            if kind == 'message':
+                messages.append((entry['role'], entry.get('timestamp'), offset, len(line)))
+            elif kind == 'session_start':
+                session['started_at'] = entry.get('timestamp')
+                session['mode'] = entry.get('mode')
+            elif kind == 'mode':
+                session['mode'] = entry.get('mode')
+            elif kind == 'session_end':
+                session['ended_at'] = entry.get('timestamp')
+            offset += len(line)
+    session['message_count'] = len(messages)
+    session['log_size'] = offset
+    return session, messages
+
+
+class SessionCatalog:
+    """Index of all sessions under the log directory
+
+    Stores start/end time, mode and message count per session, and the
+    byte offset of every message in its JSONL log, in
+    ``<log_directory>/.catalog.sqlite3`` unless another path is given (the
+    catalog can live on a local disk when the logs are on a network
+    filesystem). The database uses WAL journaling on local disks and the
+    rollback journal (DELETE) on network filesystems, where WAL is not
+    safe. SessionManager updates it as
+    sessions start and end; logs written before the catalog existed are
+    indexed the first time they are listed, and sessions that never ended
+    (their process crashed or was killed) are rescanned whenever their log
+    has grown since it was last scanned.
+
+    Message text goes into an FTS5 full-text index when a session ends.
+    Each session's rows get a contiguous rowid range (text_sessions), so a
+    session can be reindexed without scanning the index.
+    """
+
+    def __init__(self, log_directory: str, path: Optional[str] = None, journal_mode: Optional[str] = None):
+        """Open (and create if needed) the catalog for a log directory
+
+        journal_mode is 'wal' or 'delete'; by default it is chosen from the
+        filesystem holding the catalog.
+        """
+        self.log_directory = Path(log_directory)
+        self.log_directory.mkdir(parents=True, exist_ok=True)
+        self.path = Path(path).expanduser() if path else self.log_directory / '.catalog.sqlite3'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if journal_mode is None:
+            journal_mode = 'delete' if filesystem_type(self.path.parent) in NETWORK_FILESYSTEMS else 'wal'
+        if journal_mode.lower() not in ('wal', 'delete'):
+            raise ValueError(f"Invalid catalog journal mode: {journal_mode!r} (use wal or delete)")
+        self.journal_mode = journal_mode.lower()
+        self.archive = SessionArchive(log_directory)
+        self._lock = threading.Lock()
+        # Shared by the server's handler threads; access is serialized by _lock
+        self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self.conn.execute(f"PRAGMA journal_mode={self.journal_mode.upper()}")
+        # NORMAL is only crash-safe with WAL
+        self.conn.execute(f"PRAGMA synchronous={'NORMAL' if self.journal_mode == 'wal' else 'FULL'}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection"""
+        self.conn.close()
+
+    def log_file(self, username: str, session_id: str) -> Path:
+        """Return the log path of a session"""
+        return self.log_directory / username / f"session_{session_id}.jsonl"
+
+    def open_log(self, username: str, session_id: str) -> BinaryIO:
+        """Open a session log for binary reading, from its file or from the archive"""
+        log_file = self.log_file(username, session_id)
+        if log_file.exists():
+            return open(log_file, 'rb')
+        raw = self.archive.read_session(username, session_id)
+        if raw is None:
+            raise FileNotFoundError(f"Session file not found: {log_file}")
+        return io.BytesIO(raw)
+
+    def start_session(self, username: str, session_id: str, started_at: str, mode: Optional[str] = None) -> None:
+        """Record a new, still open session"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (username, session_id, started_at, mode) VALUES (?, ?, ?, ?)",
+                (username, session_id, started_at, mode)
+            )
+
+    def set_mode(self, username: str, session_id: str, mode: Optional[str]) -> None:
+        """Update the mode of a session"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE sessions SET mode = ? WHERE username = ? AND session_id = ?",
+                (mode, username, session_id)
+            )
+
+    def end_session(self, username: str, session_id: str, ended_at: str,
+                    messages: Iterable[Tuple[str, str, int, int]], log_size: int) -> None:
+        """Record the end of a session, the offsets of its messages and their text"""
+        rows = [(username, session_id, seq, *message) for seq, message in enumerate(messages)]
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM messages WHERE username = ? AND session_id = ?", (username, session_id))
+            self.conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute(
+                "UPDATE sessions SET ended_at = ?, message_count = ?, log_size = ? "
+                "WHERE username = ? AND session_id = ?",
+                (ended_at, len(rows), log_size, username, session_id)
+            )
+            self._index_text(username, session_id, rows)
+
+    def index_log(self, username: str, session_id: str) -> None:
+        """(Re)build the catalog entries of one session from its log file"""
+        session, messages = scan_log(self.open_log(username, session_id))
+        rows = [(username, session_id, seq, *message) for seq, message in enumerate(messages)]
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (username, session_id, session['started_at'], session['ended_at'], session['mode'],
+                 session['message_count'], session['log_size'])
+            )
+            self.conn.execute("DELETE FROM messages WHERE username = ? AND session_id = ?", (username, session_id))
+            self.conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._index_text(username, session_id, rows)
+
+    def _index_text(self, username: str, session_id: str, rows: List[tuple]) -> None:
+        """Replace the full-text rows of a session, reading message text from its log
+
+        Runs inside the caller's transaction. Messages are read one at a
+        time, so memory does not grow with the session.
+        """
+        previous = self.conn.execute(
+            "SELECT first_rowid, message_count FROM text_sessions WHERE username = ? AND session_id = ?",
+            (username, session_id)
+        ).fetchone()
+        if previous is not None:
+            self.conn.execute(
+                "DELETE FROM message_text WHERE rowid BETWEEN ? AND ?",
+                (previous[0], previous[0] + previous[1] - 1)
+            )
+
+        last = self.conn.execute("SELECT rowid FROM message_text ORDER BY rowid DESC LIMIT 1").fetchone()
+        first_rowid = (last[0] if last else 0) + 1
+
+        def text_rows():
+            with self.open_log(username, session_id) as f:
+                for _, _, seq, role, timestamp, offset, length in rows:
+                    f.seek(offset)
+                    content = json.loads(f.read(length))['content']
+                    yield first_rowid + seq, content, username, session_id, seq, role, timestamp
+
+        self.conn.executemany("INSERT INTO message_text (rowid, content, username, session_id, seq, role, timestamp) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)", text_rows())
+        self.conn.execute(
+            "INSERT OR REPLACE INTO text_sessions VALUES (?, ?, ?, ?)",
+            (username, session_id, first_rowid, len(rows))
+        )
+
+    def sync_all(self) -> int:
+        """Catalog and index every user's sessions that are missing or outdated; returns how many were indexed
+
+        Sessions that never ended are rescanned as in sync_user(). Also
+        indexes the text of sessions catalogued before full-text search was
+        available.
+        """
+        added = 0
+        for user_dir in sorted(p for p in self.log_directory.iterdir() if p.is_dir() and not p.name.startswith('.')):
+            added += self.sync_user(user_dir.name)
+
+        with self._lock:
+            unindexed = self.conn.execute(
+                "SELECT username, session_id FROM sessions s WHERE message_count IS NOT NULL AND NOT EXISTS "
+                "(SELECT 1 FROM text_sessions t WHERE t.username = s.username AND t.session_id = s.session_id)"
+            ).fetchall()
+        for username, session_id in unindexed:
+            if self.log_file(username, session_id).exists() or self.archive.contains(username, session_id):
+                self.index_log(username, session_id)
+                added += 1
+        return added
+
+    def search(self, query: str, username: Optional[str] = None, since: Optional[str] = None,
+               until: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return the best-ranked messages matching all words of query
+
+        since/until compare ISO dates or timestamps against the message
+        timestamp, as in find_sessions(). Each result has username,
+        session_id, seq (message index), role, timestamp and a snippet with
+        matches between MATCH_START and MATCH_END.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT username, session_id, seq, role, timestamp, "
+            "snippet(message_text, 0, ?, ?, '…', 16) AS snippet "
+            "FROM message_text WHERE message_text MATCH ?"
+        )
+        params: List[Any] = [MATCH_START, MATCH_END, match]
+        if username is not None:
+            sql += " AND username = ?"
+            params.append(username)
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND timestamp < ?"
+            params.append(until + 'T99' if len(until) == 10 else until)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            cursor = self.conn.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def sync_user(self, username: str) -> int:
+        """Index logs of a user that are missing or outdated in the catalog; returns how many were indexed
+
+        Only the directory listing and archive indexes are read for sessions
+        that ended; sessions that never ended are rescanned (messages and
+        text) when their log size differs from the size last scanned.
+        """
+        user_dir = self.log_directory / username
+        if not user_dir.exists():
+            return 0
+        on_disk = {p.stem[len('session_'):] for p in user_dir.glob("session_*.jsonl")}
+        on_disk.update(self.archive.list_sessions(username))
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self.conn.execute(
+                "SELECT session_id, ended_at, log_size FROM sessions WHERE username = ?", (username,))}
+
+        outdated = sorted(on_disk - known.keys())
+        for session_id, (ended_at, log_size) in known.items():
+            if ended_at is not None:
+                continue
+            try:
+                size = self.log_file(username, session_id).stat().st_size
+            except FileNotFoundError:
+                continue
+            if size != log_size:
+                outdated.append(session_id)
+
+        for session_id in outdated:
+            self.index_log(username, session_id)
+        return len(outdated)
+
+    def find_sessions(
+        self,
+        username: str,
+        mode: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        sort: str = 'newest',
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Return catalogued sessions of a user, filtered, sorted and paginated
+
+        mode matches the mode name or its submode (``nuno-writing-style`` also
+        matches ``nuno-writing-style:proofread``); since/until compare ISO
+        dates or timestamps against the session start.
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {sort}")
+
+        query = "SELECT * FROM sessions WHERE username = ?"
+        params: List[Any] = [username]
+        if mode is not None:
+            query += " AND (mode = ? OR mode LIKE ?)"
+            params += [mode, f"{mode}:%"]
+        if since is not None:
+            query += " AND started_at >= ?"
+            params.append(since)
+        if until is not None:
+            # A bare date includes the whole day
+            query += " AND started_at < ?"
+            params.append(until + 'T99' if len(until) == 10 else until)
+        query += f" ORDER BY {SORT_ORDERS[sort]} LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+
+        with self._lock:
+            cursor = self.conn.execute(query, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def finished_sessions(self, ended_before: str, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return sessions that ended before a timestamp, oldest first"""
+        query = "SELECT username, session_id FROM sessions WHERE ended_at IS NOT NULL AND ended_at < ?"
+        params: List[Any] = [ended_before]
+        if username is not None:
+            query += " AND username = ?"
+            params.append(username)
+        with self._lock:
+            rows = self.conn.execute(query + " ORDER BY started_at", params).fetchall()
+        return [{'username': row[0], 'session_id': row[1]} for row in rows]
+
+    def message_offsets(self, username: str, session_id: str, start: int = 0,
+                        count: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+        """Return (offset, length) of a range of messages, or None if the session is not indexed
+
+        Sessions that are still open (or never ended) return None, as their
+        logs may have grown since. A negative start counts from the end.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT message_count, ended_at FROM sessions WHERE username = ? AND session_id = ?",
+                (username, session_id)
+            ).fetchone()
+            if row is None or row[0] is None or row[1] is None:
+                return None
+            if start < 0:
+                start = max(row[0] + start, 0)
+            return self.conn.execute(
+                "SELECT offset, length FROM messages WHERE username = ? AND session_id = ? AND seq >= ? "
+                "ORDER BY seq LIMIT ?",
+                (username, session_id, start, count if count is not None else -1)
+            ).fetchall()
@@ -2,11 +2,29 @@
 
 import os
 import json
-from datetime import datetime
+import re
+import secrets
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterator, List, Dict, Any, Optional, TextIO, Tuple
 import yaml
 
+from .log_writer import get_log_writer
+from .session_catalog import SessionCatalog
+
+
+# Chat template tokens around each message (<|im_start|>role ... <|im_end|>)
+MESSAGE_OVERHEAD_TOKENS = 5
+
+# Usernames name a directory under the log directory: no separators, no leading dot
+USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]*$')
+
+
+def valid_username(username: Any) -> bool:
+    """Whether username is safe to use as a log directory name"""
+    return isinstance(username, str) and USERNAME_PATTERN.match(username) is not None
+
 
 class SessionManager:
     """Manage user sessions and conversation logging"""
@@ -16,6 +34,7 @@ class SessionManager:
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
 
+        self.config_path = config_path
         self.session_config = self.config['session']
         self.ui_config = self.config['ui']
         self.log_directory = self.session_config['log_directory']
@@ -25,23 +44,44 @@ class SessionManager:
         self.conversation_history = []
         self.user_dir = None
         self.log_file = None
-
-    def start_session(self, username: str, custom_instructions: Optional[str] = None) -> str:
+        # Log entries are appended by a shared background writer
+        self.log_writer = get_log_writer(self.session_config)
+        self.catalog = SessionCatalog(
+            self.log_directory,
+            self.session_config.get('catalog_path'),
+            self.session_config.get('catalog_journal_mode')
+        )
+        self.mode = None
+        self._log_offset = 0
+        self._message_index: List[tuple] = []  # (role, timestamp, offset, length) per logged message
+        self._finalizers: List[threading.Thread] = []
+
+        # Token-budget trimming, enabled by set_token_budget()
+        self.token_counter: Optional[Callable[[str], int]] = None
+        self.system_prompt_tokens = 0
+        self._token_counts: List[int] = []
+
+    def start_session(self, username: str, custom_instructions: Optional[str] = None,
+                      mode: Optional[str] = None) -> str:
         """Start a new session for a user"""
+        if not valid_username(username):
+            raise ValueError(f"Invalid username: {username!r} (use letters, digits, '_', '-' and '.')")
         self.username = username
+        self.mode = mode
         self.session_start = datetime.now()
-        self.session_id = self.session_start.strftime("%Y%m%d_%H%M%S")
 
         # Create user directory if it doesn't exist
         self.user_dir = Path(self.log_directory) / username
         self.user_dir.mkdir(parents=True, exist_ok=True)
 
         # Create session log file
-        log_filename = f"session_{self.session_id}.jsonl"
-        self.log_file = self.user_dir / log_filename
+        self.session_id, self.log_file = self._claim_log_file()
 
         # Initialize conversation history
         self.conversation_history = []
+        self._token_counts = []
+        self._log_offset = 0
+        self._message_index = []
 
         # Log session start
         self._write_log_entry({
@@ -49,13 +89,37 @@ class SessionManager:
             "timestamp": self.session_start.isoformat(),
             "username": username,
             "session_id": self.session_id,
-            "custom_instructions": custom_instructions
+            "custom_instructions": custom_instructions,
+            "mode": mode
         })
+        self.catalog.start_session(username, self.session_id, self.session_start.isoformat(), mode)
 
         return str(self.log_file)
 
-    def add_message(self, role: str, content: str) -> None:
-        """Add a message to the conversation history"""
+    def _claim_log_file(self) -> Tuple[str, Path]:
+        """Pick a new session id and create its log file
+
+        Ids are the start time plus a random suffix (20250124_143022_9f2c1a).
+        The log file is created exclusively, so even sessions of one user
+        started in the same second by different processes never share a
+        file: the session that creates it is its only writer.
+        """
+        while True:
+            session_id = f"{self.session_start:%Y%m%d_%H%M%S}_{secrets.token_hex(3)}"
+            log_file = self.user_dir / f"session_{session_id}.jsonl"
+            try:
+                with open(log_file, 'x'):
+                    pass
+            except FileExistsError:
+                continue
+            return session_id, log_file
+
+    def add_message(self, role: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Add a message to the conversation history
+
+        Optional metadata (e.g. generation statistics) is written to the log
+        entry only; it is not part of the history sent to the model.
+        """
         if self.session_id is None:
             raise RuntimeError("No active session. Call start_session() first.")
 
@@ -67,26 +131,134 @@ class SessionManager:
 
         # Add to in-memory history
         self.conversation_history.append(message)
+        self._token_counts.append(self._count_tokens(content))
 
         # Log to file
-        self._write_log_entry({
+        entry = {
             "type": "message",
             "timestamp": timestamp.isoformat(),
             "role": role,
             "content": content
-        })
+        }
+        if metadata:
+            entry["generation"] = metadata
+        offset, length = self._write_log_entry(entry)
+        self._message_index.append((role, entry["timestamp"], offset, length))
 
         # Trim history if needed
+        self._trim_history()
+
+    def set_mode(self, mode: Optional[str]) -> None:
+        """Record a mode switch (e.g. "academic" or "nuno-writing-style:proofread")"""
+        if self.session_id is None or mode == self.mode:
+            return
+        self.mode = mode
+        self._write_log_entry({
+            "type": "mode",
+            "timestamp": datetime.now().isoformat(),
+            "mode": mode
+        })
+        self.catalog.set_mode(self.username, self.session_id, mode)
+
+    def set_token_budget(self, token_counter: Callable[[str], int], system_prompt: str) -> None:
+        """Trim history by tokens, counted with the loaded tokenizer
+
+        The prompt sent to the model is kept within session.max_context_tokens:
+        the system prompt is always kept, session.reserve_tokens (default
+        model.max_length) are left free for the response, and the oldest
+        messages are dropped first. Call again whenever the system prompt
+        changes. Each message is tokenized once; its count is cached.
+        """
+        self.token_counter = token_counter
+        self.system_prompt_tokens = token_counter(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        self._token_counts = [self._count_tokens(m['content']) for m in self.conversation_history]
+        self._trim_history()
+
+    def get_history_tokens(self) -> int:
+        """Return the estimated prompt tokens of the system prompt and history"""
+        return self.system_prompt_tokens + sum(self._token_counts)
+
+    def _count_tokens(self, content: str) -> int:
+        if self.token_counter is None:
+            return 0
+        return self.token_counter(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def _token_budget(self) -> Optional[int]:
+        """Tokens available for the history, or None without a token counter"""
+        if self.token_counter is None:
+            return None
+        max_context = self.session_config.get('max_context_tokens', 32768)
+        reserve = self.session_config.get('reserve_tokens') or self.config['model']['max_length']
+        return max_context - reserve - self.system_prompt_tokens
+
+    def _drop_oldest(self) -> None:
+        self.conversation_history.pop(0)
+        self._token_counts.pop(0)
+
+    def _trim_history(self) -> None:
+        """Drop the oldest messages beyond max_history or the token budget"""
         max_history = self.session_config.get('max_history', 50)
-        if len(self.conversation_history) > max_history:
-            self.conversation_history = self.conversation_history[-max_history:]
+        while len(self.conversation_history) > max_history:
+            self._drop_oldest()
+
+        budget = self._token_budget()
+        if budget is not None:
+            # The newest message is always kept, even if it alone exceeds the budget
+            total = sum(self._token_counts)
+            while len(self.conversation_history) > 1 and total > budget:
+                total -= self._token_counts[0]
+                self._drop_oldest()
+
+        # Don't open the history with a reply whose question was dropped
+        while len(self.conversation_history) > 1 and self.conversation_history[0]['role'] == 'assistant':
+            self._drop_oldest()
+
+    def compact_history(self, messages: List[Dict[str, str]], summary: str,
+                        metadata: Optional[Dict[str, Any]] = None) -> bool:
+        """Replace the oldest messages with a summary message
+
+        messages must still be the start of the history (it is not applied
+        if the history was cleared or trimmed meanwhile). The replaced
+        messages stay in the log; a compaction entry records the summary.
+        """
+        count = len(messages)
+        history = self.conversation_history
+        if count == 0 or len(history) < count or any(a is not b for a, b in zip(history, messages)):
+            return False
+
+        summary_message = {"role": "system", "content": summary}
+        self.conversation_history = [summary_message] + history[count:]
+        self._token_counts = [self._count_tokens(summary)] + self._token_counts[count:]
+
+        entry = {
+            "type": "compaction",
+            "timestamp": datetime.now().isoformat(),
+            "summarized_messages": count,
+            "summary": summary
+        }
+        if metadata:
+            entry["generation"] = metadata
+        self._write_log_entry(entry)
+        return True
+
+    def clear_history(self) -> int:
+        """Clear the in-memory conversation history and return how many messages were dropped"""
+        cleared = len(self.conversation_history)
+        self.conversation_history = []
+        self._token_counts = []
+        return cleared
 
     def get_conversation_history(self) -> List[Dict[str, str]]:
         """Get the current conversation history"""
         return self.conversation_history.copy()
 
     def end_session(self) -> None:
-        """End the current session"""
+        """End the current session
+
+        Flushing the log, cataloguing the session and writing its summary
+        happen in a background thread, so this returns immediately. The
+        thread is not a daemon: the process finishes it before exiting.
+        """
         if self.session_id is None:
             return
 
@@ -101,73 +273,222 @@ class SessionManager:
             "messages_count": len(self.conversation_history)
         })
 
-        # Create summary file
-        self._create_session_summary()
+        finalizer = threading.Thread(
+            target=self._finalize_session,
+            args=(self.username, self.session_id, self.log_file, session_end.isoformat(),
+                  self._message_index, self._log_offset),
+            name=f"finalize-{self.session_id}"
+        )
+        finalizer.start()
+        self._finalizers = [t for t in self._finalizers if t.is_alive()] + [finalizer]
 
         # Reset session
         self.session_id = None
         self.conversation_history = []
-
-    def _write_log_entry(self, entry: Dict[str, Any]) -> None:
-        """Write a log entry to the session file"""
-        if self.log_file is None:
-            return
-
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-
-    def _create_session_summary(self) -> None:
-        """Create a human-readable summary of the session"""
+        self._token_counts = []
+        self._message_index = []
+
+    def wait_for_finalize(self) -> None:
+        """Wait until ended sessions are flushed, catalogued and summarized"""
+        for finalizer in self._finalizers:
+            finalizer.join()
+        self._finalizers = []
+
+    def _finalize_session(self, username: str, session_id: str, log_file: Path, ended_at: str,
+                          message_index: List[tuple], log_size: int) -> None:
+        self.log_writer.flush(log_file, sync=True)
+        self.catalog.end_session(username, session_id, ended_at, message_index, log_size)
+        self.write_summary_file(username, session_id)
+
+    def _write_log_entry(self, entry: Dict[str, Any]) -> tuple:
+        """Queue a log entry for the session file and return its (offset, length) in bytes"""
         if self.log_file is None:
-            return
-
-        summary_file = self.log_file.with_suffix('.txt')
-
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            f.write(f"Writing Assistant Session Summary\n")
-            f.write(f"=" * 50 + "\n\n")
-            f.write(f"Username: {self.username}\n")
-            f.write(f"Session ID: {self.session_id}\n")
-            f.write(f"Start Time: {self.session_start.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Messages: {len(self.conversation_history)}\n")
-            f.write(f"\n" + "=" * 50 + "\n\n")
+            return 0, 0
 
-            # Write conversation
-            for msg in self.conversation_history:
-                role = msg['role'].upper()
-                content = msg['content']
-                f.write(f"{role}:\n{content}\n\n")
-                f.write("-" * 50 + "\n\n")
+        offset = self._log_offset
+        length = self.log_writer.write(self.log_file, entry)
+        self._log_offset += length
+        return offset, length
 
     def list_user_sessions(self, username: str) -> List[str]:
         """List all sessions for a user"""
-        user_dir = Path(self.log_directory) / username
-        if not user_dir.exists():
-            return []
+        return [f"session_{s['session_id']}" for s in self.find_sessions(username)]
 
-        sessions = []
-        for log_file in user_dir.glob("session_*.jsonl"):
-            sessions.append(log_file.stem)
+    def find_sessions(self, username: str, **filters) -> List[Dict[str, Any]]:
+        """Return catalog rows of a user's sessions (see SessionCatalog.find_sessions for filters)"""
+        self.catalog.sync_user(username)
+        return self.catalog.find_sessions(username, **filters)
 
-        return sorted(sessions, reverse=True)
+    def load_session_history(self, username: str, session_id: str, start: int = 0,
+                             count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Load conversation history from a previous session
 
-    def load_session_history(self, username: str, session_id: str) -> List[Dict[str, Any]]:
-        """Load conversation history from a previous session"""
-        user_dir = Path(self.log_directory) / username
-        log_file = user_dir / f"session_{session_id}.jsonl"
+        start and count select a range of messages (a negative start counts
+        from the end). For ended sessions only the selected messages are
+        read, using the offsets in the session catalog. Archived sessions
+        are read from their compressed segment.
+        """
+        log = self.catalog.open_log(username, session_id)
 
-        if not log_file.exists():
-            raise FileNotFoundError(f"Session file not found: {log_file}")
+        self.catalog.sync_user(username)
+        offsets = self.catalog.message_offsets(username, session_id, start, count)
 
         messages = []
-        with open(log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                entry = json.loads(line)
-                if entry.get('type') == 'message':
-                    messages.append({
-                        'role': entry['role'],
-                        'content': entry['content'],
-                        'timestamp': entry['timestamp']
-                    })
+        with log as f:
+            if offsets is not None:
+                entries = []
+                for offset, length in offsets:
+                    f.seek(offset)
+                    entries.append(json.loads(f.read(length)))
+            else:
+                # Open or unindexed session: read the whole log
+                entries = [e for e in (json.loads(line) for line in f) if e.get('type') == 'message']
+                # Same range as message_offsets(): a negative start is clamped to the first message
+                if start < 0:
+                    start = max(len(entries) + start, 0)
+                entries = entries[start:] if count is None else entries[start:start + count]
+
+            for entry in entries:
+                messages.append({
+                    'role': entry['role'],
+                    'content': entry['content'],
+                    'timestamp': entry['timestamp']
+                })
 
         return messages
+
+    def iter_log_entries(self, username: str, session_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield the entries of a session log one at a time, from its file or the archive"""
+        with self.catalog.open_log(username, session_id) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+
+    def write_summary(self, username: str, session_id: str, out: TextIO) -> None:
+        """Write the human-readable summary of a session, rendered from its log"""
+        start = None
+        message_count = 0
+        for entry in self.iter_log_entries(username, session_id):
+            if entry.get('type') == 'session_start':
+                start = datetime.fromisoformat(entry['timestamp'])
+            elif entry.get('type') == 'message':
+                message_count += 1
+
+        out.write(f"Writing Assistant Session Summary\n")
+        out.write(f"=" * 50 + "\n\n")
+        out.write(f"Username: {username}\n")
+        out.write(f"Session ID: {session_id}\n")
+        if start is not None:
+            out.write(f"Start Time: {start.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        out.write(f"Messages: {message_count}\n")
+        out.write(f"\n" + "=" * 50 + "\n\n")
+
+        # Second pass: stream the conversation without holding it in memory
+        for entry in self.iter_log_entries(username, session_id):
+            if entry.get('type') == 'message':
+                out.write(f"{entry['role'].upper()}:\n{entry['content']}\n\n")
+                out.write("-" * 50 + "\n\n")
+
+    def write_summary_file(self, username: str, session_id: str) -> Path:
+        """(Re)write the .txt summary next to a session log, streaming from the log"""
+        summary_file = self.catalog.log_file(username, session_id).with_suffix('.txt')
+        tmp_file = summary_file.with_name(f".{summary_file.name}.tmp{os.getpid()}.{threading.get_ident()}")
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                self.write_summary(username, session_id, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, summary_file)
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
+        return summary_file
+
+    def find_summary_jobs(self, username: Optional[str] = None, missing_only: bool = False) -> List[tuple]:
+        """Return (username, session_id) of sessions whose .txt summary should be rebuilt
+
+        With missing_only, sessions whose summary exists and is newer than
+        the log are skipped. Archived sessions have no stored summary and are
+        not included.
+        """
+        user_dirs = [Path(self.log_directory) / username] if username else \
+            [p for p in Path(self.log_directory).iterdir() if p.is_dir() and not p.name.startswith('.')]
+
+        jobs = []
+        for user_dir in user_dirs:
+            for log_file in user_dir.glob("session_*.jsonl"):
+                summary_file = log_file.with_suffix('.txt')
+                if missing_only and summary_file.exists() and \
+                        summary_file.stat().st_mtime >= log_file.stat().st_mtime:
+                    continue
+                jobs.append((user_dir.name, log_file.stem[len('session_'):]))
+        return jobs
+
+    def rebuild_summaries(self, jobs: List[tuple], workers: Optional[int] = None,
+                          on_progress: Optional[Callable[[int], None]] = None) -> int:
+        """Rewrite the .txt summaries of (username, session_id) jobs in parallel worker processes"""
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        if not jobs:
+            return 0
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_summary_worker,
+                                 initargs=(self.config_path,)) as pool:
+            futures = [pool.submit(_summary_worker, user, session_id) for user, session_id in jobs]
+            for future in as_completed(futures):
+                future.result()
+                if on_progress:
+                    on_progress(1)
+        return len(jobs)
+
+    def archive_sessions(self, older_than_days: int = 30, username: Optional[str] = None,
+                         keep_summaries: bool = False) -> Dict[str, int]:
+        """Move finished sessions that ended more than older_than_days ago into compressed archives
+
+        The .jsonl log is removed once it is in the archive, and the .txt
+        summary too unless keep_summaries is set (write_summary() renders it
+        again from the archive). Returns session and byte counts.
+        """
+        if username is None:
+            self.catalog.sync_all()
+        else:
+            self.catalog.sync_user(username)
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        stats = {'sessions': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+        for session in self.catalog.finished_sessions(cutoff, username):
+            log_file = self.catalog.log_file(session['username'], session['session_id'])
+            if not log_file.exists():
+                continue
+            summary_file = log_file.with_suffix('.txt')
+
+            stats['bytes_before'] += log_file.stat().st_size
+            stats['bytes_after'] += self.catalog.archive.add_session(
+                session['username'], session['session_id'], log_file
+            )
+            if summary_file.exists():
+                if keep_summaries:
+                    stats['bytes_after'] += summary_file.stat().st_size
+                else:
+                    stats['bytes_before'] += summary_file.stat().st_size
+                    summary_file.unlink()
+            log_file.unlink()
+            stats['sessions'] += 1
+
+        return stats
+
+
+# One SessionManager per rebuild_summaries() worker process
+_worker_manager: Optional[SessionManager] = None
+
+
+def _init_summary_worker(config_path: str) -> None:
+    global _worker_manager
+    _worker_manager = SessionManager(config_path)
+
+
+def _summary_worker(username: str, session_id: str) -> None:
+    _worker_manager.write_summary_file(username, session_id)
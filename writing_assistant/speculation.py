@@ -0,0 +1,111 @@
+"""Speculative decoding: when to use prompt lookup or the draft model, and acceptance statistics"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+def use_prompt_lookup(lookup_config: Optional[Dict[str, Any]], mode: Optional[str],
+                      count_input_tokens: Callable[[], int]) -> bool:
+    """Decide whether a reply in a mode ("mode" or "mode:submode") uses prompt lookup
+
+    Modes in lookup_config['modes'] always use it; modes in
+    'long_input_modes' only when the user's message has at least
+    'min_input_tokens' tokens (counted only then).
+    """
+    if not lookup_config or not lookup_config.get('enabled', True) or not mode:
+        return False
+    if mode in lookup_config.get('modes', []):
+        return True
+    if mode in lookup_config.get('long_input_modes', []):
+        return count_input_tokens() >= lookup_config.get('min_input_tokens', 300)
+    return False
+
+
+class DraftFallback:
+    """Decide when to stop using a draft model whose tokens keep being rejected
+
+    Every drafted token costs a forward pass of the draft model, so a draft
+    that is rarely accepted makes decoding slower than without it. The
+    draft is dropped once patience replies in a row have an acceptance rate
+    below min_acceptance.
+    """
+
+    def __init__(self, min_acceptance: float, patience: int = 3):
+        """Initialize with the acceptance threshold and the number of low replies tolerated"""
+        self.min_acceptance = min_acceptance
+        self.patience = patience
+        self.low_replies = 0
+
+    def record(self, acceptance_rate: Optional[float]) -> bool:
+        """Record a reply's acceptance rate; return True when the draft model should be dropped"""
+        if acceptance_rate is None:
+            return False
+        self.low_replies = self.low_replies + 1 if acceptance_rate < self.min_acceptance else 0
+        return self.low_replies >= self.patience
+
+
+class SpeculationMonitor:
+    """Count drafted and accepted tokens of an assisted generate call
+
+    In assisted decoding the main model verifies the drafted candidates in one
+    forward pass per step, asking for the logits of the candidates plus one
+    (``logits_to_keep``). Each step yields the accepted candidates plus one
+    token of its own, so the accepted count follows from the number of steps
+    and new tokens. Hooks on the main model record every step and its time::
+
+        with SpeculationMonitor(model) as monitor:
+            outputs = model.generate(..., assistant_model=draft_model)
+        stats = monitor.stats(new_tokens, elapsed)
+    """
+
+    def __init__(self, model):
+        """Initialize for the main (verifying) model"""
+        self.model = model
+        self.drafted: List[Optional[int]] = []
+        self.durations: List[float] = []
+        self._started: Optional[float] = None
+        self._handles = []
+
+    def __enter__(self) -> 'SpeculationMonitor':
+        self._handles = [
+            self.model.register_forward_pre_hook(self._before_step, with_kwargs=True),
+            self.model.register_forward_hook(self._after_step),
+        ]
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    def _before_step(self, module, args, kwargs) -> None:
+        logits_to_keep = kwargs.get('logits_to_keep')
+        self.drafted.append(logits_to_keep - 1 if isinstance(logits_to_keep, int) else None)
+        self._started = time.perf_counter()
+
+    def _after_step(self, module, args, output) -> None:
+        self.durations.append(time.perf_counter() - self._started)
+
+    def stats(self, new_tokens: int, total_time: float) -> Dict[str, Any]:
+        """Return the acceptance rate and estimated speedup of the call
+
+        The speedup compares total_time with an estimate of plain decoding:
+        the first step (the prefill) plus new_tokens steps as fast as the
+        fastest verification step seen.
+        """
+        steps = len(self.durations)
+        if steps == 0 or None in self.drafted:
+            return {}
+
+        drafted = sum(self.drafted)
+        accepted = max(new_tokens - steps, 0)
+        stats = {
+            'draft_tokens': drafted,
+            'accepted_tokens': accepted,
+            'acceptance_rate': round(accepted / drafted, 3) if drafted else 0.0,
+            'tokens_per_step': round(new_tokens / steps, 2),
+        }
+        if steps > 1 and total_time > 0:
+            plain_time = self.durations[0] + new_tokens * min(self.durations[1:])
+            stats['speedup'] = round(plain_time / total_time, 2)
+        return stats
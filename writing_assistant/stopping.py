@@ -0,0 +1,165 @@
+"""Stopping criteria that remember why they stopped generation
+
+The content criteria (stop strings, repetition, per-row budgets) decide for
+each row of a batch on its own, so one runaway sequence of a batched
+generate call is stopped without ending the others.
+"""
+
+import threading
+import time
+from typing import List, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+
+class RowCriteria(StoppingCriteria):
+    """A stopping criterion evaluated per row; rows stay stopped once they match
+
+    stopped_at[row] is the sequence length (prompt included) at which the
+    row stopped, or None.
+    """
+
+    reason = ''
+
+    def __init__(self):
+        """Initialize with no rows stopped"""
+        self.stopped_at: List[Optional[int]] = []
+
+    @property
+    def triggered(self) -> bool:
+        """Whether any row was stopped by this criterion"""
+        return any(length is not None for length in self.stopped_at)
+
+    def _stops(self, row: int, input_ids: torch.LongTensor) -> bool:
+        raise NotImplementedError
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        if len(self.stopped_at) != input_ids.shape[0]:
+            self.stopped_at = [None] * input_ids.shape[0]
+        for row in range(input_ids.shape[0]):
+            if self.stopped_at[row] is None and self._stops(row, input_ids):
+                self.stopped_at[row] = input_ids.shape[1]
+        stopped = [length is not None for length in self.stopped_at]
+        return torch.tensor(stopped, dtype=torch.bool, device=input_ids.device)
+
+
+class StopOnStrings(RowCriteria):
+    """Stop once the generated text contains one of the stop strings
+
+    Only the last few tokens are decoded at each step, enough to hold the
+    longest stop string plus the tokens a speculative step can add at once.
+    """
+
+    reason = 'stop_string'
+
+    def __init__(self, tokenizer, stop_strings: List[str], prompt_length: int):
+        """Initialize for a prompt of prompt_length tokens (the padded width in a batch)"""
+        super().__init__()
+        self.tokenizer = tokenizer
+        self.stop_strings = stop_strings
+        self.prompt_length = prompt_length
+        longest = max(len(tokenizer(s, add_special_tokens=False)['input_ids']) for s in stop_strings)
+        self.lookback = longest + 16
+        self.matches: List[Optional[str]] = []
+
+    @property
+    def matched(self) -> Optional[str]:
+        """The stop string matched by the first stopped row"""
+        return next((m for m in self.matches if m is not None), None)
+
+    def _stops(self, row: int, input_ids: torch.LongTensor) -> bool:
+        if len(self.matches) != input_ids.shape[0]:
+            self.matches = [None] * input_ids.shape[0]
+        start = max(self.prompt_length, input_ids.shape[1] - self.lookback)
+        tail = self.tokenizer.decode(input_ids[row, start:], skip_special_tokens=True)
+        for stop_string in self.stop_strings:
+            if stop_string in tail:
+                self.matches[row] = stop_string
+                return True
+        return False
+
+
+class StopOnRepetition(RowCriteria):
+    """Stop when the output ends in the same n-gram repeated over and over
+
+    A run counts as repetition when an n-gram of up to max_ngram tokens is
+    repeated at least min_repeats times back to back and the run spans at
+    least min_tokens tokens (so "----" or a short list stays legal).
+    """
+
+    reason = 'repetition'
+
+    def __init__(self, prompt_length: int, max_ngram: int = 32, min_repeats: int = 3, min_tokens: int = 48):
+        """Initialize for a prompt of prompt_length tokens (the padded width in a batch)"""
+        super().__init__()
+        self.prompt_length = prompt_length
+        self.max_ngram = max_ngram
+        self.min_repeats = min_repeats
+        self.min_tokens = min_tokens
+
+    def _repeating(self, tokens: List[int]) -> bool:
+        for n in range(1, self.max_ngram + 1):
+            repeats = max(self.min_repeats, -(-self.min_tokens // n))
+            span = n * repeats
+            if span > len(tokens):
+                continue
+            window = tokens[-span:]
+            if window == window[-n:] * repeats:
+                return True
+        return False
+
+    def _stops(self, row: int, input_ids: torch.LongTensor) -> bool:
+        longest = self.max_ngram * max(self.min_repeats, -(-self.min_tokens // self.max_ngram))
+        window = max(longest, self.min_tokens)
+        start = max(self.prompt_length, input_ids.shape[1] - window)
+        return self._repeating(input_ids[row, start:].tolist())
+
+
+class StopAtBudget(RowCriteria):
+    """Stop each row of a batch after its own number of new tokens"""
+
+    reason = 'max_new_tokens'
+
+    def __init__(self, prompt_length: int, budgets: List[int]):
+        """Initialize for a batch padded to prompt_length with one budget per row"""
+        super().__init__()
+        self.prompt_length = prompt_length
+        self.budgets = budgets
+
+    def _stops(self, row: int, input_ids: torch.LongTensor) -> bool:
+        return input_ids.shape[1] - self.prompt_length >= self.budgets[row]
+
+
+class StopOnEvent(StoppingCriteria):
+    """Stop once a threading.Event is set, e.g. by Ctrl-C in the CLI"""
+
+    reason = 'cancelled'
+
+    def __init__(self, event: threading.Event):
+        """Initialize for the event that cancels generation"""
+        self.event = event
+        self.triggered = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        self.triggered = self.event.is_set()
+        return torch.full((input_ids.shape[0],), self.triggered, dtype=torch.bool, device=input_ids.device)
+
+
+class StopOnTimeout(StoppingCriteria):
+    """Stop once max_time seconds have passed since the criterion was created
+
+    Checked after every decoding step: the prefill and the step running when
+    time is up are not interrupted.
+    """
+
+    reason = 'timeout'
+
+    def __init__(self, max_time: float):
+        """Initialize and start the clock"""
+        self.deadline = time.monotonic() + max_time
+        self.triggered = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        self.triggered = time.monotonic() >= self.deadline
+        return torch.full((input_ids.shape[0],), self.triggered, dtype=torch.bool, device=input_ids.device)